@@ -1,11 +1,47 @@
 import streamlit as st
-import time
-import pandas as pd
-import numpy as np
-import altair as alt
-from PIL import Image, ImageDraw
-import io
+import streamlit.components.v1 as components
 import base64
+import json
+import os
+import threading
+
+import instrumentation
+from batch_render import (
+    frame_job,
+    job_labels,
+    morph_pulse_index,
+    prefetch_frames,
+    render_batch,
+    sequence_jobs,
+)
+from beating import frame_pulse, frame_synchrony
+from cell_data import CELL_DATA_VERSION, DEFAULT_CELL_DATA, cell_data
+from frame_cache import FrameCache
+from frame_store import open_frame_cache
+from population import POPULATION_SIZES, build_population_scene
+from renderer import (
+    DEFAULT_SEED,
+    EXPORT_FORMATS,
+    FRAME_CODEC,
+    FRAME_CODEC_DEFAULTS,
+    FRAME_CODECS,
+    MAX_SEED,
+    OUTPUT_SIZES,
+    PULSE_FRAMES,
+    RENDER_BACKEND,
+    RENDER_BACKEND_LABELS,
+    RENDER_BACKENDS,
+    SCENE_HEIGHT,
+    SCENE_WIDTH,
+    STATIC_PULSE_INDEX,
+    ZOOM_LEVELS,
+    build_scene,
+    encode_animation,
+    encode_frame,
+    render_scene,
+    render_view,
+)
+from timeline import MORPH_FRAMES, Timeline, next_day
 
 st.set_page_config(page_title="Cardiac Cell Development Animation", layout="wide")
 
@@ -13,129 +49,484 @@ st.set_page_config(page_title="Cardiac Cell Development Animation", layout="wide
 st.title("Cardiac Cell Development Animation (Day 1-8) by Abu Sufian")
 st.markdown("This visualization shows the morphological and functional changes in cardiac cells over an 8-day period.")
 
-# Cell data for each day
-cell_data = {
-    1: {
-        "title": "Day 1: Immature Stage",
-        "shape": "Small, round, loosely attached cells",
-        "density": "Sparse distribution, minimal cell-cell interaction",
-        "nucleus": "Large, prominent, occupying most of the cytoplasm",
-        "cytoplasm": "Low actin filament density, no organized sarcomeres",
-        "contractility": "Very weak or absent, minimal spontaneous twitching",
-        "noise": "Low",
-        "functional_state": "Highly immature, incapable of coordinated beating",
-        "color": (255, 214, 204),  # Light pinkish
-        "beat": 0.2,  # Very weak beat
-        "sync_level": 0.1,  # Almost no synchronization
-        "cell_count": 8,  # Fewer cells
-        "debris_level": 0.1,  # Minimal debris
-    },
-    2: {
-        "title": "Day 2: Initial Beating",
-        "shape": "Slight elongation, cells begin forming small clusters",
-        "density": "Moderate increase in cell-cell interaction",
-        "nucleus": "Still prominent, but relative cytoplasmic volume increasing",
-        "cytoplasm": "More structured, actin filaments start forming",
-        "contractility": "Few healthy cells start mild beating, but not synchronized",
-        "noise": "Low",
-        "functional_state": "Early contractions observed, but weak and inconsistent",
-        "color": (255, 204, 204),  # Light pink
-        "beat": 0.4,  # Weak beat
-        "sync_level": 0.2,  # Little synchronization
-        "cell_count": 12,  # More cells
-        "debris_level": 0.1,  # Minimal debris
-    },
-    3: {
-        "title": "Day 3: Sparse Mean Beating Begins",
-        "shape": "Cells elongate, slight alignment observed",
-        "density": "Increased junction formation, more intercellular connectivity",
-        "nucleus": "Starting to appear smaller relative to expanding cytoplasm",
-        "cytoplasm": "Early sarcomere structures begin forming, weak striations visible",
-        "contractility": "Few healthy cells begin to show mean beating, still uncoordinated",
-        "noise": "Low",
-        "functional_state": "Patchy contractions, but improved over Day 2",
-        "color": (255, 204, 204),  # Light pink
-        "beat": 0.5,  # Stronger beat
-        "sync_level": 0.3,  # More synchronization
-        "cell_count": 16,  # More cells forming
-        "debris_level": 0.2,  # Slight increase in debris
-    },
-    4: {
-        "title": "Day 4: Stronger Contractions in Some Cells",
-        "shape": "More defined, elongated, and better aligned cells",
-        "density": "High, beginning of monolayer-like structures",
-        "nucleus": "Evenly distributed, organized within the cell",
-        "cytoplasm": "Denser filaments, early Z-line structures",
-        "contractility": "More healthy cells with mean beating, improved rhythmicity",
-        "noise": "Low",
-        "functional_state": "Early functional cardiomyocyte-like properties emerge",
-        "color": (255, 153, 153),  # Medium pink
-        "beat": 0.7,  # Medium-strong beat
-        "sync_level": 0.5,  # Half synchronized
-        "cell_count": 20,  # Higher density
-        "debris_level": 0.2,  # Still low debris
-    },
-    5: {
-        "title": "Day 5: Moderate Synchronization in Beating",
-        "shape": "Well-elongated, aligned along parallel lines",
-        "density": "High, forming strong intercellular junctions",
-        "nucleus": "Less prominent, as cytoplasm grows in volume",
-        "cytoplasm": "Well-formed sarcomeres with clear striations",
-        "contractility": "Moderate contraction force, clear mean beating pattern",
-        "noise": "Moderate",
-        "functional_state": "Stronger contractions, beginning of synchronized function",
-        "color": (255, 102, 102),  # Stronger pink
-        "beat": 0.8,  # Strong beat
-        "sync_level": 0.7,  # Good synchronization
-        "cell_count": 24,  # High density
-        "debris_level": 0.3,  # Moderate debris
-    },
-    6: {
-        "title": "Day 6: Peak Contraction Activity",
-        "shape": "Fully elongated, clear cardiomyocyte morphology",
-        "density": "Strongly connected monolayer, peak cell-to-cell adhesion",
-        "nucleus": "Evenly spread, well-integrated",
-        "cytoplasm": "Densely packed sarcomeres, clear actin-myosin interactions",
-        "contractility": "High contraction intensity, peak synchronization in mean beating",
-        "noise": "Slightly increasing due to metabolic stress",
-        "functional_state": "Highest functionality, optimal contraction rhythm",
-        "color": (255, 51, 51),  # Bright red
-        "beat": 1.0,  # Maximum beat
-        "sync_level": 0.9,  # Highly synchronized
-        "cell_count": 28,  # Maximum density
-        "debris_level": 0.4,  # Increasing debris
-    },
-    7: {
-        "title": "Day 7: Damage & Fragmentation Begins",
-        "shape": "Fragmentation starts, some cells detach",
-        "density": "Decreasing due to stress-induced detachment",
-        "nucleus": "Some nuclei appear condensed or fragmented",
-        "cytoplasm": "Signs of actin filament disassembly, disrupted sarcomeres",
-        "contractility": "Weaker contractions, loss of synchronization, some dead zones",
-        "noise": "High, increased debris from cell detachment",
-        "functional_state": "Declining function, early damage evident",
-        "color": (204, 51, 51),  # Darker red
-        "beat": 0.6,  # Weakening beat
-        "sync_level": 0.5,  # Losing synchronization
-        "cell_count": 20,  # Decreasing density
-        "debris_level": 0.7,  # High debris
-    },
-    8: {
-        "title": "Day 8: Significant Cell Damage",
-        "shape": "High fragmentation, cell integrity severely compromised",
-        "density": "Significant cell loss, visible gaps in the network",
-        "nucleus": "Some remain intact, others fragmented or missing",
-        "cytoplasm": "Loss of sarcomere organization, widespread cellular breakdown",
-        "contractility": "Very weak or absent, most cells cease contracting",
-        "noise": "Extremely high, cell fragments and debris dominate the field",
-        "functional_state": "Experiment ends as contraction ceases and cells deteriorate",
-        "color": (153, 51, 51),  # Brownish red
-        "beat": 0.2,  # Very weak beat
-        "sync_level": 0.2,  # Almost no synchronization
-        "cell_count": 12,  # Few remaining cells
-        "debris_level": 0.9,  # Maximum debris
-    }
+# Scenes are sampled once per (day, seed) and shared by every session; the
+# seed is user-controlled, so only the most recent ones are kept. Each holds
+# its rasterized static layers, up to renderer.SCENE_CACHE_MB.
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_culture_scene(day_num, seed=DEFAULT_SEED):
+    return build_scene(day_num, seed)
+
+
+# Tissue-scale populations take tens of megabytes each, so fewer are kept
+@st.cache_resource(show_spinner="Sampling cells...", max_entries=8)
+def get_population_scene(day_num, cells, seed=DEFAULT_SEED):
+    return build_population_scene(day_num, cells, seed)
+
+
+# The day's culture, or a population of `cells` cells
+def get_scene(day_num, seed=DEFAULT_SEED, cells=None):
+    if cells is None:
+        return get_culture_scene(day_num, seed)
+    return get_population_scene(day_num, cells, seed)
+
+
+# Morphs between consecutive days of a culture or population; the diff of
+# each pair of days is worked out once and shared by every session
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_timeline(seed=DEFAULT_SEED, cells=None):
+    return Timeline(lambda day_num: get_scene(day_num, seed, cells), seed)
+
+
+# Scene of a day, or of intermediate step `morph` of its morph into the next day
+def get_frame_scene(day_num, seed=DEFAULT_SEED, cells=None, morph=None):
+    if morph is None:
+        return get_scene(day_num, seed, cells)
+    return get_timeline(seed, cells).frame_scene(day_num, morph)
+
+
+# Generate a cell animation frame with realistic morphology, each cell
+# contracted according to its beating phase at the given pulse frame
+def generate_cell_frame(day_num, pulse_index, seed=DEFAULT_SEED, backend=RENDER_BACKEND,
+                        size=(SCENE_WIDTH, SCENE_HEIGHT), cells=None, morph=None):
+    scene = get_frame_scene(day_num, seed, cells, morph)
+    return render_scene(scene, frame_pulse(scene, pulse_index), backend, *size)
+
+
+# Largest size picked automatically for display; bigger ones are for export
+MAX_AUTO_WIDTH = 1600
+
+
+# Width of the page's main column in device pixels, measured in the browser
+# (viewport_component/index.html); None until the browser has reported it
+client_width = components.declare_component(
+    "client_width", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "viewport_component"))
+
+
+# Frame size that fits the client: the smallest output size at least as wide
+# as its main column, up to MAX_AUTO_WIDTH. Until the browser has reported the
+# width, phones get small frames, by the Sec-CH-UA-Mobile hint browsers send
+# without being asked or a mobile user agent, and everyone else the design size.
+def pick_output_size(width, headers):
+    if width:
+        target = min(width, MAX_AUTO_WIDTH)
+        return next((size for size in OUTPUT_SIZES if size[0] >= target), OUTPUT_SIZES[-1])
+    if headers.get("Sec-CH-UA-Mobile") == "?1" or "Mobi" in (headers.get("User-Agent") or ""):
+        return (480, 360)
+    return (SCENE_WIDTH, SCENE_HEIGHT)
+
+
+def format_size(size):
+    return f"{size[0]}x{size[1]}"
+
+
+# Encoded frames shared by all sessions. With a frame store (frame_store.py)
+# the frames of the default animation live on disk, shared with the other
+# server processes of the host and kept across restarts; other frames, and all
+# of them without a writable store directory, are kept in memory.
+@st.cache_resource(show_spinner=False)
+def get_frame_cache():
+    return open_frame_cache()
+
+
+# Memory budget of the shared cache of zoomed-in tiles, in megabytes
+TILE_CACHE_MB = float(os.environ.get("TILE_CACHE_MB", 128))
+
+
+# Rendered tiles of zoomed views shared by all sessions
+@st.cache_resource(show_spinner=False)
+def get_tile_cache():
+    return FrameCache(int(TILE_CACHE_MB * 1024 * 1024))
+
+
+# Encoded bytes (or the RGB array for "Raw") of one pulse frame, rendered on
+# the first request only. With a view (zoom, center) only the visible part is
+# drawn; its tiles are cached instead of the frame, so panning reuses them.
+def get_frame_data(day_num, pulse_index, seed=DEFAULT_SEED, backend=RENDER_BACKEND,
+                   codec=FRAME_CODEC, setting=None, size=(SCENE_WIDTH, SCENE_HEIGHT), cells=None,
+                   view=None, morph=None):
+    key = frame_job(day_num, pulse_index, seed, size, backend, codec, setting, cells, morph)
+    if view is not None:
+        zoom, center = view
+        with instrumentation.frame(**job_labels(key)):
+            scene = get_frame_scene(day_num, seed, cells, morph)
+            frame = render_view(scene, frame_pulse(scene, pulse_index), backend,
+                                *size, zoom, center, tiles=get_tile_cache(),
+                                tile_key=(day_num, seed, cells, pulse_index, backend, morph))
+            return encode_frame(frame, codec, key.setting)
+
+    def render():
+        with instrumentation.frame(**job_labels(key)):
+            frame = generate_cell_frame(day_num, pulse_index, seed, backend, size, cells, morph)
+            return encode_frame(frame, codec, key.setting)
+
+    return get_frame_cache().get_or_render(key, render)
+
+
+# Held by the running cache warm-up, so warm-ups take the worker pool one at a time
+@st.cache_resource(show_spinner=False)
+def get_warmup_lock():
+    return threading.Lock()
+
+
+def _warm_up(jobs):
+    with get_warmup_lock():
+        prefetch_frames(get_frame_cache(), jobs)
+
+
+# Render the full 8-day cycle with the default seed, renderer and encoding at an
+# output size, in the worker pool, in the background and once per server
+# process, so playback with the defaults finds the frames already cached. Other
+# settings are rendered on demand: warming every seed or codec a session tries
+# would keep all cores busy.
+@st.cache_resource(show_spinner=False)
+def start_cache_warmup(size):
+    jobs = sequence_jobs(sorted(cell_data), DEFAULT_SEED, RENDER_BACKEND, FRAME_CODEC, None, size,
+                         morph=True)
+    thread = threading.Thread(target=_warm_up, args=(jobs,), daemon=True)
+    thread.start()
+    return thread
+
+
+# Show a frame in a placeholder without re-encoding it on the server
+@instrumentation.timed("display")
+def show_frame(placeholder, data, codec=FRAME_CODEC):
+    if isinstance(data, memoryview):
+        # A view into the frame store; st.image only takes bytes
+        data = data.tobytes()
+    if codec == "WebP":
+        # st.image only passes PNG, JPEG and GIF through and would transcode WebP
+        encoded = base64.b64encode(data).decode("ascii")
+        placeholder.markdown(f'<img src="data:image/webp;base64,{encoded}" style="width: 100%;">',
+                             unsafe_allow_html=True)
+    else:
+        # A matching output_format keeps st.image from converting PNG frames to JPEG
+        placeholder.image(data, use_container_width=True,
+                          output_format="JPEG" if codec == "JPEG" else "PNG")
+
+
+# Seconds between refreshes of the render stats panel
+STATS_REFRESH_SECONDS = 2
+
+
+# Stage times of the rendered frames, slowest stages first: one row per stage
+# and label set, with times in milliseconds over the recent frames
+def stage_stats_table(snapshot):
+    import pandas as pd
+
+    rows = [dict(h["labels"], frames=h["count"], total_s=h["sum"], mean_ms=h["mean"] * 1e3,
+                 p95_ms=h["p95"] * 1e3, max_ms=h["max"] * 1e3)
+            for h in snapshot["histograms"] if h["name"] == "render_stage_seconds"]
+    if not rows:
+        return pd.DataFrame()
+    table = pd.DataFrame(rows).sort_values("total_s", ascending=False)
+    labels = [c for c in ("stage", "day", "scene") if c in table]
+    return table[labels + ["frames", "total_s", "mean_ms", "p95_ms", "max_ms"]]
+
+
+# Live view of this server process's render instrumentation, with the raw
+# numbers for download; refreshed on its own without rerunning the app
+@st.fragment(run_every=STATS_REFRESH_SECONDS)
+def render_stats_panel():
+    snapshot = instrumentation.snapshot()
+    frames = [h for h in snapshot["histograms"] if h["name"] == "render_frame_seconds"]
+    count = sum(h["count"] for h in frames)
+    if count:
+        seconds = sum(h["sum"] for h in frames)
+        primitives = sum(h["sum"] for h in snapshot["histograms"]
+                         if h["name"] == "render_frame_primitives")
+        st.caption(f"{count} frames rendered, {seconds / count * 1e3:.1f} ms and "
+                   f"{primitives / count:,.0f} draw primitives per frame")
+    else:
+        st.caption("No frames rendered yet")
+    st.dataframe(stage_stats_table(snapshot), hide_index=True, use_container_width=True,
+                 column_config={c: st.column_config.NumberColumn(format="%.2f")
+                                for c in ("total_s", "mean_ms", "p95_ms", "max_ms")})
+    scol1, scol2, scol3 = st.columns(3)
+    scol1.download_button("JSON", instrumentation.snapshot_json(), "render_stats.json",
+                          "application/json")
+    scol2.download_button("Prometheus", instrumentation.prometheus_text(), "render_stats.prom",
+                          "text/plain")
+    if scol3.button("Reset"):
+        instrumentation.STATS.reset()
+
+
+# Ticks a day's last pulse frame is held for before the next day; a tick is
+# frame_delay/10, so the pause is frame_delay as in browser playback
+DAY_PAUSE_TICKS = 10
+
+
+# What server playback shows on each tick of a day, as (day, pulse_index, morph)
+# frames: the pulse frames, the pause on the last one, then the morph into the
+# next day with `morph`
+def playback_ticks(day_num, morph=False):
+    ticks = [(day_num, pulse_index, None) for pulse_index in range(PULSE_FRAMES)]
+    ticks += [ticks[-1]] * DAY_PAUSE_TICKS
+    if morph and next_day(day_num) is not None:
+        ticks += [(day_num, morph_pulse_index(step), step) for step in range(MORPH_FRAMES)]
+    return ticks
+
+
+def day_title(day_num, cells=None):
+    title = cell_data[day_num]["title"]
+    return title if cells is None else f"{title} ({cells:,} cells)"
+
+
+# Server playback, run as a fragment every frame_delay/10 seconds (see
+# play_on_server). Each run shows one frame and advances the position kept in
+# session state, so a tick reruns only this function and not the whole app.
+# Playback starts over from the selected day whenever that changes.
+def _server_playback(start_day, seed, backend, codec, setting, size, cells, view, morph):
+    state = st.session_state.get("server_playback")
+    if state is None or state["start"] != start_day:
+        state = st.session_state.server_playback = {"start": start_day, "day": start_day, "tick": 0}
+    ticks = playback_ticks(state["day"], morph)
+    if state["tick"] >= len(ticks):
+        state["day"], state["tick"] = next_day(state["day"]) or 1, 0
+        ticks = playback_ticks(state["day"], morph)
+    day_num, pulse_index, step = ticks[state["tick"]]
+    state["tick"] += 1
+
+    st.subheader(day_title(day_num, cells))
+    frame_data = get_frame_data(day_num, pulse_index, seed, backend=backend, codec=codec,
+                                setting=setting, size=size, cells=cells, view=view, morph=step)
+    show_frame(st.empty(), frame_data, codec)
+
+
+def play_on_server(start_day, frame_delay, *args, **kwargs):
+    st.fragment(_server_playback, run_every=frame_delay / 10)(start_day, *args, **kwargs)
+
+
+# Height of the browser-side player, in pixels
+PLAYER_HEIGHT = 680
+
+# Page that plays every day's pre-encoded frames in the browser. All frames are
+# shipped once as data URIs and advanced by a client-side timer, so the server
+# does no work while the animation runs.
+PLAYER_TEMPLATE = """
+<div style="font-family: 'Source Sans Pro', sans-serif; color: rgb(49, 51, 63);">
+  <h3 id="title" style="margin: 0 0 0.5rem 0; font-weight: 600;"></h3>
+  <img id="frame" style="width: 100%; max-height: 600px; object-fit: contain;">
+</div>
+<script>
+const config = __CONFIG__;
+const title = document.getElementById("title");
+const frame = document.getElementById("frame");
+// Decode every frame up front so playback never waits on an image
+config.days.forEach(day => day.frames.forEach(src => { new Image().src = src; }));
+let day = config.startDay - 1;
+let index = 0;
+function tick() {
+  const current = config.days[day];
+  title.textContent = current.title;
+  frame.src = current.frames[index];
+  index += 1;
+  let delay = config.frameMs;
+  // Pause on the day's last pulse frame, before any morph into the next day
+  if (index === current.pulseFrames) {
+    delay += config.dayPauseMs;
+  }
+  if (index === current.frames.length) {
+    index = 0;
+    day = (day + 1) % config.days.length;
+  }
+  setTimeout(tick, delay);
 }
+tick();
+</script>
+"""
+
+
+def build_player_html(start_day, frame_delay, seed=DEFAULT_SEED, backend=RENDER_BACKEND,
+                      codec=FRAME_CODEC, setting=None, size=(SCENE_WIDTH, SCENE_HEIGHT),
+                      cells=None, view=None, morph=True):
+    # Raw arrays cannot be shipped to the browser as they are
+    if FRAME_CODECS[codec][1] is None:
+        codec, setting = "PNG", None
+    mime = FRAME_CODECS[codec][1]
+    # Render whatever is not cached yet in one parallel batch
+    if view is None:
+        prefetch_frames(get_frame_cache(),
+                        sequence_jobs(sorted(cell_data), seed, backend, codec, setting, size, cells,
+                                      morph))
+    days = []
+    for d in sorted(cell_data):
+        # The day's pulse frames, then its morph into the next day
+        steps = [(i, None) for i in range(PULSE_FRAMES)]
+        if morph and next_day(d) is not None:
+            steps += [(morph_pulse_index(k), k) for k in range(MORPH_FRAMES)]
+        frames = [
+            f"data:{mime};base64,"
+            + base64.b64encode(get_frame_data(d, i, seed, backend, codec, setting, size, cells,
+                                              view, k))
+            .decode("ascii")
+            for i, k in steps
+        ]
+        days.append({"title": cell_data[d]["title"], "frames": frames, "pulseFrames": PULSE_FRAMES})
+    config = {
+        "days": days,
+        "startDay": start_day,
+        # Same pacing as server playback: frame_delay/10 per frame, frame_delay between days
+        "frameMs": int(frame_delay * 100),
+        "dayPauseMs": int(frame_delay * 1000),
+    }
+    return PLAYER_TEMPLATE.replace("__CONFIG__", json.dumps(config))
+
+
+# Encode the pulse frames of the given days as one animation, with the same
+# pacing as playback: frame_delay/10 per frame and frame_delay between days,
+# followed by the morph into the next day with `morph`
+@st.cache_data(show_spinner="Encoding animation...", max_entries=16)
+def export_sequence(days, export_format, frame_delay, seed=DEFAULT_SEED, backend=RENDER_BACKEND,
+                    size=(SCENE_WIDTH, SCENE_HEIGHT), cells=None, morph=False):
+    # Frames are rendered in parallel and come back as raw RGB arrays
+    from PIL import Image
+
+    jobs = sequence_jobs(days, seed, backend, "Raw", None, size, cells, morph)
+    frames = [Image.fromarray(data) for data in render_batch(jobs)]
+    durations = []
+    for job in jobs:
+        durations.append(frame_delay * 100)
+        if job.morph is None and job.pulse_index == PULSE_FRAMES - 1:
+            durations[-1] += frame_delay * 1000
+    return encode_animation(frames, durations, export_format)
+
+
+# Day metrics of the Data Visualization tab, as named there, with the scale of
+# their cell_data parameter
+DAY_METRICS = {"Beat Strength": ("beat", 100), "Synchronization": ("sync_level", 100),
+               "Cell Count": ("cell_count", 1), "Debris Level": ("debris_level", 100)}
+# Measured metrics of a dataset shown across its wells
+WELL_METRICS = {"beat_rate": "Beat Rate", "sync_index": "Sync Index",
+                "cell_count": "Cell Count", "debris": "Debris"}
+# Quantiles of the per-well means drawn as the band around their mean
+WELL_BAND = (0.1, 0.9)
+
+
+# Everything below is keyed on the version of the day data rather than
+# recomputed on every rerun; the version changes with the dataset's files.
+# pandas and altair are imported on first use: they take longer to load than
+# the rest of the app, and the Data Visualization tab runs after the first
+# frame has been sent.
+
+# One row per day, one column per metric
+@st.cache_data(show_spinner=False, max_entries=4)
+def day_metrics_frame(data_version):
+    import pandas as pd
+
+    days = sorted(cell_data)
+    frame = {"Day": days}
+    for name, (key, scale) in DAY_METRICS.items():
+        frame[name] = [cell_data[d][key] * scale for d in days]
+    return pd.DataFrame(frame)
+
+
+# The same in long form, one row per day and metric
+@st.cache_data(show_spinner=False, max_entries=4)
+def day_metrics_long(data_version):
+    import pandas as pd
+
+    return pd.melt(day_metrics_frame(data_version), id_vars=["Day"],
+                   var_name="Metric", value_name="Value")
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def day_metrics_chart(data_version, selected):
+    import altair as alt
+
+    df_long = day_metrics_long(data_version)
+    return alt.Chart(df_long[df_long["Metric"].isin(selected)]).mark_line(point=True).encode(
+        x=alt.X("Day:O", title="Day"),
+        y=alt.Y("Value:Q", title="Value"),
+        color=alt.Color("Metric:N", title="Metric"),
+        tooltip=["Day", "Metric", "Value"]
+    ).properties(
+        width=700,
+        height=400,
+        title="Cell Development Metrics Over Time"
+    ).interactive()
+
+
+# Per-day mean of a dataset's measurements and the band of their per-well
+# means, in long form. The dataset is binned by day and well while it is
+# scanned, so only a few rows per day and metric reach the chart however many
+# measurements there are.
+@st.cache_data(show_spinner="Aggregating measurements...", max_entries=4)
+def well_metrics_long(data_version):
+    import pandas as pd
+    from datasets import configured_wells, well_day_means
+
+    wells = well_day_means(os.environ["CELL_DATA_PATH"], cell_data, configured_wells())
+    metrics = [m for m in WELL_METRICS if m in wells]
+    long = pd.melt(wells, id_vars=["day", "well"], value_vars=metrics,
+                   var_name="metric", value_name="value").dropna()
+    by_day = long.groupby(["metric", "day"])["value"]
+    stats = pd.concat([by_day.mean().rename("Mean"), by_day.count().rename("Wells"),
+                       by_day.quantile(WELL_BAND[0]).rename("Low"),
+                       by_day.quantile(WELL_BAND[1]).rename("High")], axis=1).reset_index()
+    stats["Metric"] = stats.pop("metric").map(WELL_METRICS)
+    return stats.rename(columns={"day": "Day"})
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def well_metrics_chart(data_version):
+    import altair as alt
+
+    low, high = (f"{round(q * 100)}th percentile" for q in WELL_BAND)
+    base = alt.Chart().encode(x=alt.X("Day:O", title="Day"))
+    band = base.mark_area(opacity=0.3).encode(
+        y=alt.Y("Low:Q", title="Value"), y2="High:Q",
+        tooltip=["Day", "Wells", alt.Tooltip("Low:Q", title=low),
+                 alt.Tooltip("High:Q", title=high)])
+    line = base.mark_line(point=True).encode(y="Mean:Q", tooltip=["Day", "Wells", "Mean"])
+    return alt.layer(band, line, data=well_metrics_long(data_version)).properties(
+        width=160, height=250
+    ).facet(
+        column=alt.Column("Metric:N", title=None, sort=list(WELL_METRICS.values()))
+    ).resolve_scale(y="independent").properties(
+        title=f"Mean over wells, with the {low} to {high} of the wells"
+    )
+
+
+# Renderer used for the animation frames
+render_backend = st.sidebar.selectbox(
+    "Renderer",
+    list(RENDER_BACKENDS),
+    index=list(RENDER_BACKENDS).index(RENDER_BACKEND),
+    format_func=RENDER_BACKEND_LABELS.get,
+)
+
+# Frame encoding and its compression level / quality
+frame_codec = st.sidebar.selectbox("Frame encoding", list(FRAME_CODECS),
+                                   index=list(FRAME_CODECS).index(FRAME_CODEC))
+if frame_codec == "PNG":
+    codec_setting = st.sidebar.slider("PNG compression level", 0, 9, FRAME_CODEC_DEFAULTS["PNG"])
+elif frame_codec in ("JPEG", "WebP"):
+    codec_setting = st.sidebar.slider(f"{frame_codec} quality", 1, 100,
+                                      FRAME_CODEC_DEFAULTS[frame_codec])
+else:
+    codec_setting = None
+
+# Size of the displayed frames; "Auto" fits them to the client
+auto_size = pick_output_size(client_width(key="client_width", default=None), st.context.headers)
+size_choice = st.sidebar.selectbox(
+    "Output size", [None] + OUTPUT_SIZES,
+    format_func=lambda size: f"Auto ({format_size(auto_size)})" if size is None else format_size(size),
+)
+output_size = auto_size if size_choice is None else size_choice
+
+# Seed of the random cell layout; the same seed always gives the same frames
+seed = st.sidebar.number_input("Random seed", min_value=0, max_value=MAX_SEED - 1,
+                               value=DEFAULT_SEED, step=1)
+
+# Culture of the day data, or a tissue-scale population of that many cells
+population = st.sidebar.select_slider(
+    "Cells per frame", [None] + POPULATION_SIZES,
+    format_func=lambda cells: "Culture" if cells is None else f"{cells:,}",
+)
+
+# Raw frames are too big to keep a whole cycle of them warm
+if FRAME_CODECS[FRAME_CODEC][1] is not None and output_size in OUTPUT_SIZES:
+    start_cache_warmup(output_size)
 
 # Create tabs for different views
 tab1, tab2, tab3 = st.tabs(["Animation", "Cell Properties", "Data Visualization"])
@@ -146,6 +537,11 @@ with tab1:
     
     with col1:
         auto_play = st.checkbox("Auto Play", value=False)
+        # Browser playback ships the frames once; server playback pushes every frame
+        playback = st.radio("Playback", ["Browser", "Server"], horizontal=True,
+                            disabled=not auto_play)
+        # Cells carry over into the next day instead of the frame jumping
+        morph_days = st.checkbox("Morph between days", value=True, disabled=not auto_play)
     
     with col2:
         day = st.slider("Select Day", min_value=1, max_value=8, value=1)
@@ -153,6 +549,17 @@ with tab1:
     with col3:
         speed = st.selectbox("Animation Speed", [1, 2, 3], index=1)
         frame_delay = 1.0 / speed
+
+    # Zoom into the culture; only the visible tiles are rendered
+    with st.expander("Zoom and pan"):
+        zcol1, zcol2, zcol3 = st.columns(3)
+        with zcol1:
+            zoom = st.select_slider("Zoom", ZOOM_LEVELS, format_func=lambda z: f"{z}x")
+        with zcol2:
+            pan_x = st.slider("Horizontal position", 0.0, 1.0, 0.5, 0.01, disabled=zoom == 1)
+        with zcol3:
+            pan_y = st.slider("Vertical position", 0.0, 1.0, 0.5, 0.01, disabled=zoom == 1)
+    view = None if zoom == 1 else (zoom, (pan_x, pan_y))
     
     # Session state to track animation
     if 'play_animation' not in st.session_state:
@@ -168,462 +575,73 @@ with tab1:
         auto_play = False
         st.session_state.last_day = day
     
-    # Function to generate cell animation frame with more realistic morphology
-    def generate_cell_frame(day_num, pulse=0.0):
-        day_data = cell_data[day_num]
-        width, height = 800, 600
-        
-        # Create a blank white image
-        image = Image.new('RGB', (width, height), (255, 255, 255))
-        draw = ImageDraw.Draw(image)
-        
-        # Create cell clusters - cells tend to grow in groups
-        num_clusters = max(3, day_num)
-        cluster_centers = []
-        for _ in range(num_clusters):
-            cluster_centers.append((50 + np.random.random() * 700, 50 + np.random.random() * 500))
-        
-        # Draw connecting fibers between clusters (days 4-6)
-        if 4 <= day_num <= 6:
-            for i in range(len(cluster_centers)):
-                for j in range(i+1, len(cluster_centers)):
-                    # Only connect some clusters
-                    if np.random.random() < 0.6:
-                        x1, y1 = cluster_centers[i]
-                        x2, y2 = cluster_centers[j]
-                        # Draw thin connecting fibers between clusters
-                        fiber_color = (255, 180, 180, 100)  # Light red, transparent
-                        # Create a wavy line
-                        points = []
-                        steps = 10
-                        for step in range(steps + 1):
-                            t = step / steps
-                            x = x1 + (x2 - x1) * t
-                            y = y1 + (y2 - y1) * t
-                            # Add wave effect
-                            if 0 < step < steps:
-                                wave_amp = 10 + 5 * np.sin(step)
-                                x += np.sin(step * 3) * wave_amp
-                                y += np.cos(step * 2) * wave_amp
-                            points.append((x, y))
-                        
-                        # Draw the fiber line
-                        for k in range(len(points) - 1):
-                            draw.line([points[k], points[k+1]], fill=fiber_color, width=2)
-        
-        # Draw cells
-        cells_drawn = 0
-        clusters_used = 0
-        
-        while cells_drawn < day_data["cell_count"]:
-            # Select a cluster to add cells to
-            if clusters_used < len(cluster_centers):
-                cluster_x, cluster_y = cluster_centers[clusters_used]
-                clusters_used += 1
-            else:
-                # If we've used all clusters, pick a random one
-                cluster_index = np.random.randint(0, len(cluster_centers))
-                cluster_x, cluster_y = cluster_centers[cluster_index]
-            
-            # Determine how many cells to add to this cluster
-            cells_in_cluster = min(
-                max(2, int(day_data["cell_count"] / num_clusters + np.random.randint(-2, 3))),
-                day_data["cell_count"] - cells_drawn
-            )
-            
-            for _ in range(cells_in_cluster):
-                # Calculate position within the cluster
-                cluster_radius = 30 + day_num * 5
-                angle = np.random.random() * 2 * np.pi
-                distance = np.random.random() * cluster_radius
-                x = cluster_x + np.cos(angle) * distance
-                y = cluster_y + np.sin(angle) * distance
-                
-                # DAY 1: Small, round, immature cells
-                if day_num == 1:
-                    cell_width = 18 + np.random.random() * 7
-                    cell_height = cell_width
-                    cell_color = (255, 214, 204, 180)  # Light pinkish
-                    
-                    # Almost no beating
-                    beat_factor = 1.0 + pulse * 0.05
-                    cell_width *= beat_factor
-                    cell_height *= beat_factor
-                    
-                    # Draw basic round cell
-                    draw.ellipse([x, y, x + cell_width, y + cell_height], fill=cell_color)
-                    
-                    # Large nucleus
-                    nucleus_size = 0.7 + np.random.random() * 0.1
-                    nucleus_color = (102, 102, 204, 200)  # Blue nucleus
-                
-                # DAY 2: Slightly elongated, few healthy cells
-                elif day_num == 2:
-                    # 70% round cells, 30% slightly elongated
-                    if np.random.random() < 0.7:
-                        cell_width = 20 + np.random.random() * 8
-                        cell_height = cell_width
-                    else:
-                        cell_width = 15 + np.random.random() * 8
-                        cell_height = cell_width * (1.2 + np.random.random() * 0.3)
-                    
-                    # Weak beating in some cells
-                    cell_color = (255, 204, 204, 180)  # Light pink
-                    if np.random.random() < 0.4:  # Only 40% of cells beat
-                        beat_factor = 1.0 + pulse * day_data["beat"] * 0.15
-                        cell_width *= beat_factor
-                        cell_height *= beat_factor
-                    
-                    # Draw basic cell
-                    draw.ellipse([x, y, x + cell_width, y + cell_height], fill=cell_color)
-                    
-                    # Large nucleus but slightly smaller than day 1
-                    nucleus_size = 0.65 + np.random.random() * 0.1
-                    nucleus_color = (102, 102, 204, 200)  # Blue nucleus
-                
-                # DAY 3: More elongated, healthy but some aging
-                elif day_num == 3:
-                    # 40% round, 60% elongated
-                    if np.random.random() < 0.4:
-                        cell_width = 20 + np.random.random() * 8
-                        cell_height = cell_width
-                    else:
-                        cell_width = 15 + np.random.random() * 8
-                        cell_height = cell_width * (1.5 + np.random.random() * 0.5)
-                        
-                        # Rotation angle (simplified by skewing dimensions)
-                        if np.random.random() < 0.5:
-                            cell_width, cell_height = cell_height, cell_width
-                    
-                    # Beating in more cells
-                    cell_color = (255, 194, 194, 180)  # Pink
-                    if np.random.random() < 0.6:  # 60% of cells beat
-                        beat_factor = 1.0 + pulse * day_data["beat"] * 0.2
-                        cell_width *= beat_factor
-                        cell_height *= beat_factor
-                    
-                    # Draw cell
-                    draw.ellipse([x, y, x + cell_width, y + cell_height], fill=cell_color)
-                    
-                    # Add some internal structure (sarcomeres forming)
-                    if np.random.random() < 0.4:
-                        for i in range(3):
-                            line_y = y + cell_height * (0.3 + i * 0.2)
-                            line_length = cell_width * 0.6
-                            line_x = x + (cell_width - line_length) / 2
-                            draw.line([(line_x, line_y), (line_x + line_length, line_y)], 
-                                     fill=(255, 160, 160, 120), width=1)
-                    
-                    # Medium sized nucleus
-                    nucleus_size = 0.5 + np.random.random() * 0.1
-                    nucleus_color = (102, 102, 204, 200)  # Blue nucleus
-                
-                # DAY 4: Well-defined, elongated, aligned cells
-                elif day_num == 4:
-                    # 20% round, 80% elongated
-                    if np.random.random() < 0.2:
-                        cell_width = 20 + np.random.random() * 8
-                        cell_height = cell_width
-                    else:
-                        cell_width = 15 + np.random.random() * 8
-                        cell_height = cell_width * (1.8 + np.random.random() * 0.7)
-                        
-                        # Rotation angle (simplified by skewing dimensions)
-                        if np.random.random() < 0.5:
-                            cell_width, cell_height = cell_height, cell_width
-                    
-                    # Better synchronized beating
-                    cell_color = (255, 153, 153, 180)  # Medium pink
-                    if np.random.random() < 0.7:  # 70% of cells beat
-                        beat_factor = 1.0 + pulse * day_data["beat"] * 0.25
-                        cell_width *= beat_factor
-                        cell_height *= beat_factor
-                    
-                    # Draw cell
-                    draw.ellipse([x, y, x + cell_width, y + cell_height], fill=cell_color)
-                    
-                    # Add internal structure (sarcomeres more visible)
-                    if np.random.random() < 0.8:
-                        lines = int(3 + np.random.random() * 3)
-                        for i in range(lines):
-                            line_y = y + cell_height * (0.2 + i * 0.6/lines)
-                            line_length = cell_width * 0.8
-                            line_x = x + (cell_width - line_length) / 2
-                            draw.line([(line_x, line_y), (line_x + line_length, line_y)], 
-                                     fill=(255, 130, 130, 150), width=1)
-                    
-                    # Smaller nucleus
-                    nucleus_size = 0.45 + np.random.random() * 0.1
-                    nucleus_color = (102, 102, 204, 200)  # Blue nucleus
-                
-                # DAY 5-6: Peak maturity, strong organization and connection
-                elif day_num <= 6:
-                    # 10% round, 90% elongated
-                    if np.random.random() < 0.1:
-                        cell_width = 20 + np.random.random() * 8
-                        cell_height = cell_width
-                    else:
-                        cell_width = 15 + np.random.random() * 10
-                        cell_height = cell_width * (2.0 + np.random.random() * 1.0)
-                        
-                        # More consistent alignment
-                        if np.random.random() < 0.7:
-                            cell_width, cell_height = cell_height, cell_width
-                    
-                    # Strong synchronized beating
-                    intensity = 0.8 if day_num == 5 else 1.0  # Day 6 is peak activity
-                    cell_color = (255, 102 - (day_num-5)*40, 102 - (day_num-5)*40, 180)  # Stronger red for day 6
-                    if np.random.random() < 0.9:  # 90% of cells beat
-                        beat_factor = 1.0 + pulse * day_data["beat"] * 0.3 * intensity
-                        cell_width *= beat_factor
-                        cell_height *= beat_factor
-                    
-                    # Draw cell
-                    draw.ellipse([x, y, x + cell_width, y + cell_height], fill=cell_color)
-                    
-                    # Add detailed internal structure (well-formed sarcomeres)
-                    lines = int(5 + np.random.random() * 3)
-                    for i in range(lines):
-                        line_y = y + cell_height * (0.2 + i * 0.6/lines)
-                        line_length = cell_width * 0.85
-                        line_x = x + (cell_width - line_length) / 2
-                        draw.line([(line_x, line_y), (line_x + line_length, line_y)], 
-                                 fill=(255, 80, 80, 180), width=2)
-                    
-                    # Add intercellular connections
-                    if np.random.random() < 0.4:
-                        connection_x = x + cell_width
-                        connection_y = y + cell_height/2
-                        conn_length = 10 + np.random.random() * 15
-                        draw.line([(connection_x, connection_y), (connection_x + conn_length, connection_y)], 
-                                 fill=(255, 120, 120, 150), width=2)
-                    
-                    # Well-integrated nucleus
-                    nucleus_size = 0.4
-                    nucleus_color = (102, 102, 204, 200)  # Blue nucleus
-                
-                # DAY 7: Beginning of damage and fragmentation
-                elif day_num == 7:
-                    # Mix of healthy, fragmenting, and detaching cells
-                    cell_state = np.random.random()
-                    if cell_state < 0.4:  # 40% still relatively healthy
-                        cell_width = 15 + np.random.random() * 10
-                        cell_height = cell_width * (1.8 + np.random.random() * 0.5)
-                        cell_color = (204, 51, 51, 160)  # Darker red, more transparent
-                        
-                        # Some beating, but weaker
-                        if np.random.random() < 0.6:  # 60% of "healthy" cells still beat
-                            beat_factor = 1.0 + pulse * day_data["beat"] * 0.15
-                            cell_width *= beat_factor
-                            cell_height *= beat_factor
-                            
-                        # Cell membrane starting to break down
-                        if np.random.random() < 0.5:
-                            # Add "breaks" in the membrane
-                            break_angle = np.random.random() * 2 * np.pi
-                            break_size = np.random.random() * 5 + 3
-                            break_x = x + cell_width/2 + np.cos(break_angle) * cell_width/2
-                            break_y = y + cell_height/2 + np.sin(break_angle) * cell_height/2
-                            draw.ellipse([break_x-break_size/2, break_y-break_size/2, 
-                                         break_x+break_size/2, break_y+break_size/2], 
-                                        fill=(255, 255, 255, 255))  # White "break"
-                    
-                    elif cell_state < 0.7:  # 30% fragmenting
-                        # Draw multiple smaller fragments instead of one cell
-                        fragment_count = int(2 + np.random.random() * 3)
-                        for j in range(fragment_count):
-                            frag_x = x + np.random.random() * 20 - 10
-                            frag_y = y + np.random.random() * 20 - 10
-                            frag_size = 6 + np.random.random() * 8
-                            frag_color = (204, 51, 51, 140 - j*20)  # Progressively more transparent
-                            draw.ellipse([frag_x, frag_y, frag_x+frag_size, frag_y+frag_size], 
-                                        fill=frag_color)
-                        
-                        # Skip standard cell drawing
-                        cells_drawn += 1
-                        continue
-                    
-                    else:  # 30% severely damaged/detaching
-                        cell_width = 12 + np.random.random() * 8
-                        cell_height = 12 + np.random.random() * 8
-                        cell_color = (180, 40, 40, 120)  # Dark red, very transparent
-                        
-                        # No beating for severely damaged cells
-                        beat_factor = 1.0
-                        
-                        # Cell border is irregular
-                        draw.ellipse([x, y, x + cell_width, y + cell_height], fill=cell_color)
-                        
-                        # Add cellular debris around damaged cells
-                        debris_count = int(3 + np.random.random() * 5)
-                        for j in range(debris_count):
-                            debris_x = x + np.random.random() * (cell_width + 20) - 10
-                            debris_y = y + np.random.random() * (cell_height + 20) - 10
-                            debris_size = 2 + np.random.random() * 3
-                            draw.ellipse([debris_x, debris_y, debris_x+debris_size, debris_y+debris_size], 
-                                        fill=(150, 50, 50, 100 + int(np.random.random() * 50)))
-                        
-                        # Skip nucleus for severely damaged cells
-                        cells_drawn += 1
-                        continue
-                    
-                    # Draw cell (for healthy and some fragmenting cells)
-                    draw.ellipse([x, y, x + cell_width, y + cell_height], fill=cell_color)
-                    
-                    # Degraded internal structure
-                    if np.random.random() < 0.4:
-                        for i in range(2):
-                            line_y = y + cell_height * (0.3 + i * 0.3)
-                            line_length = cell_width * 0.5
-                            line_x = x + (cell_width - line_length) / 2
-                            # Broken lines
-                            segments = 3
-                            for s in range(segments):
-                                if np.random.random() < 0.7:  # Some segments missing
-                                    seg_start = line_x + (line_length * s / segments)
-                                    seg_end = line_x + (line_length * (s+1) / segments)
-                                    draw.line([(seg_start, line_y), (seg_end, line_y)], 
-                                             fill=(200, 70, 70, 120), width=1)
-                    
-                    # Nucleus sometimes fragmented or condensed
-                    if np.random.random() < 0.5:
-                        nucleus_size = 0.3 + np.random.random() * 0.1
-                        nucleus_color = (102, 102, 204, 120)  # More transparent
-                    else:
-                        # Fragmented nucleus - draw multiple small pieces
-                        for j in range(2):
-                            nuc_x = x + cell_width * (0.3 + np.random.random() * 0.4)
-                            nuc_y = y + cell_height * (0.3 + np.random.random() * 0.4)
-                            nuc_size = cell_width * 0.2
-                            draw.ellipse([nuc_x, nuc_y, nuc_x+nuc_size, nuc_y+nuc_size], 
-                                        fill=(102, 102, 204, 100))
-                        
-                        # Skip standard nucleus drawing
-                        cells_drawn += 1
-                        continue
-                
-                # DAY 8: Severe damage and cell death
-                else:  # day_num == 8
-                    # Mostly debris and fragments with very few intact cells
-                    cell_state = np.random.random()
-                    if cell_state < 0.2:  # Only 20% somewhat intact
-                        cell_width = 10 + np.random.random() * 8
-                        cell_height = cell_width * (1.0 + np.random.random() * 0.3)
-                        cell_color = (153, 51, 51, 130)  # Brownish red, very transparent
-                        
-                        # Almost no beating
-                        if np.random.random() < 0.2:  # 20% of remaining cells beat weakly
-                            beat_factor = 1.0 + pulse * day_data["beat"] * 0.1
-                            cell_width *= beat_factor
-                            cell_height *= beat_factor
-                        
-                        # Draw damaged cell
-                        draw.ellipse([x, y, x + cell_width, y + cell_height], fill=cell_color)
-                        
-                        # Severely disrupted structure - just random dots inside
-                        dots = int(2 + np.random.random() * 3)
-                        for i in range(dots):
-                            dot_x = x + np.random.random() * cell_width
-                            dot_y = y + np.random.random() * cell_height
-                            dot_size = 1 + np.random.random() * 2
-                            draw.ellipse([dot_x, dot_y, dot_x+dot_size, dot_y+dot_size], 
-                                        fill=(180, 60, 60, 150))
-                        
-                        # Some nuclei still visible but condensed
-                        nucleus_size = 0.25
-                        nucleus_color = (102, 102, 204, 80)  # Very faint
-                    
-                    else:  # 80% fragmented/debris
-                        # Draw multiple smaller fragments
-                        fragment_count = int(1 + np.random.random() * 5)
-                        for j in range(fragment_count):
-                            frag_x = x + np.random.random() * 30 - 15
-                            frag_y = y + np.random.random() * 30 - 15
-                            frag_size = 3 + np.random.random() * 6
-                            frag_color = (153, 51, 51, 100 - j*10)  # Progressively more transparent
-                            draw.ellipse([frag_x, frag_y, frag_x+frag_size, frag_y+frag_size], 
-                                        fill=frag_color)
-                        
-                        # Skip standard cell and nucleus drawing
-                        cells_drawn += 1
-                        continue
-                
-                # Draw nucleus unless skipped in special cases above
-                nucleus_x = x + (cell_width / 2) - (cell_width * nucleus_size / 2)
-                nucleus_y = y + (cell_height / 2) - (cell_height * nucleus_size / 2)
-                nucleus_width = cell_width * nucleus_size
-                nucleus_height = cell_height * nucleus_size
-                draw.ellipse([nucleus_x, nucleus_y, nucleus_x + nucleus_width, nucleus_y + nucleus_height], 
-                             fill=nucleus_color)
-                
-                cells_drawn += 1
-        
-        # Add additional debris and cellular fragments
-        # More debris in later days
-        base_debris = int(day_data["debris_level"] * 100)
-        for i in range(base_debris):
-            debris_x = np.random.random() * width
-            debris_y = np.random.random() * height
-            debris_size = 2 + np.random.random() * 4
-            
-            # Debris color varies by day
-            if day_num <= 3:
-                debris_color = (180, 180, 180, 80)  # Light gray, very transparent
-            elif day_num <= 6:
-                debris_color = (180, 150, 150, 100)  # Pinkish gray
-            else:
-                debris_color = (160, 100, 100, 120)  # Reddish debris for cell breakdown
-            
-            draw.ellipse([debris_x, debris_y, debris_x + debris_size, debris_y + debris_size], 
-                         fill=debris_color)
-        
-        return image
-    
-    # Display the current day's data
-    current_day_data = cell_data[day]
-    st.subheader(current_day_data["title"])
-
-    # Create animation placeholder
-    animation_placeholder = st.empty()
-    
-    # Manually advance day for auto-play
-    if auto_play:
-        # Create 10 frames with pulsing effect for the current day
-        for pulse in np.linspace(0, 1, 10):
-            if not st.session_state.play_animation:
-                break
-                
-            frame = generate_cell_frame(day, pulse)
-            
-            # Convert PIL image to bytes for display
-            buf = io.BytesIO()
-            frame.save(buf, format="PNG")
-            byte_im = buf.getvalue()
-            
-            # Display using Streamlit image
-            animation_placeholder.image(byte_im, use_container_width=True)
-            
-            # Control frame rate
-            time.sleep(frame_delay/10)
-            
-        # Move to next day if auto-playing
-        if st.session_state.play_animation:
-            next_day = day + 1 if day < 8 else 1
-            st.session_state.last_day = next_day
-            time.sleep(frame_delay)
-            # Replace st.experimental_rerun() with st.rerun()
-            st.rerun()
+    if auto_play and playback == "Browser":
+        # The browser plays all days on its own clock; this script run ends right away
+        components.html(build_player_html(day, frame_delay, seed, backend=render_backend,
+                                          codec=frame_codec, setting=codec_setting,
+                                          size=output_size, cells=population, view=view,
+                                          morph=morph_days),
+                        height=PLAYER_HEIGHT)
+    elif auto_play:
+        # Each frame reruns only the playback fragment, not the other tabs or the sidebar
+        play_on_server(day, frame_delay, seed, render_backend, frame_codec, codec_setting,
+                       output_size, population, view, morph_days)
     else:
+        # Display the current day's data
+        current_day_data = cell_data[day]
+        st.subheader(day_title(day, population))
+
+        # Create animation placeholder
+        animation_placeholder = st.empty()
+
         # Just show a static frame with a slight pulse
-        frame = generate_cell_frame(day, 0.5)
-        
-        # Convert PIL image to bytes for display
-        buf = io.BytesIO()
-        frame.save(buf, format="PNG")
-        byte_im = buf.getvalue()
+        frame_data = get_frame_data(day, STATIC_PULSE_INDEX, seed, backend=render_backend,
+                                    codec=frame_codec, setting=codec_setting,
+                                    size=output_size, cells=population, view=view)
         
         # Display using Streamlit image
-        animation_placeholder.image(byte_im, use_container_width=True)
+        show_frame(animation_placeholder, frame_data, frame_codec)
+
+        # Order parameter of the cells' beating phases: 0 = random, 1 = in unison
+        synchrony = frame_synchrony(get_scene(day, seed, population), STATIC_PULSE_INDEX)
+        st.caption(f"Beating synchrony R = {synchrony:.2f} "
+                   f"(sync level {current_day_data['sync_level']:.0%})")
+
+    # Export the animation as a single downloadable file
+    with st.expander("Export animation"):
+        ecol1, ecol2, ecol3 = st.columns(3)
+        with ecol1:
+            export_scope = st.radio("Sequence", ["Selected day", "Days 1-8"], horizontal=True)
+        with ecol2:
+            export_format = st.selectbox("Format", list(EXPORT_FORMATS))
+        with ecol3:
+            export_size = st.selectbox("Size", OUTPUT_SIZES, index=OUTPUT_SIZES.index(output_size),
+                                       format_func=format_size)
+
+        export_days = (day,) if export_scope == "Selected day" else tuple(sorted(cell_data))
+        export_args = (export_days, export_format, frame_delay, seed, render_backend,
+                       export_size, population, morph_days)
+        if st.button("Encode"):
+            st.session_state.export_args = export_args
+
+        if st.session_state.get("export_args") == export_args:
+            data = export_sequence(*export_args)
+            _, extension, mime = EXPORT_FORMATS[export_format]
+            name = f"day{day}" if len(export_days) == 1 else "days1-8"
+            st.download_button(f"Download {export_format} ({len(data) / 1e6:.1f} MB)", data,
+                               file_name=f"cardiac_cells_{name}.{extension}", mime=mime)
+
+    # Compare frame encoders on every day's frames
+    with st.expander("Encoder benchmark"):
+        st.caption("Encode time and size per frame for each day, using the selected renderer.")
+        if st.button("Run benchmark"):
+            with st.spinner("Encoding frames..."):
+                import pandas as pd
+
+                from benchmark import benchmark_encoders
+
+                benchmark = pd.DataFrame(benchmark_encoders(seed=seed, backend=render_backend))
+                st.dataframe(benchmark, hide_index=True, use_container_width=True)
 
 with tab2:
     # Display cell properties
@@ -648,53 +666,28 @@ with tab3:
     # Data visualization
     st.subheader("Quantitative Changes Over Time")
     
-    # Create a dataframe with the numeric data
-    metrics = ["beat", "sync_level", "cell_count", "debris_level"]
-    df_data = {
-        "Day": list(range(1, 9)),
-        "Beat Strength": [cell_data[d]["beat"] * 100 for d in range(1, 9)],
-        "Synchronization": [cell_data[d]["sync_level"] * 100 for d in range(1, 9)],
-        "Cell Count": [cell_data[d]["cell_count"] for d in range(1, 9)],
-        "Debris Level": [cell_data[d]["debris_level"] * 100 for d in range(1, 9)]
-    }
-    df = pd.DataFrame(df_data)
-    
     # Create metric selection
     selected_metrics = st.multiselect(
         "Select metrics to display",
-        ["Beat Strength", "Synchronization", "Cell Count", "Debris Level"],
+        list(DAY_METRICS),
         default=["Beat Strength", "Synchronization", "Cell Count"]
     )
     
     if selected_metrics:
-        # Create a long-form dataframe for Altair
-        df_long = pd.melt(
-            df, 
-            id_vars=["Day"], 
-            value_vars=selected_metrics,
-            var_name="Metric", 
-            value_name="Value"
-        )
-        
-        # Create the chart
-        chart = alt.Chart(df_long).mark_line(point=True).encode(
-            x=alt.X("Day:O", title="Day"),
-            y=alt.Y("Value:Q", title="Value"),
-            color=alt.Color("Metric:N", title="Metric"),
-            tooltip=["Day", "Metric", "Value"]
-        ).properties(
-            width=700,
-            height=400,
-            title="Cell Development Metrics Over Time"
-        ).interactive()
-        
-        st.altair_chart(chart, use_container_width=True)
+        # Data and chart are cached per data version and selection
+        st.altair_chart(day_metrics_chart(CELL_DATA_VERSION, tuple(selected_metrics)),
+                        use_container_width=True)
         
         # Show the data table
-        st.dataframe(df[["Day"] + selected_metrics])
+        st.dataframe(day_metrics_frame(CELL_DATA_VERSION)[["Day"] + selected_metrics])
     else:
         st.info("Please select at least one metric to display")
 
+    if cell_data is not DEFAULT_CELL_DATA:
+        # Spread of the measurements between the wells of the dataset
+        st.markdown("### Measurements Across Wells")
+        st.altair_chart(well_metrics_chart(CELL_DATA_VERSION))
+
 # Add app instructions
 st.sidebar.header("Instructions")
 st.sidebar.markdown("""
@@ -715,4 +708,28 @@ This visualization is based on a study of cardiac cell development, showing morp
 
 # Add data source information 
 st.sidebar.markdown("---")
-st.sidebar.markdown("Data source: Cardiac Cell Development Study")
+if cell_data is DEFAULT_CELL_DATA:
+    st.sidebar.markdown("Data source: Cardiac Cell Development Study")
+else:
+    measurements = sum(cell_data[d]["wells"] for d in cell_data)
+    st.sidebar.markdown(f"Data source: `{os.environ['CELL_DATA_PATH']}` "
+                        f"({measurements:,} well measurements)")
+
+# Shared frame cache statistics
+cache_stats = get_frame_cache().stats()
+st.sidebar.caption(
+    f"Frame cache: {cache_stats['frames']} frames, "
+    f"{cache_stats['bytes'] / 1e6:.1f} / {cache_stats['max_bytes'] / 1e6:.0f} MB, "
+    f"{cache_stats['hits']} hits / {cache_stats['misses']} misses"
+)
+tile_stats = get_tile_cache().stats()
+st.sidebar.caption(
+    f"Tile cache: {tile_stats['frames']} tiles, "
+    f"{tile_stats['bytes'] / 1e6:.1f} / {tile_stats['max_bytes'] / 1e6:.0f} MB, "
+    f"{tile_stats['hits']} hits / {tile_stats['misses']} misses"
+)
+
+# Where the render time goes, per stage and day
+if instrumentation.ENABLED and st.sidebar.checkbox("Show render stats"):
+    with st.sidebar:
+        render_stats_panel()
@@ -0,0 +1,156 @@
+"""Batch rendering of frames in a pool of worker processes.
+
+Rasterizing and encoding are CPU-bound and mostly hold the GIL, so frames
+are spread across processes rather than threads. Each worker samples the
+scenes it needs once and keeps them, static layers included, for later jobs.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import NamedTuple
+
+import instrumentation
+from beating import frame_pulse
+from population import build_scene_for
+from renderer import (
+    DEFAULT_SEED,
+    FRAME_CODEC,
+    FRAME_CODEC_DEFAULTS,
+    PULSE_FRAMES,
+    RENDER_BACKEND,
+    SCENE_HEIGHT,
+    SCENE_WIDTH,
+    encode_frame,
+    render_scene,
+)
+from timeline import MORPH_FRAMES, Timeline, next_day
+
+# Worker processes used by default; 0 means one per CPU
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 0)) or os.cpu_count() or 1
+
+
+# One encoded frame to render. Also used as the frame cache key.
+class FrameJob(NamedTuple):
+    day: int
+    pulse_index: int
+    seed: int = DEFAULT_SEED
+    size: tuple = (SCENE_WIDTH, SCENE_HEIGHT)
+    backend: str = RENDER_BACKEND
+    codec: str = FRAME_CODEC
+    setting: int = None
+    cells: int = None           # population size, None for the day's culture
+    morph: int = None           # step of the morph into the next day, None for the day itself
+
+
+def frame_job(day, pulse_index, seed=DEFAULT_SEED, size=(SCENE_WIDTH, SCENE_HEIGHT),
+              backend=RENDER_BACKEND, codec=FRAME_CODEC, setting=None, cells=None, morph=None):
+    # Normalized job: the codec's default setting filled in and the size a tuple,
+    # so equal frames always get equal keys
+    if setting is None:
+        setting = FRAME_CODEC_DEFAULTS[codec]
+    return FrameJob(day, pulse_index, seed, tuple(size), backend, codec, setting, cells, morph)
+
+
+# Pulse index of an intermediate morph frame; the cells keep beating while they morph
+def morph_pulse_index(step):
+    return step % PULSE_FRAMES
+
+
+# Jobs for every pulse frame of the given days, grouped by day. With `morph`,
+# each day is followed by its morph into the next day when that is one of them.
+def sequence_jobs(days, seed=DEFAULT_SEED, backend=RENDER_BACKEND, codec=FRAME_CODEC,
+                  setting=None, size=(SCENE_WIDTH, SCENE_HEIGHT), cells=None, morph=False):
+    jobs = []
+    for d in days:
+        jobs += [frame_job(d, i, seed, size, backend, codec, setting, cells)
+                 for i in range(PULSE_FRAMES)]
+        if morph and next_day(d) in days:
+            jobs += [frame_job(d, morph_pulse_index(k), seed, size, backend, codec, setting,
+                               cells, k)
+                     for k in range(MORPH_FRAMES)]
+    return jobs
+
+
+# Labels a frame's stage times are recorded under: its day, "3-4" for the morph
+# from day 3 into day 4, and its scene, "culture" or the population size
+def job_labels(job):
+    day = str(job.day) if job.morph is None else f"{job.day}-{next_day(job.day)}"
+    return {"day": day, "scene": "culture" if job.cells is None else job.cells}
+
+
+# Scenes sampled in this process, reused across jobs
+@lru_cache(maxsize=16)
+def _scene(day, seed, cells):
+    return build_scene_for(day, seed, cells)
+
+
+# Day-to-day morphs of the scenes above
+@lru_cache(maxsize=4)
+def _timeline(seed, cells):
+    return Timeline(lambda day: _scene(day, seed, cells), seed)
+
+
+# Scene of one job, sampled in this process
+def job_scene(job):
+    if job.morph is None:
+        return _scene(job.day, job.seed, job.cells)
+    return _timeline(job.seed, job.cells).frame_scene(job.day, job.morph)
+
+
+# Encoded bytes (or the RGB array for "Raw") of one job
+def render_job(job):
+    with instrumentation.frame(**job_labels(job)):
+        scene = job_scene(job)
+        frame = render_scene(scene, frame_pulse(scene, job.pulse_index), job.backend, *job.size)
+        return encode_frame(frame, job.codec, job.setting)
+
+
+# render_job() in a worker process: the frame and its stage times, which the
+# parent records, as worker processes have stats of their own nobody reads
+def render_job_traced(job):
+    with instrumentation.frame(record=False, **job_labels(job)) as trace:
+        data = render_job(job)
+    return data, trace
+
+
+# Worker pools are started on first use and kept for the life of the process
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(workers=RENDER_WORKERS):
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            # Fresh interpreters rather than forks: the parent may be running threads
+            executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            _executors[workers] = executor
+        return executor
+
+
+# Render and encode a batch of jobs, returning the results in job order. Jobs
+# are handed out in contiguous chunks, so keeping jobs of the same scene next
+# to each other lets a worker reuse its scene and static layers. With one
+# worker, or a single job, everything runs in this process.
+def render_batch(jobs, workers=RENDER_WORKERS):
+    jobs = list(jobs)
+    if workers <= 1 or len(jobs) <= 1:
+        return [render_job(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (workers * 2))
+    frames = []
+    for data, trace in get_executor(workers).map(render_job_traced, jobs, chunksize=chunksize):
+        instrumentation.record_frame(trace)
+        frames.append(data)
+    return frames
+
+
+# Render the jobs missing from `cache` in one batch and store them; returns
+# the number of frames rendered
+def prefetch_frames(cache, jobs, workers=RENDER_WORKERS):
+    missing = [job for job in jobs if job not in cache]
+    for job, data in zip(missing, render_batch(missing, workers)):
+        cache.put(job, data)
+    return len(missing)
@@ -0,0 +1,92 @@
+"""Beating of the cells as coupled phase oscillators.
+
+Every cell has a phase that advances at its own natural frequency and is
+pulled towards the population's mean phase (the Kuramoto model in mean-field
+form):
+
+    dtheta_i/dt = omega_i + K * R * sin(psi - theta_i),   R * e^(i psi) = mean_j e^(i theta_j)
+
+The coupling K comes from the day's sync_level. It rises linearly from below
+the critical coupling, where the cells beat out of step, to a little above
+it, where the order parameter R grows fastest, so R roughly follows
+sync_level instead of locking fully for any sync_level past the threshold. How far
+a cell contracts is set by its body gain, which scales with the day's beat.
+All cells are advanced together in one vectorized update per time step.
+"""
+
+import numpy as np
+
+from cell_data import cell_data
+from renderer import PULSE_FRAMES, STREAM_BEATING, scene_rng
+
+# Time is measured in mean beat periods
+STEPS_PER_BEAT = 20
+# Beats simulated before the first frame, so the phases have settled
+BURN_IN_BEATS = 20
+# Standard deviation of the natural frequencies, relative to their mean
+FREQUENCY_SPREAD = 0.1
+# Coupling at sync_level 0 and 1, as multiples of the critical coupling above
+# which the oscillators start to synchronize
+MIN_COUPLING = 0.4
+MAX_COUPLING = 1.8
+
+
+def critical_coupling(frequency_std):
+    # 2 / (pi * g(0)) for normally distributed natural frequencies
+    return 2 * np.sqrt(2 * np.pi) / np.pi * frequency_std
+
+
+def coupling_strength(sync_level):
+    scale = MIN_COUPLING + (MAX_COUPLING - MIN_COUPLING) * sync_level
+    return scale * critical_coupling(2 * np.pi * FREQUENCY_SPREAD)
+
+
+# Complex order parameter R * e^(i psi) of a set of phases
+def order_parameter(theta):
+    return np.exp(1j * theta).mean() if len(theta) else 0j
+
+
+def kuramoto_step(theta, omega, coupling, dt):
+    # R * sin(psi - theta) = Im(z * e^(-i theta)), without complex arrays
+    cos, sin = np.cos(theta), np.sin(theta)
+    zx, zy = cos.mean(), sin.mean()
+    return theta + dt * (omega + coupling * (zy * cos - zx * sin))
+
+
+# Phases at each of the increasing `times`, stepped from `theta` at time 0
+def simulate_phases(theta, omega, coupling, times, dt=1.0 / STEPS_PER_BEAT):
+    phases = np.empty((len(times), len(theta)))
+    t = 0.0
+    for k, target in enumerate(times):
+        while target - t > 1e-9:
+            step = min(dt, target - t)
+            theta = kuramoto_step(theta, omega, coupling, step)
+            t += step
+        phases[k] = theta
+    return phases
+
+
+# (PULSE_FRAMES, cells) phase of every cell at every pulse frame. The frames
+# cover one mean beat after the burn-in; simulated on first use and kept on
+# the scene.
+def scene_phases(scene):
+    if scene.phases is None:
+        rng = scene_rng(scene.seed, scene.day, STREAM_BEATING)
+        n = scene.cell_count
+        omega = 2 * np.pi * (1 + FREQUENCY_SPREAD * rng.standard_normal(n))
+        theta = rng.random(n) * 2 * np.pi
+        times = BURN_IN_BEATS + np.arange(PULSE_FRAMES) / PULSE_FRAMES
+        scene.phases = simulate_phases(theta, omega,
+                                       coupling_strength(cell_data[scene.day]["sync_level"]), times)
+    return scene.phases
+
+
+# Contraction of every cell at a pulse frame, from 0 (relaxed, phase 0) to 1
+# (fully contracted, phase pi); render_scene() takes it as the pulse
+def frame_pulse(scene, pulse_index):
+    return (1 - np.cos(scene_phases(scene)[pulse_index])) / 2
+
+
+# How synchronized the beating is at a pulse frame, from 0 to 1
+def frame_synchrony(scene, pulse_index):
+    return float(np.abs(order_parameter(scene_phases(scene)[pulse_index])))
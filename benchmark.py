@@ -0,0 +1,423 @@
+"""Headless benchmarks for the frame renderer.
+
+Times scene layout, rasterization and encoding separately for every day,
+pulse and resolution, and writes the results as JSON so runs can be compared
+across commits:
+
+    python benchmark.py --resolutions 400x300 800x600 3840x2160 --output bench.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import PIL
+
+from batch_render import frame_job, render_batch
+from beating import frame_pulse
+from cell_data import cell_data
+from frame_cache import frame_nbytes
+from population import build_scene_for
+from renderer import (
+    DEFAULT_SEED,
+    FRAME_CODEC_DEFAULTS,
+    PULSE_FRAMES,
+    RENDER_BACKEND,
+    RENDER_BACKENDS,
+    SCENE_HEIGHT,
+    SCENE_WIDTH,
+    STREAM_TIMELINE,
+    build_scene,
+    encode_frame,
+    render_scene,
+    scene_rng,
+)
+from timeline import MORPH_FRAMES, Transition, morph_time, next_day
+
+# Default resolutions, from dashboard thumbnails up to 4K
+RESOLUTIONS = ["400x300", "800x600", "1600x1200", "3840x2160"]
+
+# Encoder settings compared by the encoder benchmark
+ENCODER_BENCHMARK_SETTINGS = [
+    ("PNG", 1), ("PNG", 6), ("PNG", 9),
+    ("JPEG", 75), ("JPEG", 90),
+    ("WebP", 75), ("WebP", 90),
+    ("Raw", None),
+]
+
+
+# Run `fn` `repeats` times; return the fastest wall time (seconds) and the last result
+def _best_of(repeats, fn):
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _day_frames(day_num, seed, backend, width=SCENE_WIDTH, height=SCENE_HEIGHT):
+    scene = build_scene(day_num, seed)
+    return [render_scene(scene, frame_pulse(scene, i), backend, width, height)
+            for i in range(PULSE_FRAMES)]
+
+
+# Encode time and size per frame for every day and encoder setting. Frames are
+# rendered up front so only the encoder is timed; the best of `repeats` runs counts.
+def benchmark_encoders(days=tuple(range(1, 9)), settings=ENCODER_BENCHMARK_SETTINGS,
+                       seed=DEFAULT_SEED, backend=RENDER_BACKEND, repeats=3):
+    rows = []
+    for d in days:
+        frames = _day_frames(d, seed, backend)
+        for codec, setting in settings:
+            seconds, sizes = _best_of(
+                repeats, lambda: [frame_nbytes(encode_frame(f, codec, setting)) for f in frames])
+            rows.append({
+                "Day": d,
+                "Codec": codec,
+                "Setting": "-" if setting is None else str(setting),
+                "Encode ms/frame": seconds * 1000 / len(frames),
+                "KB/frame": sum(sizes) / len(sizes) / 1024,
+            })
+    return rows
+
+
+# Per-stage timings for every (backend, resolution, population, day); a
+# population of None is the day's culture:
+#   layout_ms       sampling the scene (independent of the resolution)
+#   raster_cold_ms  first frame of a scene, including the cached static layers
+#   raster_ms       later frames, one entry per pulse
+#   encode          per codec setting, mean time and size per frame
+#   frames_sha256   digest of the raw frames; equal digests mean identical images
+def benchmark_renderer(days, resolutions, pulses, backends, codecs, seed=DEFAULT_SEED, repeats=3,
+                       populations=(None,)):
+    results = []
+    for backend in backends:
+        for (width, height), cells in itertools.product(resolutions, populations):
+            for d in days:
+                layout_s, scene = _best_of(repeats, lambda: build_scene_for(d, seed, cells))
+
+                def cold_frame():
+                    scene.layer_cache.clear()
+                    return render_scene(scene, pulses[0], backend, width, height)
+
+                cold_s, _ = _best_of(repeats, cold_frame)
+
+                raster_ms, frames = [], []
+                for pulse in pulses:
+                    seconds, frame = _best_of(repeats, lambda: render_scene(scene, pulse, backend, width, height))
+                    raster_ms.append(seconds * 1000)
+                    frames.append(frame)
+
+                encode = {}
+                for codec, setting in codecs:
+                    seconds, sizes = _best_of(
+                        repeats,
+                        lambda: [frame_nbytes(encode_frame(f, codec, setting)) for f in frames])
+                    encode[_codec_name(codec, setting)] = {
+                        "ms_per_frame": seconds * 1000 / len(frames),
+                        "bytes_per_frame": sum(sizes) / len(sizes),
+                    }
+
+                results.append({
+                    "backend": backend,
+                    "width": width,
+                    "height": height,
+                    "day": d,
+                    "cells": scene.cell_count,
+                    "bodies": len(scene.body_xy),
+                    "lines": len(scene.line_body) + sum(len(f) - 1 for f in scene.fibers),
+                    "layout_ms": layout_s * 1000,
+                    "raster_cold_ms": cold_s * 1000,
+                    "raster_ms": raster_ms,
+                    "raster_ms_mean": float(np.mean(raster_ms)),
+                    "encode": encode,
+                    "frames_sha256": _frames_digest(frames),
+                })
+    return results
+
+
+def _frames_digest(frames):
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(np.asarray(frame).tobytes())
+    return digest.hexdigest()
+
+
+# Wall time of rendering and encoding every (day, pulse) frame as one batch,
+# for each worker count. The pool is started before timing, as in the app.
+def benchmark_batch(days, resolution, workers_list, codec=("PNG", 6), seed=DEFAULT_SEED,
+                    backend=RENDER_BACKEND, repeats=3):
+    # A new seed per run keeps the workers' scene caches cold
+    runs = itertools.count(seed)
+
+    def jobs():
+        run_seed = next(runs)
+        return [frame_job(d, i, run_seed, resolution, backend, *codec)
+                for d in days for i in range(PULSE_FRAMES)]
+
+    results = []
+    for workers in workers_list:
+        render_batch(jobs()[:workers], workers)
+        seconds, frames = _best_of(repeats, lambda: render_batch(jobs(), workers))
+        results.append({
+            "workers": workers,
+            "frames": len(frames),
+            "width": resolution[0],
+            "height": resolution[1],
+            "codec": _codec_name(*codec),
+            "batch_ms": seconds * 1000,
+        })
+    return results
+
+
+# Cost of morphing each day into the next, against sampling the next day from
+# scratch. The diff is worked out once per pair of days; every intermediate
+# frame then only interpolates the cells whose event is in progress.
+def benchmark_morph(days, resolution, seed=DEFAULT_SEED, backend=RENDER_BACKEND, repeats=3,
+                    populations=(None,)):
+    results = []
+    for cells, d in itertools.product(populations, days):
+        if next_day(d) is None:
+            continue
+        source, target = build_scene_for(d, seed, cells), build_scene_for(next_day(d), seed, cells)
+        # Both days are beating already when the morph starts
+        frame_pulse(source, 0), frame_pulse(target, 0)
+        layout_s, _ = _best_of(repeats, lambda: build_scene_for(next_day(d), seed, cells))
+        diff_s, transition = _best_of(
+            repeats, lambda: Transition(source, target, scene_rng(seed, d, STREAM_TIMELINE)))
+        scene_s = raster_s = 0.0
+        for step in range(MORPH_FRAMES):
+            seconds, scene = _best_of(repeats, lambda: transition.scene_at(morph_time(step)))
+            scene_s += seconds
+            seconds, _ = _best_of(repeats, lambda: render_scene(scene, 0.0, backend, *resolution))
+            raster_s += seconds
+        results.append({
+            "day": d,
+            "cells": source.cell_count,
+            "carried_over": int((transition.successor >= 0).sum()),
+            "born": int((transition.parent < 0).sum()),
+            "next_layout_ms": layout_s * 1000,
+            "diff_ms": diff_s * 1000,
+            "frame_scene_ms": scene_s * 1000 / MORPH_FRAMES,
+            "frame_raster_ms": raster_s * 1000 / MORPH_FRAMES,
+        })
+    return results
+
+
+# Time to first frame of a fresh server, from process start until the client
+# has the image; the target for a new replica
+TIME_TO_FIRST_FRAME_TARGET_S = 1.0
+# Longest a cold-start run may take before it is given up
+COLD_START_TIMEOUT_S = 120
+
+
+# Start `streamlit run app.py` in a new process and connect to it like a
+# browser: wait for the health check, open a session and read the app's
+# messages until the first frame image arrives, then fetch it. Returns the
+# seconds from process start until the server answered, and from then until
+# the frame was in the client's hands.
+async def _cold_start_run(env):
+    import socket
+
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+    from tornado.websocket import websocket_connect
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    url = f"127.0.0.1:{port}"
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app, "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        client = AsyncHTTPClient()
+        while True:
+            try:
+                await client.fetch(f"http://{url}/_stcore/health")
+                break
+            except (OSError, HTTPClientError):
+                if time.perf_counter() - start > COLD_START_TIMEOUT_S:
+                    raise TimeoutError("server did not start")
+                await asyncio.sleep(0.05)
+        ready = time.perf_counter()
+
+        ws = await websocket_connect(f"ws://{url}/_stcore/stream")
+        rerun = BackMsg()
+        rerun.rerun_script.query_string = ""
+        ws.write_message(rerun.SerializeToString(), binary=True)
+        while True:
+            payload = await ws.read_message()
+            if payload is None:
+                raise ConnectionError("session closed before the first frame")
+            msg = ForwardMsg()
+            msg.ParseFromString(payload)
+            if msg.WhichOneof("type") != "delta":
+                continue
+            element = msg.delta.new_element
+            if element.WhichOneof("type") == "imgs":
+                await client.fetch(f"http://{url}{element.imgs.imgs[0].url}")
+                break
+            if element.WhichOneof("type") == "markdown" and "data:image/" in element.markdown.body:
+                break
+        ws.close()
+        return ready - start, time.perf_counter() - ready
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# Time to first frame of `runs` fresh servers, without a frame store and with
+# the store (frame_store.py) when it holds frames
+def benchmark_cold_start(runs):
+    from frame_store import FRAME_STORE_PATH, open_store
+
+    variants = [("none", "")]
+    if FRAME_STORE_PATH and len(open_store(FRAME_STORE_PATH)):
+        variants.append(("frame_store", FRAME_STORE_PATH))
+    results = []
+    for name, path in variants:
+        env = dict(os.environ, FRAME_STORE_PATH=path)
+        for run in range(runs):
+            startup_s, first_frame_s = asyncio.run(_cold_start_run(env))
+            total = startup_s + first_frame_s
+            results.append({
+                "store": name,
+                "run": run,
+                "startup_ms": startup_s * 1000,
+                "first_frame_ms": first_frame_s * 1000,
+                "time_to_first_frame_ms": total * 1000,
+                "meets_target": total <= TIME_TO_FIRST_FRAME_TARGET_S,
+            })
+    return results
+
+
+def _codec_name(codec, setting):
+    return codec if setting is None else f"{codec}:{setting}"
+
+
+def _parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def _parse_codec(text):
+    codec, _, setting = text.partition(":")
+    if codec not in FRAME_CODEC_DEFAULTS:
+        raise argparse.ArgumentTypeError(f"unknown codec {codec!r}")
+    if setting:
+        return codec, int(setting)
+    return codec, FRAME_CODEC_DEFAULTS[codec]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, nargs="+", default=sorted(cell_data),
+                        choices=sorted(cell_data))
+    parser.add_argument("--resolutions", type=_parse_resolution, nargs="+",
+                        default=[_parse_resolution(r) for r in RESOLUTIONS],
+                        metavar="WxH")
+    parser.add_argument("--pulses", type=int, default=PULSE_FRAMES,
+                        help="number of pulse values between 0 and 1 (default: %(default)s)")
+    parser.add_argument("--backends", nargs="+", default=list(RENDER_BACKENDS),
+                        choices=list(RENDER_BACKENDS))
+    parser.add_argument("--codecs", type=_parse_codec, nargs="+", default=[("PNG", 6)],
+                        metavar="CODEC[:SETTING]", help="e.g. PNG:6 JPEG:90 WebP:80 Raw")
+    parser.add_argument("--cells", type=int, nargs="+", default=[],
+                        help="benchmark tissue-scale populations of these sizes "
+                             "instead of the day cultures")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="runs per measurement; the fastest counts (default: %(default)s)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[],
+                        help="also time a full batch of all days and pulses at the first "
+                             "resolution with these worker counts")
+    parser.add_argument("--morph", action="store_true",
+                        help="also time the morph of every day into the next at the first "
+                             "resolution")
+    parser.add_argument("--cold-start", type=int, default=0, metavar="RUNS",
+                        help="also time the first frame of this many fresh app servers, "
+                             "with and without the frame store")
+    parser.add_argument("--output", default="-", help="JSON output path, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    pulses = list(np.linspace(0.0, 1.0, args.pulses)) if args.pulses > 1 else [0.0]
+    results = benchmark_renderer(args.days, args.resolutions, pulses, args.backends,
+                                 args.codecs, args.seed, args.repeats, args.cells or (None,))
+    batch = benchmark_batch(args.days, args.resolutions[0], args.workers, args.codecs[0],
+                            args.seed, args.backends[0], args.repeats)
+    morph = (benchmark_morph(args.days, args.resolutions[0], args.seed, args.backends[0],
+                             args.repeats, args.cells or (None,))
+             if args.morph else [])
+    cold_start = benchmark_cold_start(args.cold_start) if args.cold_start else []
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "repeats": args.repeats,
+            "pulses": [float(p) for p in pulses],
+        },
+        "results": results,
+        "batch": batch,
+        "morph": morph,
+        "cold_start": cold_start,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    # Short human-readable summary on stderr
+    for r in results:
+        encode = ", ".join(f"{name} {e['ms_per_frame']:.1f} ms {e['bytes_per_frame'] / 1024:.0f} KB"
+                           for name, e in r["encode"].items())
+        print(f"{r['backend']:>5} {r['width']}x{r['height']} day {r['day']} "
+              f"({r['cells']} cells): "
+              f"layout {r['layout_ms']:.1f} ms, raster {r['raster_ms_mean']:.1f} ms "
+              f"(cold {r['raster_cold_ms']:.1f} ms), {encode}", file=sys.stderr)
+    for r in batch:
+        print(f"batch {r['width']}x{r['height']} {r['frames']} frames, {r['workers']} workers: "
+              f"{r['batch_ms']:.0f} ms", file=sys.stderr)
+    for r in morph:
+        print(f"morph day {r['day']} ({r['cells']} cells, {r['carried_over']} carried over, "
+              f"{r['born']} born): diff {r['diff_ms']:.1f} ms vs layout {r['next_layout_ms']:.1f} ms, "
+              f"{r['frame_scene_ms']:.1f} ms scene + {r['frame_raster_ms']:.1f} ms raster per frame",
+              file=sys.stderr)
+    for r in cold_start:
+        print(f"cold start ({r['store']}): first frame {r['time_to_first_frame_ms']:.0f} ms = "
+              f"{r['startup_ms']:.0f} ms startup + {r['first_frame_ms']:.0f} ms session, target "
+              f"{TIME_TO_FIRST_FRAME_TARGET_S * 1000:.0f} ms "
+              f"{'met' if r['meets_target'] else 'missed'}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
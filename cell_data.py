@@ -0,0 +1,135 @@
+"""Morphological and functional description of the cultured cardiac cells, day by day."""
+
+import os
+
+DEFAULT_CELL_DATA = {
+    1: {
+        "title": "Day 1: Immature Stage",
+        "shape": "Small, round, loosely attached cells",
+        "density": "Sparse distribution, minimal cell-cell interaction",
+        "nucleus": "Large, prominent, occupying most of the cytoplasm",
+        "cytoplasm": "Low actin filament density, no organized sarcomeres",
+        "contractility": "Very weak or absent, minimal spontaneous twitching",
+        "noise": "Low",
+        "functional_state": "Highly immature, incapable of coordinated beating",
+        "color": (255, 214, 204),  # Light pinkish
+        "beat": 0.2,  # Very weak beat
+        "sync_level": 0.1,  # Almost no synchronization
+        "cell_count": 8,  # Fewer cells
+        "debris_level": 0.1,  # Minimal debris
+    },
+    2: {
+        "title": "Day 2: Initial Beating",
+        "shape": "Slight elongation, cells begin forming small clusters",
+        "density": "Moderate increase in cell-cell interaction",
+        "nucleus": "Still prominent, but relative cytoplasmic volume increasing",
+        "cytoplasm": "More structured, actin filaments start forming",
+        "contractility": "Few healthy cells start mild beating, but not synchronized",
+        "noise": "Low",
+        "functional_state": "Early contractions observed, but weak and inconsistent",
+        "color": (255, 204, 204),  # Light pink
+        "beat": 0.4,  # Weak beat
+        "sync_level": 0.2,  # Little synchronization
+        "cell_count": 12,  # More cells
+        "debris_level": 0.1,  # Minimal debris
+    },
+    3: {
+        "title": "Day 3: Sparse Mean Beating Begins",
+        "shape": "Cells elongate, slight alignment observed",
+        "density": "Increased junction formation, more intercellular connectivity",
+        "nucleus": "Starting to appear smaller relative to expanding cytoplasm",
+        "cytoplasm": "Early sarcomere structures begin forming, weak striations visible",
+        "contractility": "Few healthy cells begin to show mean beating, still uncoordinated",
+        "noise": "Low",
+        "functional_state": "Patchy contractions, but improved over Day 2",
+        "color": (255, 204, 204),  # Light pink
+        "beat": 0.5,  # Stronger beat
+        "sync_level": 0.3,  # More synchronization
+        "cell_count": 16,  # More cells forming
+        "debris_level": 0.2,  # Slight increase in debris
+    },
+    4: {
+        "title": "Day 4: Stronger Contractions in Some Cells",
+        "shape": "More defined, elongated, and better aligned cells",
+        "density": "High, beginning of monolayer-like structures",
+        "nucleus": "Evenly distributed, organized within the cell",
+        "cytoplasm": "Denser filaments, early Z-line structures",
+        "contractility": "More healthy cells with mean beating, improved rhythmicity",
+        "noise": "Low",
+        "functional_state": "Early functional cardiomyocyte-like properties emerge",
+        "color": (255, 153, 153),  # Medium pink
+        "beat": 0.7,  # Medium-strong beat
+        "sync_level": 0.5,  # Half synchronized
+        "cell_count": 20,  # Higher density
+        "debris_level": 0.2,  # Still low debris
+    },
+    5: {
+        "title": "Day 5: Moderate Synchronization in Beating",
+        "shape": "Well-elongated, aligned along parallel lines",
+        "density": "High, forming strong intercellular junctions",
+        "nucleus": "Less prominent, as cytoplasm grows in volume",
+        "cytoplasm": "Well-formed sarcomeres with clear striations",
+        "contractility": "Moderate contraction force, clear mean beating pattern",
+        "noise": "Moderate",
+        "functional_state": "Stronger contractions, beginning of synchronized function",
+        "color": (255, 102, 102),  # Stronger pink
+        "beat": 0.8,  # Strong beat
+        "sync_level": 0.7,  # Good synchronization
+        "cell_count": 24,  # High density
+        "debris_level": 0.3,  # Moderate debris
+    },
+    6: {
+        "title": "Day 6: Peak Contraction Activity",
+        "shape": "Fully elongated, clear cardiomyocyte morphology",
+        "density": "Strongly connected monolayer, peak cell-to-cell adhesion",
+        "nucleus": "Evenly spread, well-integrated",
+        "cytoplasm": "Densely packed sarcomeres, clear actin-myosin interactions",
+        "contractility": "High contraction intensity, peak synchronization in mean beating",
+        "noise": "Slightly increasing due to metabolic stress",
+        "functional_state": "Highest functionality, optimal contraction rhythm",
+        "color": (255, 51, 51),  # Bright red
+        "beat": 1.0,  # Maximum beat
+        "sync_level": 0.9,  # Highly synchronized
+        "cell_count": 28,  # Maximum density
+        "debris_level": 0.4,  # Increasing debris
+    },
+    7: {
+        "title": "Day 7: Damage & Fragmentation Begins",
+        "shape": "Fragmentation starts, some cells detach",
+        "density": "Decreasing due to stress-induced detachment",
+        "nucleus": "Some nuclei appear condensed or fragmented",
+        "cytoplasm": "Signs of actin filament disassembly, disrupted sarcomeres",
+        "contractility": "Weaker contractions, loss of synchronization, some dead zones",
+        "noise": "High, increased debris from cell detachment",
+        "functional_state": "Declining function, early damage evident",
+        "color": (204, 51, 51),  # Darker red
+        "beat": 0.6,  # Weakening beat
+        "sync_level": 0.5,  # Losing synchronization
+        "cell_count": 20,  # Decreasing density
+        "debris_level": 0.7,  # High debris
+    },
+    8: {
+        "title": "Day 8: Significant Cell Damage",
+        "shape": "High fragmentation, cell integrity severely compromised",
+        "density": "Significant cell loss, visible gaps in the network",
+        "nucleus": "Some remain intact, others fragmented or missing",
+        "cytoplasm": "Loss of sarcomere organization, widespread cellular breakdown",
+        "contractility": "Very weak or absent, most cells cease contracting",
+        "noise": "Extremely high, cell fragments and debris dominate the field",
+        "functional_state": "Experiment ends as contraction ceases and cells deteriorate",
+        "color": (153, 51, 51),  # Brownish red
+        "beat": 0.2,  # Very weak beat
+        "sync_level": 0.2,  # Almost no synchronization
+        "cell_count": 12,  # Few remaining cells
+        "debris_level": 0.9,  # Maximum debris
+    }
+}
+
+# Measurements replace the numbers above when CELL_DATA_PATH names a dataset
+# (datasets.py); the version identifies the data they were read from
+if os.environ.get("CELL_DATA_PATH"):
+    from datasets import load_configured_cell_data
+
+    cell_data, CELL_DATA_VERSION = load_configured_cell_data(DEFAULT_CELL_DATA)
+else:
+    cell_data, CELL_DATA_VERSION = DEFAULT_CELL_DATA, "built-in"
@@ -0,0 +1,208 @@
+"""Experimental datasets that drive the animation in place of the built-in day data.
+
+A dataset is a CSV or Parquet file, or a directory of them, of time-lapse
+measurements with one row per well and day. It is scanned with pyarrow batch
+by batch and only the needed columns are read, so files larger than memory
+can be used. Per-day means over the selected wells are accumulated as the
+batches stream past. The measured metrics then replace the render parameters
+of cell_data:
+
+  beat          beat rate, relative to the day with the highest mean rate
+  sync_level    sync index, clipped to [0, 1]
+  cell_count    cell count, relative to the most populated day, on the scale
+                of the built-in culture (at most as many cells as its peak day)
+  debris_level  debris fraction, clipped to [0, 1]; optional
+
+Only the days of the built-in data are used, and days without measurements
+keep their built-in values. For charts, well_day_means() bins the
+measurements by day and well in the same streaming way. Summarize a dataset with
+
+    python datasets.py measurements.parquet --wells A01 A02
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Column of each measured quantity in a dataset
+DATASET_COLUMNS = {
+    "day": "day",
+    "well": "well",
+    "beat_rate": "beat_rate",
+    "sync_index": "sync_index",
+    "cell_count": "cell_count",
+    "debris": "debris",
+}
+# Measured quantities that are averaged per day; debris may be missing
+METRICS = ("beat_rate", "sync_index", "cell_count", "debris")
+OPTIONAL_METRICS = ("debris",)
+# Rows per scanned batch, and batches read ahead of the one being aggregated
+SCAN_BATCH_ROWS = 1 << 20
+SCAN_READAHEAD = 2
+
+
+def open_dataset(path):
+    # CSV files are recognized by their suffix; anything else is read as Parquet,
+    # one column chunk at a time rather than buffering whole row groups
+    if str(path).lower().endswith((".csv", ".csv.gz")):
+        return ds.dataset(path, format="csv")
+    return ds.dataset(path, format=ds.ParquetFileFormat(
+        default_fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=False)))
+
+
+# The dataset, the row filter for the given days and wells, and the metrics present
+def _scan_setup(path, days, wells, columns):
+    dataset = open_dataset(path)
+    names = set(dataset.schema.names)
+    required = ["day"] + [m for m in METRICS if m not in OPTIONAL_METRICS]
+    missing = [columns[m] for m in required if columns[m] not in names]
+    if missing:
+        raise ValueError(f"{path}: missing columns {missing}")
+    condition = ds.field(columns["day"]).isin(sorted(days))
+    if wells:
+        condition &= ds.field(columns["well"]).isin(list(wells))
+    return dataset, condition, [m for m in METRICS if columns[m] in names]
+
+
+def _scanner(dataset, names, condition):
+    # Little readahead keeps memory bounded by a few batches, whatever the file size
+    return dataset.scanner(columns=names, filter=condition, batch_size=SCAN_BATCH_ROWS,
+                           batch_readahead=SCAN_READAHEAD, fragment_readahead=1)
+
+
+# Streaming per-day means of the measured metrics over the given wells (all
+# wells by default), as {"days": (D,), "wells": (D,), metric: (D,)} arrays;
+# missing values are skipped and metrics absent from the file are NaN
+def day_means(path, days, wells=None, columns=DATASET_COLUMNS):
+    dataset, condition, metrics = _scan_setup(path, days, wells, columns)
+    days = np.asarray(sorted(days))
+    # Day positions are looked up in a dense table covering the requested days
+    lookup = np.full(days.max() + 1, -1)
+    lookup[days] = np.arange(len(days))
+
+    sums = {m: np.zeros(len(days)) for m in metrics}
+    counts = {m: np.zeros(len(days)) for m in metrics}
+    rows = np.zeros(len(days))
+    scanner = _scanner(dataset, [columns["day"]] + [columns[m] for m in metrics], condition)
+    for batch in scanner.to_batches():
+        day = lookup[batch.column(0).to_numpy(zero_copy_only=False).astype(int)]
+        rows += np.bincount(day, minlength=len(days))
+        for k, m in enumerate(metrics, start=1):
+            values = batch.column(k).cast(pa.float64()).to_numpy(zero_copy_only=False)
+            valid = ~np.isnan(values)
+            sums[m] += np.bincount(day[valid], values[valid], len(days))
+            counts[m] += np.bincount(day[valid], minlength=len(days))
+
+    means = {"days": days, "wells": rows.astype(int)}
+    for m in METRICS:
+        if m in metrics:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means[m] = sums[m] / counts[m]
+        else:
+            means[m] = np.full(len(days), np.nan)
+    return means
+
+
+# Streaming means of the measured metrics per (day, well), as a DataFrame with
+# columns day, well and one per metric present in the file. Every batch is
+# reduced to its (day, well) groups as it is read, so only one row per group
+# and batch is kept.
+def well_day_means(path, days, wells=None, columns=DATASET_COLUMNS):
+    # Only the charts need pandas. Scanning with pyarrow.dataset imports it as
+    # well, so with a dataset configured it is loaded at start either way.
+    import pandas as pd
+
+    dataset, condition, metrics = _scan_setup(path, days, wells, columns)
+    names = [columns[m] for m in metrics]
+    partials = []
+    for batch in _scanner(dataset, [columns["day"], columns["well"]] + names, condition).to_batches():
+        partials.append(pa.Table.from_batches([batch]).group_by([columns["day"], columns["well"]])
+                        .aggregate([(name, agg) for name in names for agg in ("sum", "count")]))
+    if not partials:
+        return pd.DataFrame(columns=["day", "well"] + metrics)
+    groups = (pa.concat_tables(partials).group_by([columns["day"], columns["well"]])
+              .aggregate([(f"{name}_{agg}", "sum") for name in names for agg in ("sum", "count")]))
+    frame = pd.DataFrame({"day": groups[columns["day"]].to_numpy(),
+                          "well": groups[columns["well"]].to_pylist()})
+    for m, name in zip(metrics, names):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frame[m] = (groups[f"{name}_sum_sum"].to_numpy(zero_copy_only=False)
+                        / groups[f"{name}_count_sum"].to_numpy(zero_copy_only=False))
+    return frame.sort_values(["day", "well"], ignore_index=True)
+
+
+# Copy of `base` (day -> parameters, like cell_data) with the numeric render
+# parameters taken from the dataset's per-day means
+def load_cell_data(path, base, wells=None, columns=DATASET_COLUMNS):
+    means = day_means(path, base, wells, columns)
+    measured = {}
+    with np.errstate(invalid="ignore"):
+        beat = means["beat_rate"] / np.nanmax(means["beat_rate"], initial=0)
+        count = means["cell_count"] / np.nanmax(means["cell_count"], initial=0)
+    peak_count = max(day["cell_count"] for day in base.values())
+    for k, d in enumerate(means["days"].tolist()):
+        day = dict(base[d], wells=int(means["wells"][k]))
+        if not np.isnan(beat[k]):
+            day["beat"] = float(beat[k])
+        if not np.isnan(means["sync_index"][k]):
+            day["sync_level"] = float(np.clip(means["sync_index"][k], 0, 1))
+        if not np.isnan(count[k]):
+            day["cell_count"] = max(1, int(round(count[k] * peak_count)))
+        if not np.isnan(means["debris"][k]):
+            day["debris_level"] = float(np.clip(means["debris"][k], 0, 1))
+        measured[d] = day
+    return measured
+
+
+# Short digest of a dataset's files, their sizes and modification times, and
+# the selected wells; it changes whenever the data read from them can
+def dataset_version(path, wells=None):
+    digest = hashlib.sha256(json.dumps([str(path), sorted(wells or [])]).encode())
+    for name in sorted(open_dataset(path).files):
+        stat = os.stat(name)
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+# Wells selected by the comma-separated CELL_DATA_WELLS environment variable, None for all
+def configured_wells():
+    return [w for w in os.environ.get("CELL_DATA_WELLS", "").split(",") if w] or None
+
+
+# Cell data from the dataset named by the CELL_DATA_PATH environment variable,
+# averaged over the configured wells, and the dataset's version. The result is
+# also left in the environment, so render worker processes started later pick
+# it up instead of scanning the dataset again.
+def load_configured_cell_data(base):
+    path, wells = os.environ["CELL_DATA_PATH"], configured_wells()
+    version = dataset_version(path, wells)
+    loaded = json.loads(os.environ.get("CELL_DATA_LOADED", "null"))
+    if loaded and loaded["version"] == version:
+        return {int(d): day for d, day in loaded["days"].items()}, version
+    data = load_cell_data(path, base, wells)
+    os.environ["CELL_DATA_LOADED"] = json.dumps({"version": version, "days": data})
+    return data, version
+
+
+def main(argv=None):
+    from cell_data import DEFAULT_CELL_DATA
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="CSV or Parquet file, or a directory of Parquet files")
+    parser.add_argument("--wells", nargs="+", help="only average these wells")
+    args = parser.parse_args(argv)
+
+    data = load_cell_data(args.path, DEFAULT_CELL_DATA, args.wells)
+    print(f"{'day':>3} {'wells':>7} {'beat':>6} {'sync':>6} {'cells':>6} {'debris':>6}")
+    for d, day in data.items():
+        print(f"{d:>3} {day['wells']:>7} {day['beat']:>6.2f} {day['sync_level']:>6.2f} "
+              f"{day['cell_count']:>6} {day['debris_level']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
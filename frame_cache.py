@@ -0,0 +1,78 @@
+"""In-memory LRU store for encoded frames."""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def frame_nbytes(data):
+    return data.nbytes if isinstance(data, np.ndarray) else len(data)
+
+
+# Encoded frames shared by all sessions, evicted least-recently-used first
+# once the stored bytes exceed the budget
+class FrameCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        # Membership test that neither counts as a lookup nor refreshes the entry
+        with self._lock:
+            return key in self._frames
+
+    def get(self, key):
+        with self._lock:
+            data = self._frames.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.nbytes -= frame_nbytes(old)
+            # A frame larger than the whole budget is never stored
+            size = frame_nbytes(data)
+            if size > self.max_bytes:
+                return
+            self._frames[key] = data
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.nbytes -= frame_nbytes(evicted)
+                self.evictions += 1
+
+    def get_or_render(self, key, render):
+        data = self.get(key)
+        if data is None:
+            # Rendered outside the lock so other sessions are not blocked
+            data = render()
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "frames": len(self._frames),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,221 @@
+"""HTTP frame service for dashboards that embed the animation.
+
+Serves the frames of the app without a Streamlit session per viewer:
+
+    GET /frame?day=3&pulse=0&seed=0&size=800x600    one encoded frame
+    GET /sequence?day=3                             URLs of a day's frames, as JSON
+    GET /stats                                      cache and request counts, as JSON
+    GET /metrics                                    render stats in the Prometheus format
+
+/frame also takes codec, cells (a population size) and morph (a step of the
+morph into the next day); /sequence takes the same parameters except pulse,
+and morph=1 to append the morph into the next day.
+
+Frames come from the same shared cache as the app, frame_store.open_frame_cache():
+the frame store for the frames of the default animation, memory for the
+others. A client stepping through seeds, codecs or populations therefore only
+churns this process's LRU cache; it never adds to the store the app shares.
+Missing frames are rendered in the worker pool of batch_render.py,
+and cache lookups and stores, which may wait for the frame store's file
+lock, run in threads, so the event loop only parses requests and copies
+bytes. Concurrent requests for a frame that is
+being rendered wait for that render instead of starting their own. Run it with
+
+    python frame_server.py --port 8600
+"""
+
+import argparse
+import asyncio
+import os
+from urllib.parse import urlencode
+
+import tornado.web
+
+import instrumentation
+from batch_render import (
+    RENDER_WORKERS,
+    frame_job,
+    get_executor,
+    job_labels,
+    morph_pulse_index,
+    render_job_traced,
+)
+from cell_data import cell_data
+from frame_store import open_frame_cache
+from population import POPULATION_SIZES
+from renderer import (
+    DEFAULT_SEED,
+    FRAME_CODEC,
+    FRAME_CODECS,
+    MAX_SEED,
+    OUTPUT_SIZES,
+    PULSE_FRAMES,
+    RENDER_BACKEND,
+    SCENE_HEIGHT,
+    SCENE_WIDTH,
+)
+from timeline import MORPH_FRAMES, next_day
+
+FRAME_SERVER_PORT = int(os.environ.get("FRAME_SERVER_PORT", 8600))
+# Browser cache lifetime of a frame, in seconds. The same URL gives the same
+# frame until the rendering code or day data change.
+FRAME_MAX_AGE = 3600
+
+
+# Frames by FrameJob, rendered in the worker pool on a miss. Renders of the
+# same frame requested while one is under way are shared.
+class FrameService:
+    def __init__(self, cache, workers=RENDER_WORKERS):
+        self.cache = cache
+        self.executor = get_executor(max(1, workers))
+        self.requests = 0
+        self.renders = 0
+        self.coalesced = 0
+        self._rendering = {}    # FrameJob -> future of its encoded frame
+
+    async def frame(self, job):
+        self.requests += 1
+        data = await asyncio.to_thread(self.cache.get, job)
+        if data is not None:
+            return data
+        future = self._rendering.get(job)
+        if future is None:
+            future = self._rendering[job] = asyncio.ensure_future(self._render(job))
+            future.add_done_callback(lambda _: self._rendering.pop(job, None))
+        else:
+            self.coalesced += 1
+        # A client that goes away must not cancel the render the others wait for
+        return await asyncio.shield(future)
+
+    async def _render(self, job):
+        self.renders += 1
+        loop = asyncio.get_running_loop()
+        data, trace = await loop.run_in_executor(self.executor, render_job_traced, job)
+        instrumentation.record_frame(trace)
+        await asyncio.to_thread(self.cache.put, job, data)
+        return data
+
+    def stats(self):
+        return {"requests": self.requests, "renders": self.renders, "coalesced": self.coalesced,
+                "rendering": len(self._rendering), "cache": self.cache.stats()}
+
+
+class _ServiceHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def _int(self, name, choices=None, default=None, required=False):
+        value = self.get_query_argument(name, None)
+        if value is None or value == "":
+            if required:
+                raise tornado.web.HTTPError(400, reason=f"{name} is required")
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason=f"{name} must be an integer")
+        if choices is not None and value not in choices:
+            if isinstance(choices, range) and len(choices) > 100:
+                raise tornado.web.HTTPError(
+                    400, reason=f"{name} must be from {choices.start} to {choices.stop - 1}")
+            raise tornado.web.HTTPError(400, reason=f"{name} must be one of {list(choices)}")
+        return value
+
+    # Frame parameters shared by /frame and /sequence, validated
+    def frame_args(self):
+        day = self._int("day", sorted(cell_data), required=True)
+        seed = self._int("seed", range(MAX_SEED), default=DEFAULT_SEED)
+        size = self.get_query_argument("size", f"{SCENE_WIDTH}x{SCENE_HEIGHT}")
+        sizes = {f"{w}x{h}": (w, h) for w, h in OUTPUT_SIZES}
+        if size not in sizes:
+            raise tornado.web.HTTPError(400, reason=f"size must be one of {list(sizes)}")
+        codec = self.get_query_argument("codec", FRAME_CODEC)
+        if FRAME_CODECS.get(codec, (None,))[0] is None:
+            codecs = [c for c, (fmt, _) in FRAME_CODECS.items() if fmt]
+            raise tornado.web.HTTPError(400, reason=f"codec must be one of {codecs}")
+        cells = self._int("cells", POPULATION_SIZES)
+        return {"day": day, "seed": seed, "size": sizes[size], "codec": codec, "cells": cells}
+
+
+class FrameHandler(_ServiceHandler):
+    async def get(self):
+        args = self.frame_args()
+        pulse = self._int("pulse", range(PULSE_FRAMES), default=0)
+        morph = self._int("morph", range(MORPH_FRAMES))
+        if morph is not None and next_day(args["day"]) is None:
+            raise tornado.web.HTTPError(400, reason=f"day {args['day']} has no next day")
+        job = frame_job(args["day"], pulse, args["seed"], args["size"], RENDER_BACKEND,
+                        args["codec"], None, args["cells"], morph)
+        data = await self.service.frame(job)
+        self.set_header("Content-Type", FRAME_CODECS[job.codec][1])
+        self.set_header("Cache-Control", f"public, max-age={FRAME_MAX_AGE}")
+        self.finish(bytes(data))
+
+
+# Frame URLs of a day, with its morph into the next day when asked for. The
+# frames are rendered before the response is sent, so the URLs hit the cache.
+class SequenceHandler(_ServiceHandler):
+    async def get(self):
+        args = self.frame_args()
+        morph = self._int("morph", (0, 1), default=0) and next_day(args["day"]) is not None
+        query = {"day": args["day"], "seed": args["seed"],
+                 "size": "{}x{}".format(*args["size"]), "codec": args["codec"]}
+        if args["cells"] is not None:
+            query["cells"] = args["cells"]
+        steps = [(i, None) for i in range(PULSE_FRAMES)]
+        if morph:
+            steps += [(morph_pulse_index(k), k) for k in range(MORPH_FRAMES)]
+        jobs = [frame_job(args["day"], i, args["seed"], args["size"], RENDER_BACKEND,
+                          args["codec"], None, args["cells"], k) for i, k in steps]
+        await asyncio.gather(*(self.service.frame(job) for job in jobs))
+        urls = []
+        for i, k in steps:
+            step = dict(query, pulse=i, **({} if k is None else {"morph": k}))
+            urls.append(self.reverse_url("frame") + "?" + urlencode(step))
+        self.write({"day": args["day"], "title": cell_data[args["day"]]["title"],
+                    "pulse_frames": PULSE_FRAMES, "labels": [job_labels(job) for job in jobs],
+                    "frames": urls})
+
+
+class StatsHandler(_ServiceHandler):
+    def get(self):
+        self.write(self.service.stats())
+
+
+class MetricsHandler(_ServiceHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(instrumentation.prometheus_text())
+
+
+def make_app(service):
+    args = {"service": service}
+    return tornado.web.Application([
+        tornado.web.url(r"/frame", FrameHandler, args, name="frame"),
+        tornado.web.url(r"/sequence", SequenceHandler, args),
+        tornado.web.url(r"/stats", StatsHandler, args),
+        tornado.web.url(r"/metrics", MetricsHandler, args),
+    ])
+
+
+async def serve(port=FRAME_SERVER_PORT, address="", workers=RENDER_WORKERS):
+    service = FrameService(open_frame_cache(), workers)
+    server = make_app(service).listen(port, address)
+    print(f"serving frames on port {port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=FRAME_SERVER_PORT)
+    parser.add_argument("--address", default="")
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS)
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.port, args.address, args.workers))
+
+
+if __name__ == "__main__":
+    main()
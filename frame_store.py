@@ -0,0 +1,309 @@
+"""Persistent frame store shared by every server process on a host.
+
+Frames are appended to a data file that readers memory-map, and located
+through an index of fixed-size records (key digest, offset, length) that is
+only ever appended to. Readers look frames up in their copy of the index and
+return views into the mapping: no locks, no copies, and the frame bytes live
+once in the page cache however many processes serve them. On a miss they
+read the index records added since their last look. Writers take turns
+through a file lock, write the frame first and its index record after, so a
+reader never finds a record whose data is not there yet. The data file grows
+in DATA_CHUNK steps, so readers seldom have to map it again.
+
+Encoded frames are stored as they are and come back as memoryviews; Raw
+frames come back as read-only arrays over the mapping. The store only keeps
+the frames of the default animation (is_default_frame), which the build step
+and the app's warm-up render: the store never evicts, so frames of seeds and
+settings that clients pick go to an in-memory LRU overflow cache instead, as
+do all frames once the store holds FRAME_STORE_MB.
+
+Each version of the rendering code and day data gets its own directory, so a
+deployment never serves frames rendered by another one and restarts find
+their frames already there. The default animation can be rendered ahead of
+time as a build step, so the first viewer of a new replica does not wait:
+
+    python frame_store.py build
+    python frame_store.py prune     # remove the stores of other versions
+"""
+
+import argparse
+import fcntl
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from batch_render import prefetch_frames, sequence_jobs
+from cell_data import CELL_DATA_VERSION, cell_data
+from frame_cache import FrameCache
+from renderer import (
+    DEFAULT_SEED,
+    FRAME_CODEC,
+    FRAME_CODEC_DEFAULTS,
+    FRAME_CODECS,
+    OUTPUT_SIZES,
+    RENDER_BACKEND,
+)
+
+# Directory of the stores, one per render version; empty to keep frames in memory only
+FRAME_STORE_PATH = os.environ.get("FRAME_STORE_PATH",
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                               "frame_store"))
+# Largest size of one store's data, in megabytes
+FRAME_STORE_MB = float(os.environ.get("FRAME_STORE_MB", 1024))
+# Memory budget of a server process's frame cache, in megabytes; with a store
+# only the frames it does not keep are held in memory
+FRAME_CACHE_MB = float(os.environ.get("FRAME_CACHE_MB", 64))
+# Output sizes built by default: the design size, which desktop browsers get
+# until they have reported their width, and the size sent to phones
+# (app.pick_output_size)
+DEFAULT_STORE_SIZES = [(800, 600), (480, 360)]
+# Modules whose code decides what a frame looks like
+RENDER_MODULES = ("renderer", "morphology", "population", "beating", "timeline", "spatial",
+                  "cell_data")
+
+DATA_FILE = "frames.bin"
+INDEX_FILE = "index.bin"
+LOCK_FILE = "writer.lock"
+# Index record: key digest, data offset, data length
+RECORD = struct.Struct("<16sQQ")
+# The data file grows by this many bytes at a time
+DATA_CHUNK = 64 << 20
+
+
+# Digest of the rendering code and the day data; frames rendered under a
+# different version may look different
+def render_version():
+    digest = hashlib.sha256(CELL_DATA_VERSION.encode())
+    for name in RENDER_MODULES:
+        with open(sys.modules[name].__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# Whether a frame belongs to the default animation: a culture at one of the
+# output sizes with the default seed, renderer and codec setting. The store
+# keeps only these, so its keys are bounded whatever clients ask for.
+def is_default_frame(key):
+    return (key.seed == DEFAULT_SEED and key.cells is None and key.backend == RENDER_BACKEND
+            and key.codec == FRAME_CODEC and key.setting == FRAME_CODEC_DEFAULTS[key.codec]
+            and tuple(key.size) in OUTPUT_SIZES)
+
+
+def _digest(key):
+    return hashlib.blake2b(repr(tuple(key)).encode(), digest_size=16).digest()
+
+
+# Frames keyed by FrameJob in the store under `root` for the current render
+# version; same interface as FrameCache. Frames `keep` rejects (all kept when
+# it is None) go to the overflow.
+class FrameStore:
+    def __init__(self, root, max_bytes, overflow=None, keep=is_default_frame):
+        self.path = os.path.join(root, render_version())
+        os.makedirs(self.path, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+        self.keep = keep
+        # Lookups are counted without a lock, so the counts are approximate
+        self.hits = 0
+        self.misses = 0
+        self._index = {}        # digest -> (offset, length)
+        self._index_pos = 0     # bytes of the index file read so far
+        self._end = 0           # end of the indexed data
+        self._map = None
+        self._data_fd = os.open(os.path.join(self.path, DATA_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._index_fd = os.open(os.path.join(self.path, INDEX_FILE),
+                                 os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._lock_fd = os.open(os.path.join(self.path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        # Serializes index reads and writes within this process
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def _refresh(self):
+        # Take in the records appended since the last refresh; a record still
+        # being written is left for the next one
+        size = os.fstat(self._index_fd).st_size
+        count = (size - self._index_pos) // RECORD.size
+        if count <= 0:
+            return
+        records = os.pread(self._index_fd, count * RECORD.size, self._index_pos)
+        for digest, offset, length in RECORD.iter_unpack(records):
+            self._index[digest] = (offset, length)
+            self._end = max(self._end, offset + length)
+        self._index_pos += count * RECORD.size
+
+    def _lookup(self, digest):
+        entry = self._index.get(digest)
+        if entry is None:
+            with self._lock:
+                self._refresh()
+            entry = self._index.get(digest)
+        return entry
+
+    def _view(self, key, offset, length):
+        frame_map = self._map
+        if frame_map is None or offset + length > len(frame_map):
+            # Mapped again at the data file's current size. Views into the old
+            # mapping keep it alive until they are gone.
+            frame_map = self._map = mmap.mmap(self._data_fd, os.fstat(self._data_fd).st_size,
+                                              access=mmap.ACCESS_READ)
+        view = memoryview(frame_map)[offset:offset + length]
+        if FRAME_CODECS[key.codec][0] is None:
+            width, height = key.size
+            return np.frombuffer(view, dtype=np.uint8).reshape(height, width, -1)
+        return view
+
+    def __len__(self):
+        return len(self._index) + (len(self.overflow) if self.overflow is not None else 0)
+
+    def __contains__(self, key):
+        if self._lookup(_digest(key)) is not None:
+            return True
+        return self.overflow is not None and key in self.overflow
+
+    def get(self, key):
+        entry = self._lookup(_digest(key))
+        if entry is not None:
+            self.hits += 1
+            return self._view(key, *entry)
+        data = self.overflow.get(key) if self.overflow is not None else None
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if self.keep is not None and not self.keep(key):
+            if self.overflow is not None:
+                self.overflow.put(key, data)
+            return
+        digest = _digest(key)
+        if isinstance(data, np.ndarray):
+            payload = memoryview(np.ascontiguousarray(data)).cast("B")
+        else:
+            payload = memoryview(data)
+        with self._lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if digest in self._index:
+                    return
+                offset = self._end
+                if offset + len(payload) > self.max_bytes:
+                    if self.overflow is not None:
+                        self.overflow.put(key, data)
+                    return
+                size = os.fstat(self._data_fd).st_size
+                if offset + len(payload) > size:
+                    os.ftruncate(self._data_fd,
+                                 -(-(offset + len(payload)) // DATA_CHUNK) * DATA_CHUNK)
+                os.pwrite(self._data_fd, payload, offset)
+                # A record torn by a writer that died halfway through is dropped
+                index_size = os.fstat(self._index_fd).st_size
+                if index_size % RECORD.size:
+                    os.ftruncate(self._index_fd, index_size - index_size % RECORD.size)
+                os.write(self._index_fd, RECORD.pack(digest, offset, len(payload)))
+                self._refresh()
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def get_or_render(self, key, render):
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        overflow = self.overflow.stats() if self.overflow is not None else {}
+        lookups = self.hits + self.misses
+        return {
+            "frames": len(self),
+            "bytes": self._end + overflow.get("bytes", 0),
+            "max_bytes": self.max_bytes + overflow.get("max_bytes", 0),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": overflow.get("evictions", 0),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stored_frames": len(self._index),
+            "stored_bytes": self._end,
+        }
+
+
+# Whether `path` is the store of some render version: a directory named by a
+# version digest that holds store files. Anything else under the root is
+# left alone.
+def is_store(path):
+    return (re.fullmatch(r"[0-9a-f]{16}", os.path.basename(path)) is not None
+            and os.path.isdir(path)
+            and any(os.path.exists(os.path.join(path, f)) for f in (INDEX_FILE, DATA_FILE)))
+
+
+def open_store(root=FRAME_STORE_PATH, max_mb=FRAME_STORE_MB, overflow=None,
+               keep=is_default_frame):
+    return FrameStore(root, int(max_mb * 1024 * 1024), overflow, keep)
+
+
+# Frame cache of a server process: the store under `root` with an in-memory
+# overflow, or memory only when there is no store or its directory is not
+# writable (e.g. in a read-only image)
+def open_frame_cache(root=FRAME_STORE_PATH, memory_mb=FRAME_CACHE_MB):
+    memory = FrameCache(int(memory_mb * 1024 * 1024))
+    if not root:
+        return memory
+    try:
+        return open_store(root, overflow=memory)
+    except OSError as e:
+        print(f"Frame store unavailable, keeping frames in memory: {e}", file=sys.stderr)
+        return memory
+
+
+# Jobs of the default animation: every day with its morph into the next, for
+# the default seed, renderer and codec
+def default_jobs(sizes=DEFAULT_STORE_SIZES, codec=FRAME_CODEC, backend=RENDER_BACKEND):
+    return [job for size in sizes
+            for job in sequence_jobs(sorted(cell_data), DEFAULT_SEED, backend, codec, None, size,
+                                     morph=True)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=FRAME_STORE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="render the default animation into the store")
+    build.add_argument("--sizes", nargs="+", default=[f"{w}x{h}" for w, h in DEFAULT_STORE_SIZES],
+                       help="output sizes as WIDTHxHEIGHT")
+    build.add_argument("--codec", default=FRAME_CODEC,
+                       choices=[c for c, (fmt, _) in FRAME_CODECS.items() if fmt])
+    build.add_argument("--backend", default=RENDER_BACKEND)
+    sub.add_parser("prune", help="remove the stores of other render versions")
+    args = parser.parse_args(argv)
+
+    if args.command == "prune":
+        current = render_version()
+        for name in os.listdir(args.path):
+            if name != current and is_store(os.path.join(args.path, name)):
+                shutil.rmtree(os.path.join(args.path, name))
+                print(f"removed {name}")
+        return
+
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes]
+    # Everything the build renders is kept, whatever its codec and renderer
+    store = open_store(args.path, keep=None)
+    start = time.perf_counter()
+    rendered = prefetch_frames(store, default_jobs(sizes, args.codec, args.backend))
+    stats = store.stats()
+    print(f"{rendered} frames rendered in {time.perf_counter() - start:.1f} s; {store.path} "
+          f"holds {stats['stored_frames']} frames, {stats['stored_bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Render instrumentation: per-stage wall times, draw primitive counts and counters.
+
+Stages of the frame path (layout sampling, the drawing of each layer, PNG
+encoding, display) are timed with `stage(name)`. Inside a `frame(...)` block
+the stage times and primitive counts are gathered into one trace and recorded
+together when the frame is done, labelled with the frame's day and scene, so
+every frame adds one observation per stage it went through. Worker processes
+hand their traces back with the frames (batch_render.py). Outside a frame a
+stage is recorded right away with the labels it is given.
+
+Observations go into rolling histograms that keep cumulative bucket counts,
+as Prometheus expects, and the most recent ROLLING_WINDOW values for
+percentiles. Nothing here depends on Streamlit: snapshot() gives a
+JSON-friendly dict and prometheus_text() the text exposition format.
+
+Set RENDER_STATS=0 to turn recording off.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Recording can be switched off for benchmarks of the bare render path
+ENABLED = os.environ.get("RENDER_STATS", "1") != "0"
+# Recent observations kept per histogram for percentiles
+ROLLING_WINDOW = 512
+
+# Histograms: help text and upper bucket bounds
+HISTOGRAMS = {
+    "render_stage_seconds": ("Wall time of one stage of a frame",
+                             (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                              0.5, 1.0, 2.5, 5.0, 10.0)),
+    "render_frame_seconds": ("Wall time of a whole frame, from scene to encoded bytes",
+                             (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                              5.0, 10.0, 30.0)),
+    "render_frame_primitives": ("Draw primitives rasterized for one frame",
+                                (10, 100, 1000, 10_000, 100_000, 1_000_000)),
+}
+COUNTERS = {
+    "render_primitives_total": "Draw primitives rasterized, per layer",
+    "render_frames_total": "Frames rendered",
+}
+
+
+class RollingHistogram:
+    def __init__(self, buckets, window=ROLLING_WINDOW):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self):
+        recent = sorted(self.recent)
+
+        def quantile(q):
+            return recent[min(len(recent) - 1, int(q * len(recent)))] if recent else None
+
+        cumulative, buckets = 0, {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.bucket_counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"count": self.count, "sum": self.sum,
+                "mean": self.sum / self.count if self.count else None,
+                "p50": quantile(0.5), "p95": quantile(0.95), "p99": quantile(0.99),
+                "max": recent[-1] if recent else None, "buckets": buckets}
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+# Histograms and counters of this process, keyed by name and label set
+class Stats:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = RollingHistogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def count(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            histograms = [dict(name=name, labels=dict(labels), **histogram.summary())
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {"histograms": histograms, "counters": counters}
+
+
+STATS = Stats()
+_local = threading.local()
+
+
+# Stage times and primitive counts of the frame being rendered in this thread
+def _current_trace():
+    return getattr(_local, "trace", None)
+
+
+# Time the enclosed code as one stage. In a frame it adds to the frame's
+# trace; otherwise it is recorded on its own with the given labels.
+@contextmanager
+def stage(name, **labels):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        trace = _current_trace()
+        if trace is None:
+            STATS.observe("render_stage_seconds", elapsed, stage=name, **labels)
+        else:
+            trace["stages"][name] = trace["stages"].get(name, 0.0) + elapsed
+
+
+# Decorator timing every call of a function as the given stage
+def timed(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count_primitives(layer, n):
+    if not ENABLED:
+        return
+    trace = _current_trace()
+    if trace is None:
+        STATS.count("render_primitives_total", n, layer=layer)
+    else:
+        trace["primitives"][layer] = trace["primitives"].get(layer, 0) + n
+
+
+# Collect the stages of one frame into a trace (a plain dict, so it can cross
+# process boundaries) and record it at the end unless `record` is false. A
+# frame inside another frame adds to the outer one.
+@contextmanager
+def frame(record=True, **labels):
+    if not ENABLED or _current_trace() is not None:
+        yield _current_trace()
+        return
+    trace = _local.trace = {"labels": _label_key(labels), "stages": {}, "primitives": {}}
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        _local.trace = None
+        trace["seconds"] = time.perf_counter() - start
+        if record:
+            record_frame(trace)
+
+
+def record_frame(trace):
+    if not trace:
+        return
+    labels = dict(trace["labels"])
+    STATS.observe("render_frame_seconds", trace["seconds"], **labels)
+    STATS.count("render_frames_total", **labels)
+    for name, seconds in trace["stages"].items():
+        STATS.observe("render_stage_seconds", seconds, stage=name, **labels)
+    STATS.observe("render_frame_primitives", sum(trace["primitives"].values()), **labels)
+    for layer, n in trace["primitives"].items():
+        STATS.count("render_primitives_total", n, layer=layer)
+
+
+def snapshot():
+    return STATS.snapshot()
+
+
+def snapshot_json(indent=2):
+    return json.dumps(snapshot(), indent=indent)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels.items()) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+               for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+# Histograms and counters in the Prometheus text exposition format
+def prometheus_text():
+    data = snapshot()
+    lines = []
+    for name, (help_text, _) in HISTOGRAMS.items():
+        series = [h for h in data["histograms"] if h["name"] == name]
+        if not series:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for h in series:
+            for bound, count in h["buckets"].items():
+                lines.append(f"{name}_bucket{_format_labels(h['labels'], [('le', bound)])} {count}")
+            lines.append(f"{name}_sum{_format_labels(h['labels'])} {h['sum']:.9g}")
+            lines.append(f"{name}_count{_format_labels(h['labels'])} {h['count']}")
+    for name, help_text in COUNTERS.items():
+        series = [c for c in data["counters"] if c["name"] == name]
+        if not series:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f"{name}{_format_labels(c['labels'])} {c['value']}" for c in series]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,172 @@
+"""Per-day cell morphology as a parameter table.
+
+MORPHOLOGY lists the fates a cell can have on each day, with their
+probabilities and shape, color and structure parameters; the descriptions in
+cell_data.py are the source for them. compile_day() turns a day's entry into
+flat NumPy arrays with every parameter filled in, so a single vectorized
+sampler draws the cells of every day, and interpolates the arrays for days in
+between.
+"""
+
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+from cell_data import cell_data
+
+_BLUE = (102, 102, 204, 200)  # Blue nucleus
+
+# Fates a cell can have, in the order they are drawn:
+#   cell       body with sarcomere lines, intercellular connection, membrane
+#              breaks, structure dots and a centered nucleus (or nucleus
+#              fragments); `gain` is relative to the day's beat strength
+#   fragments  `count` small non-beating pieces scattered around the cell
+#   damaged    a shrunken non-beating body with debris around it
+FATES = ("cell", "fragments", "damaged")
+
+# Parameters of each fate and their values when a day leaves them out. Ranges
+# are (low, high) and sizes are in design-frame pixels.
+FATE_DEFAULTS = {
+    "cell": {
+        "round_p": 0.0, "round_w": (0, 0), "long_w": (0, 0), "aspect": (1, 1), "rotate_p": 0.0,
+        "beat_p": 0.0, "gain": 0.0, "color": (0, 0, 0, 0),
+        # Sarcomere lines, each broken into `segments` pieces kept with `segment_p`
+        "lines": {"p": 0.0, "count": (0, 0), "fx": (0, 0), "fy": (0, 0), "color": (0, 0, 0, 0),
+                  "width": 1, "segments": 1, "segment_p": 1.0},
+        # Leaves the right edge of the cell
+        "connection": {"p": 0.0, "extra": (0, 0), "color": (0, 0, 0, 0), "width": 1},
+        # Hole on the outline of the cell
+        "membrane_break": {"p": 0.0, "size": (0, 0), "color": (0, 0, 0, 0)},
+        # Random dots left of a disrupted internal structure
+        "dots": {"count": (0, 0), "size": (0, 0), "color": (0, 0, 0, 0)},
+        "nucleus": (0, 0), "nucleus_color": (0, 0, 0, 0),
+        # Nucleus broken into `count` square pieces instead, sized from the cell width
+        "nucleus_split": {"p": 0.0, "count": 0, "offset": (0, 0), "size": 0.0,
+                          "color": (0, 0, 0, 0)},
+    },
+    "fragments": {"count": (0, 0), "spread": 0, "size": (0, 0), "color": (0, 0, 0), "alpha": 0,
+                  "alpha_step": 0},
+    "damaged": {"size": (0, 0), "color": (0, 0, 0, 0), "debris": (0, 0), "debris_size": (0, 0),
+                "debris_color": (0, 0, 0), "debris_alpha": (0, 0)},
+}
+
+_SARCOMERES = {"p": 1.0, "count": (5, 8), "fx": (0.075, 0.925), "fy": (0.2, 0.6),
+               "color": (255, 80, 80, 180), "width": 2}
+_CONNECTION = {"p": 0.4, "extra": (10, 25), "color": (255, 120, 120, 150), "width": 2}
+
+# Fates of each day as {fate: (probability, parameters)}
+MORPHOLOGY = {
+    # Small, round, immature cells with almost no beating
+    1: {"cell": (1.0, {"round_p": 1.0, "round_w": (18, 25), "beat_p": 1.0, "gain": 0.25,
+                       "color": (255, 214, 204, 180),
+                       "nucleus": (0.7, 0.8), "nucleus_color": _BLUE})},
+    # Slightly elongated, weak beating in 40% of cells
+    2: {"cell": (1.0, {"round_p": 0.7, "round_w": (20, 28), "long_w": (15, 23),
+                       "aspect": (1.2, 1.5), "beat_p": 0.4, "gain": 0.15,
+                       "color": (255, 204, 204, 180),
+                       "nucleus": (0.65, 0.75), "nucleus_color": _BLUE})},
+    # More elongated, sarcomeres forming, 60% beating
+    3: {"cell": (1.0, {"round_p": 0.4, "round_w": (20, 28), "long_w": (15, 23),
+                       "aspect": (1.5, 2.0), "rotate_p": 0.5, "beat_p": 0.6, "gain": 0.2,
+                       "color": (255, 194, 194, 180),
+                       "lines": {"p": 0.4, "count": (3, 4), "fx": (0.2, 0.8), "fy": (0.3, 0.6),
+                                 "color": (255, 160, 160, 120)},
+                       "nucleus": (0.5, 0.6), "nucleus_color": _BLUE})},
+    # Well-defined, elongated, aligned cells, 70% beating
+    4: {"cell": (1.0, {"round_p": 0.2, "round_w": (20, 28), "long_w": (15, 23),
+                       "aspect": (1.8, 2.5), "rotate_p": 0.5, "beat_p": 0.7, "gain": 0.25,
+                       "color": (255, 153, 153, 180),
+                       "lines": {"p": 0.8, "count": (3, 6), "fx": (0.1, 0.9), "fy": (0.2, 0.6),
+                                 "color": (255, 130, 130, 150)},
+                       "nucleus": (0.45, 0.55), "nucleus_color": _BLUE})},
+    # Peak maturity, strong organization and connection, 90% beating
+    5: {"cell": (1.0, {"round_p": 0.1, "round_w": (20, 28), "long_w": (15, 25),
+                       "aspect": (2.0, 3.0), "rotate_p": 0.7, "beat_p": 0.9, "gain": 0.24,
+                       "color": (255, 102, 102, 180), "lines": _SARCOMERES,
+                       "connection": _CONNECTION, "nucleus": (0.4, 0.4), "nucleus_color": _BLUE})},
+    # Peak contraction: stronger red and beat
+    6: {"cell": (1.0, {"round_p": 0.1, "round_w": (20, 28), "long_w": (15, 25),
+                       "aspect": (2.0, 3.0), "rotate_p": 0.7, "beat_p": 0.9, "gain": 0.3,
+                       "color": (255, 62, 62, 180), "lines": _SARCOMERES,
+                       "connection": _CONNECTION, "nucleus": (0.4, 0.4), "nucleus_color": _BLUE})},
+    # Beginning of damage and fragmentation
+    7: {"cell": (0.4, {"long_w": (15, 25), "aspect": (1.8, 2.3), "beat_p": 0.6, "gain": 0.15,
+                       "color": (204, 51, 51, 160),
+                       "membrane_break": {"p": 0.5, "size": (3, 8), "color": (255, 255, 255, 255)},
+                       "lines": {"p": 0.4, "count": (2, 3), "fx": (0.25, 0.75), "fy": (0.3, 0.6),
+                                 "color": (200, 70, 70, 120), "segments": 3, "segment_p": 0.7},
+                       "nucleus": (0.3, 0.4), "nucleus_color": (102, 102, 204, 120),
+                       "nucleus_split": {"p": 0.5, "count": 2, "offset": (0.3, 0.7), "size": 0.2,
+                                         "color": (102, 102, 204, 100)}}),
+        "fragments": (0.3, {"count": (2, 5), "spread": 10, "size": (6, 14), "color": (204, 51, 51),
+                            "alpha": 140, "alpha_step": 20}),
+        "damaged": (0.3, {"size": (12, 20), "color": (180, 40, 40, 120), "debris": (3, 8),
+                          "debris_size": (2, 5), "debris_color": (150, 50, 50),
+                          "debris_alpha": (100, 150)})},
+    # Severe damage and cell death
+    8: {"cell": (0.2, {"long_w": (10, 18), "aspect": (1.0, 1.3), "beat_p": 0.2, "gain": 0.1,
+                       "color": (153, 51, 51, 130),
+                       "dots": {"count": (2, 5), "size": (1, 3), "color": (180, 60, 60, 150)},
+                       "nucleus": (0.25, 0.25), "nucleus_color": (102, 102, 204, 80)}),
+        "fragments": (0.8, {"count": (1, 6), "spread": 15, "size": (3, 9), "color": (153, 51, 51),
+                            "alpha": 100, "alpha_step": 10})},
+}
+
+# Background debris color per day
+DEBRIS_COLORS = {1: (180, 180, 180, 80), 2: (180, 180, 180, 80), 3: (180, 180, 180, 80),
+                 4: (180, 150, 150, 100), 5: (180, 150, 150, 100), 6: (180, 150, 150, 100),
+                 7: (160, 100, 100, 120), 8: (160, 100, 100, 120)}
+
+
+# Compiled parameters of one (possibly fractional) day
+class DayMorphology(NamedTuple):
+    fate_p: np.ndarray          # (len(FATES),) probability of each fate
+    params: tuple               # per fate, {"name" or "group.name": array}
+    debris_color: np.ndarray    # (4,) RGBA of the background debris
+
+
+def _flatten(spec, defaults, prefix=""):
+    params = {}
+    for name, default in defaults.items():
+        if isinstance(default, dict):
+            params.update(_flatten(spec.get(name, {}), default, f"{prefix}{name}."))
+        else:
+            params[prefix + name] = np.asarray(spec.get(name, default), dtype=float)
+    return params
+
+
+def _compile_whole_day(day_num):
+    fates = MORPHOLOGY[day_num]
+    beat = cell_data[day_num]["beat"]
+    fate_p, params = [], []
+    for fate in FATES:
+        probability, spec = fates.get(fate, (0.0, {}))
+        flat = _flatten(spec, FATE_DEFAULTS[fate])
+        if fate == "cell":
+            flat["gain"] = flat["gain"] * beat
+        fate_p.append(probability)
+        params.append(flat)
+    return DayMorphology(np.array(fate_p), tuple(params),
+                         np.asarray(DEBRIS_COLORS[day_num], dtype=float))
+
+
+# Parameters of a day. Between two days every parameter is interpolated
+# linearly, fate probabilities included; a fate only one of the days has keeps
+# that day's parameters and fades in or out through its probability.
+@lru_cache(maxsize=None)
+def compile_day(day):
+    low = int(np.floor(day))
+    if low == day:
+        return _compile_whole_day(low)
+    a, b, f = _compile_whole_day(low), _compile_whole_day(low + 1), day - low
+    params = []
+    for pa, pb, fate_a, fate_b in zip(a.params, b.params, a.fate_p, b.fate_p):
+        if not fate_a:
+            params.append(pb)
+        elif not fate_b:
+            params.append(pa)
+        else:
+            params.append({name: pa[name] + (pb[name] - pa[name]) * f for name in pa})
+    return DayMorphology(a.fate_p + (b.fate_p - a.fate_p) * f, tuple(params),
+                         a.debris_color + (b.debris_color - a.debris_color) * f)
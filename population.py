@@ -0,0 +1,84 @@
+"""Tissue-scale populations of tens of thousands of cells.
+
+The culture scenes in renderer.py hold the few dozen cells of the day data.
+A tissue spreads many more over a field large enough to keep the day's
+cluster density, and grows with the number of cells. Both are drawn by the
+same vectorized sampler from the per-day table in morphology.py.
+"""
+
+import numpy as np
+
+import instrumentation
+from cell_data import cell_data
+from morphology import compile_day
+from renderer import (
+    DEFAULT_SEED,
+    FIBER_DAYS,
+    SCENE_ASPECT,
+    SCENE_WIDTH,
+    SHARED_DAY,
+    STREAM_FIBERS,
+    STREAM_POPULATION,
+    SceneBuilder,
+    build_scene,
+    cluster_fibers,
+    sample_morphology,
+    scene_rng,
+)
+from spatial import GridIndex
+
+# Cell counts offered for population mode
+POPULATION_SIZES = [1000, 5000, 10000, 25000, 50000, 100000]
+
+
+# Sample a tissue of `cells` cells for the given day
+@instrumentation.timed("layout")
+def build_population_scene(day_num, cells, seed=DEFAULT_SEED):
+    day_data = cell_data[day_num]
+    rng = scene_rng(seed, day_num, STREAM_POPULATION)
+    b = SceneBuilder()
+
+    # Same clusters per cell as the day's culture, on a tissue large enough to
+    # keep their density. Later days have more clusters, added to those of the
+    # earlier days.
+    day_clusters = max(3, day_num)
+    num_clusters = max(day_clusters, round(cells * day_clusters / day_data["cell_count"]))
+    width = SCENE_WIDTH * np.sqrt(num_clusters / day_clusters)
+    height = width * SCENE_ASPECT
+    centers = scene_rng(seed, SHARED_DAY, STREAM_POPULATION, 0).random((num_clusters, 2))
+    clusters = 50 + centers * [width - 100, height - 100]
+
+    # Every cell has a fixed anchor on the tissue and is scattered around the
+    # cluster nearest to it, so it stays with its cluster from day to day
+    # unless a new cluster comes up closer
+    place = scene_rng(seed, SHARED_DAY, STREAM_POPULATION, 1).random((cells, 4))
+    anchor = 50 + place[:, :2] * [width - 100, height - 100]
+    cluster, _ = GridIndex(clusters, 4 * np.sqrt(width * height / num_clusters)).nearest(anchor)
+    far = np.flatnonzero(cluster < 0)
+    if len(far):
+        cluster[far] = np.argmin(((anchor[far, None] - clusters) ** 2).sum(axis=-1), axis=1)
+    angle = place[:, 2] * 2 * np.pi
+    distance = place[:, 3] * (30 + day_num * 5)
+    xy = clusters[cluster] + distance[:, None] * np.column_stack([np.cos(angle), np.sin(angle)])
+
+    morphology = compile_day(day_num)
+    sample_morphology(b, rng, morphology, xy)
+
+    # Background debris at the culture's density
+    count = int(day_data["debris_level"] * 100 * (width / SCENE_WIDTH) ** 2)
+    b.add_debris(rng.random((count, 2)) * [width, height], 2 + rng.random(count) * 4,
+                 morphology.debris_color)
+
+    # Fibers between neighbouring clusters, as in the culture
+    fibers = ()
+    if day_num in FIBER_DAYS:
+        fibers = cluster_fibers(clusters, width, height, scene_rng(seed, day_num, STREAM_FIBERS))
+
+    return b.build(day_num, seed, width, clusters, fibers)
+
+
+# The day's culture scene, or a tissue of `cells` cells when given
+def build_scene_for(day_num, seed=DEFAULT_SEED, cells=None):
+    if cells is None:
+        return build_scene(day_num, seed)
+    return build_population_scene(day_num, cells, seed)
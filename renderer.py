@@ -0,0 +1,1089 @@
+"""Scene sampling, rasterization and encoding of the cardiac cell frames.
+
+Nothing in here depends on Streamlit, so frames can be rendered, encoded and
+benchmarked headless.
+"""
+
+import io
+import os
+import tempfile
+from dataclasses import dataclass, field
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import instrumentation
+from cell_data import cell_data
+from morphology import FATES, compile_day
+from spatial import GridIndex
+
+
+# Design frame the scenes are sampled in, and default random seed. Scenes are
+# stored in units of the frame width and can be rendered at any output size;
+# SCENE_WIDTH x SCENE_HEIGHT is also the default output size.
+SCENE_WIDTH, SCENE_HEIGHT = 800, 600
+SCENE_ASPECT = SCENE_HEIGHT / SCENE_WIDTH
+DEFAULT_SEED = 0
+# Seeds taken from users are below this
+MAX_SEED = 2 ** 32
+# Output sizes (width, height) offered for display and export
+OUTPUT_SIZES = [(400, 300), (480, 360), (800, 600), (1200, 900), (1600, 1200), (3200, 2400)]
+
+# Inter-cluster fibers: light red, transparent, 2 px wide in the design frame
+FIBER_COLOR = (255, 180, 180, 100)
+FIBER_STEPS = 10
+FIBER_WIDTH = 2 / SCENE_WIDTH
+# Days whose clusters are connected by fibers
+FIBER_DAYS = (4, 5, 6)
+# Each cluster links to its nearest clusters within this many mean cluster
+# spacings, and each link becomes a fiber with probability FIBER_P
+FIBER_NEIGHBOURS = 3
+FIBER_REACH = 2
+FIBER_P = 0.6
+
+
+# Layout of one day's culture, sampled once and re-rendered for every pulse.
+#
+# Everything random (cluster centers, cell positions and sizes, which cells
+# beat, sarcomere lines, fragments and debris) lives in these arrays. A pulse
+# only scales the resting size of the beating bodies; all geometry attached to
+# a body (sarcomeres, membrane marks, nuclei) is stored relative to the body's
+# bounding box so it follows the contraction.
+#
+# Coordinates and lengths are in scene units: the scene spans x in [0, 1] and
+# y in [0, aspect]. viewport() maps them to pixels of a particular output image.
+@dataclass
+class CellScene:
+    day: int
+    seed: int
+    aspect: float               # scene height in units of its width
+    clusters: np.ndarray        # (K, 2) cluster centers
+    fibers: np.ndarray          # (F, FIBER_STEPS + 1, 2) wavy fiber polylines
+    body_xy: np.ndarray         # (N, 2) top-left corner of each cell body / fragment
+    body_size: np.ndarray       # (N, 2) resting width and height
+    body_gain: np.ndarray       # (N,) relative size increase at pulse=1, 0 if not beating
+    body_color: np.ndarray      # (N, 4) RGBA fill
+    body_cell: np.ndarray       # (N,) index of the cell each body belongs to
+    line_body: np.ndarray       # (L,) body each line is attached to
+    line_geom: np.ndarray       # (L, 4) x0 fraction, x1 fraction, y fraction, extra length
+    line_color: np.ndarray      # (L, 4) RGBA
+    line_width: np.ndarray      # (L,) stroke width
+    mark_body: np.ndarray       # (M,) body each membrane break / structure dot belongs to
+    mark_geom: np.ndarray       # (M, 7) attached ellipse geometry, see attached_boxes()
+    mark_color: np.ndarray      # (M, 4) RGBA
+    nucleus_body: np.ndarray    # (U,) body each nucleus (or nucleus fragment) belongs to
+    nucleus_geom: np.ndarray    # (U, 7) attached ellipse geometry, see attached_boxes()
+    nucleus_color: np.ndarray   # (U, 4) RGBA
+    debris_box: np.ndarray      # (D, 4) static debris ellipses
+    debris_color: np.ndarray    # (D, 4) RGBA
+    fiber_color: np.ndarray = None  # (F, 4) RGBA per fiber, None for all FIBER_COLOR
+    # Rasterized pulse-independent layers, keyed by (layer, backend, width, height)
+    layer_cache: dict = field(default_factory=dict, repr=False, compare=False)
+    # (PULSE_FRAMES, cells) beating phase of every cell, simulated on first use (beating.py)
+    phases: np.ndarray = field(default=None, repr=False, compare=False)
+
+    @property
+    def beating(self):
+        return self.body_gain > 0
+
+    @property
+    def cell_count(self):
+        return int(self.body_cell.max()) + 1 if len(self.body_cell) else 0
+
+    def viewport(self, width, height):
+        # Scale and offset from scene units to the pixels of a width x height
+        # image: the whole scene fits, centered, with its aspect ratio kept
+        scale = min(width, height / self.aspect)
+        return scale, (width - scale) / 2, (height - scale * self.aspect) / 2
+
+    def body_boxes(self, pulse=0.0):
+        # Beating bodies grow from their top-left corner, as in the original drawing code.
+        # `pulse` is one value for the whole scene or one per cell.
+        pulse = np.asarray(pulse, dtype=float)
+        if pulse.ndim:
+            pulse = pulse[self.body_cell]
+        size = self.body_size * (1.0 + pulse * self.body_gain)[:, None]
+        return np.hstack([self.body_xy, self.body_xy + size])
+
+    @staticmethod
+    def attached_boxes(boxes, body, geom):
+        # geom columns: fx, fy, ox, oy, size, kx, ky
+        #   left   = body_x + body_w * fx + ox
+        #   top    = body_y + body_h * fy + oy
+        #   width  = size + body_w * kx
+        #   height = size + body_h * ky
+        bx, by = boxes[body, 0], boxes[body, 1]
+        bw, bh = boxes[body, 2] - bx, boxes[body, 3] - by
+        x0 = bx + bw * geom[:, 0] + geom[:, 2]
+        y0 = by + bh * geom[:, 1] + geom[:, 3]
+        w = geom[:, 4] + bw * geom[:, 5]
+        h = geom[:, 4] + bh * geom[:, 6]
+        return np.stack([x0, y0, x0 + w, y0 + h], axis=1)
+
+    def line_segments(self, boxes):
+        bx, by = boxes[self.line_body, 0], boxes[self.line_body, 1]
+        bw, bh = boxes[self.line_body, 2] - bx, boxes[self.line_body, 3] - by
+        y = by + bh * self.line_geom[:, 2]
+        x0 = bx + bw * self.line_geom[:, 0]
+        x1 = bx + bw * self.line_geom[:, 1] + self.line_geom[:, 3]
+        return np.stack([x0, y, x1, y], axis=1)
+
+    def mark_boxes(self, boxes):
+        return self.attached_boxes(boxes, self.mark_body, self.mark_geom)
+
+    def nucleus_boxes(self, boxes):
+        return self.attached_boxes(boxes, self.nucleus_body, self.nucleus_geom)
+
+
+def _uniform(rng, bounds, n):
+    low, high = bounds
+    return low + rng.random(n) * (high - low)
+
+
+def _count(rng, bounds, n):
+    # Integers in [low, high), like int(low + random() * (high - low))
+    return np.floor(_uniform(rng, bounds, n)).astype(int)
+
+
+def _colors(color, n):
+    return np.broadcast_to(np.rint(color).astype(np.uint8), (n, 4))
+
+
+# Primitive arrays of a scene, appended one batch of cells at a time while it
+# is being sampled. Lengths are in design-frame pixels until build(). Shared by
+# the culture scenes below and the populations of population.py.
+class SceneBuilder:
+    def __init__(self):
+        self.bodies, self.lines, self.marks, self.nuclei, self.debris = [], [], [], [], []
+        self.num_bodies = 0
+
+    def add_bodies(self, xy, size, gain, color, cell):
+        n = len(xy)
+        self.bodies.append((xy, size, np.broadcast_to(gain, (n,)), _colors(color, n), cell))
+        self.num_bodies += n
+        return np.arange(self.num_bodies - n, self.num_bodies)
+
+    def add_lines(self, body, fx0, fx1, fy, color, width, extra=0.0):
+        n = len(body)
+        geom = np.column_stack([np.broadcast_to(v, (n,)) for v in (fx0, fx1, fy, extra)])
+        self.lines.append((body, geom, _colors(color, n), np.full(n, float(width))))
+
+    def add_marks(self, body, fx, fy, size, color, ox=0.0, oy=0.0):
+        # Ellipses of a fixed size attached to a point of their body
+        n = len(body)
+        zeros = np.zeros(n)
+        geom = np.column_stack([np.broadcast_to(v, (n,)) for v in (fx, fy, ox, oy, size)])
+        self.marks.append((body, np.column_stack([geom, zeros, zeros]), _colors(color, n)))
+
+    def add_nuclei(self, body, fx, fy, kx, ky, color):
+        # Ellipses scaled with their body
+        n = len(body)
+        zeros = np.zeros(n)
+        geom = np.column_stack([np.broadcast_to(v, (n,)) for v in (fx, fy, zeros, zeros, zeros, kx, ky)])
+        self.nuclei.append((body, geom, _colors(color, n)))
+
+    def add_debris(self, xy, size, color):
+        self.debris.append((np.hstack([xy, xy + size[:, None]]), _colors(color, len(xy))))
+
+    @staticmethod
+    def _concat(parts, index, shape, dtype=float):
+        if not parts:
+            return np.zeros(shape, dtype=dtype)
+        return np.concatenate([p[index] for p in parts]).astype(dtype)
+
+    def build(self, day, seed, width, clusters, fibers=()):
+        # Convert every length (but not the fractions of a body's box) to
+        # scene units, for a scene `width` design-frame pixels wide
+        c = self._concat
+        body_cell = c(self.bodies, 4, 0, int)
+        # Draw bodies in cell order, so fates are interleaved
+        order = np.argsort(body_cell, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        unit = float(width)
+        offsets = [1, 1, 1 / unit, 1 / unit, 1 / unit, 1, 1]
+        return CellScene(
+            day=day, seed=seed, aspect=SCENE_ASPECT,
+            clusters=np.asarray(clusters, dtype=float).reshape(-1, 2) / unit,
+            fibers=np.asarray(fibers, dtype=float).reshape(-1, FIBER_STEPS + 1, 2) / unit,
+            body_xy=c(self.bodies, 0, (0, 2))[order] / unit,
+            body_size=c(self.bodies, 1, (0, 2))[order] / unit,
+            body_gain=c(self.bodies, 2, 0)[order],
+            body_color=c(self.bodies, 3, (0, 4), np.uint8)[order],
+            body_cell=body_cell[order],
+            line_body=rank[c(self.lines, 0, 0, int)],
+            line_geom=c(self.lines, 1, (0, 4)) * [1, 1, 1, 1 / unit],
+            line_color=c(self.lines, 2, (0, 4), np.uint8),
+            line_width=c(self.lines, 3, 0) / unit,
+            mark_body=rank[c(self.marks, 0, 0, int)],
+            mark_geom=c(self.marks, 1, (0, 7)) * offsets,
+            mark_color=c(self.marks, 2, (0, 4), np.uint8),
+            nucleus_body=rank[c(self.nuclei, 0, 0, int)],
+            nucleus_geom=c(self.nuclei, 1, (0, 7)) * offsets,
+            nucleus_color=c(self.nuclei, 2, (0, 4), np.uint8),
+            debris_box=c(self.debris, 0, (0, 4)) / unit,
+            debris_color=c(self.debris, 1, (0, 4), np.uint8),
+        )
+
+
+# Wave added to the points of every fiber, in design-frame pixels; the ends
+# stay on the cluster centers
+_wave_steps = np.arange(1, FIBER_STEPS)
+FIBER_WAVE = np.zeros((FIBER_STEPS + 1, 2))
+FIBER_WAVE[1:-1] = (10 + 5 * np.sin(_wave_steps))[:, None] * np.column_stack(
+    [np.sin(_wave_steps * 3), np.cos(_wave_steps * 2)])
+
+
+# Wavy polylines from the `starts` to the `ends`, as (F, FIBER_STEPS + 1, 2)
+def fiber_points(starts, ends):
+    t = (np.arange(FIBER_STEPS + 1) / FIBER_STEPS)[None, :, None]
+    return starts[:, None] + (ends - starts)[:, None] * t + FIBER_WAVE
+
+
+# Fibers between clusters that are near neighbours. Every cluster is linked to
+# its FIBER_NEIGHBOURS nearest clusters within FIBER_REACH mean spacings of
+# the width x height field, found through a grid index, so the cost grows with
+# the number of clusters rather than with the number of pairs.
+def cluster_fibers(clusters, width, height, rng):
+    clusters = np.asarray(clusters, dtype=float).reshape(-1, 2)
+    n = len(clusters)
+    if n < 2:
+        return np.zeros((0, FIBER_STEPS + 1, 2))
+    i, j, d = GridIndex(clusters, FIBER_REACH * np.sqrt(width * height / n)).pairs()
+    # Rank of every link among the links of each of its ends, nearest first
+    end = np.concatenate([i, j])
+    link = np.tile(np.arange(len(i)), 2)
+    order = np.lexsort((np.tile(d, 2), end))
+    end, link = end[order], link[order]
+    rank = np.arange(len(end)) - np.searchsorted(end, end)
+    near = np.zeros(len(i), dtype=bool)
+    near[link[rank < FIBER_NEIGHBOURS]] = True
+    i, j = i[near], j[near]
+    kept = rng.random(len(i)) < FIBER_P
+    return fiber_points(clusters[i[kept]], clusters[j[kept]])
+
+
+# Samplers of the fates in morphology.py. Each draws every cell of its fate at
+# once, at positions `xy`, with the parameters `p` of compile_day().
+def _sample_cells(b, rng, p, xy, cell):
+    n = len(xy)
+    round_ = rng.random(n) < p["round_p"]
+    w = np.where(round_, _uniform(rng, p["round_w"], n), _uniform(rng, p["long_w"], n))
+    h = np.where(round_, w, w * _uniform(rng, p["aspect"], n))
+    # Rotation, simplified by swapping the dimensions of elongated cells
+    rotate = ~round_ & (rng.random(n) < p["rotate_p"])
+    w, h = np.where(rotate, h, w), np.where(rotate, w, h)
+    gain = np.where(rng.random(n) < p["beat_p"], p["gain"], 0.0)
+    body = b.add_bodies(xy, np.column_stack([w, h]), gain, p["color"], cell)
+
+    # Sarcomere lines, evenly spaced and possibly broken into pieces
+    count = np.where(rng.random(n) < p["lines.p"], _count(rng, p["lines.count"], n), 0)
+    owner, i = _expand_groups(count)
+    segments = int(p["lines.segments"])
+    piece = np.tile(np.arange(segments), len(owner))
+    owner, i = np.repeat(owner, segments), np.repeat(i, segments)
+    kept = rng.random(len(owner)) < p["lines.segment_p"]
+    owner, i, piece = owner[kept], i[kept], piece[kept]
+    (fx0, fx1), (fy0, fy_span) = p["lines.fx"], p["lines.fy"]
+    b.add_lines(body[owner], fx0 + (fx1 - fx0) * piece / segments,
+                fx0 + (fx1 - fx0) * (piece + 1) / segments,
+                fy0 + i * fy_span / count[owner], p["lines.color"], p["lines.width"])
+
+    # Intercellular connection leaving the right edge of the cell
+    owner = np.flatnonzero(rng.random(n) < p["connection.p"])
+    b.add_lines(body[owner], 1.0, 1.0, 0.5, p["connection.color"], p["connection.width"],
+                extra=_uniform(rng, p["connection.extra"], len(owner)))
+
+    # Cell membrane starting to break down: a hole on the outline
+    owner = np.flatnonzero(rng.random(n) < p["membrane_break.p"])
+    angle = rng.random(len(owner)) * 2 * np.pi
+    size = _uniform(rng, p["membrane_break.size"], len(owner))
+    b.add_marks(body[owner], 0.5 + np.cos(angle) / 2, 0.5 + np.sin(angle) / 2, size,
+                p["membrane_break.color"], ox=-size / 2, oy=-size / 2)
+
+    # Severely disrupted structure: random dots inside
+    owner, _ = _expand_groups(_count(rng, p["dots.count"], n))
+    m = len(owner)
+    b.add_marks(body[owner], rng.random(m), rng.random(m), _uniform(rng, p["dots.size"], m),
+                p["dots.color"])
+
+    # Centered nucleus scaled with the cell, or square fragments of one
+    split = rng.random(n) < p["nucleus_split.p"]
+    whole = np.flatnonzero(~split)
+    size = _uniform(rng, p["nucleus"], len(whole))
+    b.add_nuclei(body[whole], 0.5 - size / 2, 0.5 - size / 2, size, size, p["nucleus_color"])
+    owner, _ = _expand_groups(np.where(split, int(p["nucleus_split.count"]), 0))
+    m = len(owner)
+    k = p["nucleus_split.size"]
+    b.add_nuclei(body[owner], _uniform(rng, p["nucleus_split.offset"], m),
+                 _uniform(rng, p["nucleus_split.offset"], m), k, k * w[owner] / h[owner],
+                 p["nucleus_split.color"])
+
+
+def _sample_fragments(b, rng, p, xy, cell):
+    owner, j = _expand_groups(_count(rng, p["count"], len(xy)))
+    m = len(owner)
+    spread = p["spread"]
+    frag_xy = xy[owner] + rng.random((m, 2)) * 2 * spread - spread
+    size = _uniform(rng, p["size"], m)
+    color = np.column_stack([np.tile(p["color"], (m, 1)), p["alpha"] - j * p["alpha_step"]])
+    b.add_bodies(frag_xy, np.column_stack([size, size]), 0.0, color, cell[owner])
+
+
+def _sample_damaged(b, rng, p, xy, cell):
+    n = len(xy)
+    size = np.column_stack([_uniform(rng, p["size"], n), _uniform(rng, p["size"], n)])
+    b.add_bodies(xy, size, 0.0, p["color"], cell)
+    # Cellular debris around the damaged cell
+    owner, _ = _expand_groups(_count(rng, p["debris"], n))
+    m = len(owner)
+    debris_xy = xy[owner] + rng.random((m, 2)) * (size[owner] + 20) - 10
+    alpha = np.floor(_uniform(rng, p["debris_alpha"], m))
+    color = np.column_stack([np.tile(p["debris_color"], (m, 1)), alpha])
+    b.add_debris(debris_xy, _uniform(rng, p["debris_size"], m), color)
+
+
+_FATE_SAMPLERS = {"cell": _sample_cells, "fragments": _sample_fragments, "damaged": _sample_damaged}
+
+
+# Give every cell a fate of the day's morphology and sample all cells of each
+# fate in one go; cells are numbered by `cell`, or by their position in `xy`
+def sample_morphology(b, rng, morphology, xy, cell=None):
+    if cell is None:
+        cell = np.arange(len(xy))
+    fate = rng.choice(len(FATES), size=len(xy), p=morphology.fate_p / morphology.fate_p.sum())
+    for k, name in enumerate(FATES):
+        of_fate = np.flatnonzero(fate == k)
+        _FATE_SAMPLERS[name](b, rng, morphology.params[k], xy[of_fate], cell[of_fate])
+
+
+# Random streams. A scene draws from a tree of SeedSequences rooted at the
+# seed, with a separate stream per purpose, so a frame depends only on its
+# (seed, day) key and a change to one stage does not reshuffle the others.
+# Where cells sit is drawn under SHARED_DAY, a node shared by all days, so a
+# cell keeps its place from one day to the next and only what changes between
+# days is drawn per day:
+#
+#   seed -> SHARED_DAY -> STREAM_LAYOUT            cluster centers
+#                      -> STREAM_CELLS -> cluster  cell positions around a cluster
+#                      -> STREAM_POPULATION -> 0   cluster centers of a tissue (population.py)
+#                                           -> 1   cell anchors of a tissue
+#   seed -> day -> STREAM_LAYOUT            cells per cluster
+#               -> STREAM_DEBRIS            background debris
+#               -> STREAM_CELLS -> cluster  morphology of a cluster's cells
+#               -> STREAM_POPULATION        morphology and debris of a tissue (population.py)
+#               -> STREAM_BEATING           oscillator frequencies and phases (beating.py)
+#               -> STREAM_TIMELINE          event times of the morph into the next day (timeline.py)
+#               -> STREAM_FIBERS            which neighbouring clusters are linked by fibers
+#
+# Nodes are addressed by their spawn key: SeedSequence(seed, spawn_key=key) is
+# the node SeedSequence.spawn() yields along that path, without having to
+# spawn its siblings first. Shared streams are drawn as (n, k) arrays, whose
+# first rows do not depend on n, so a day with more clusters or cells than
+# another extends its layout rather than redrawing it.
+(STREAM_LAYOUT, STREAM_DEBRIS, STREAM_CELLS, STREAM_POPULATION, STREAM_BEATING, STREAM_TIMELINE,
+ STREAM_FIBERS) = range(7)
+# Day node of the draws shared by all days; days are numbered from 1
+SHARED_DAY = 0
+
+
+def scene_rng(seed, *key):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+
+# Sample the full layout of a day's culture, laid out in the design frame
+@instrumentation.timed("layout")
+def build_scene(day_num, seed=DEFAULT_SEED):
+    width, height = SCENE_WIDTH, SCENE_HEIGHT
+    day_data = cell_data[day_num]
+    b = SceneBuilder()
+
+    # Create cell clusters - cells tend to grow in groups. Later days have more
+    # clusters, added to those of the earlier days.
+    num_clusters = max(3, day_num)
+    centers = scene_rng(seed, SHARED_DAY, STREAM_LAYOUT).random((num_clusters, 2))
+    clusters = [tuple(c) for c in 50 + centers * [width - 100, height - 100]]
+    rng = scene_rng(seed, day_num, STREAM_LAYOUT)
+
+    # Cells: fill each cluster once, then add to random clusters until the count is reached
+    cell_cluster = []
+    clusters_used = 0
+    while len(cell_cluster) < day_data["cell_count"]:
+        if clusters_used < num_clusters:
+            cluster = clusters_used
+            clusters_used += 1
+        else:
+            cluster = int(rng.integers(0, num_clusters))
+        cells_in_cluster = min(
+            max(2, int(day_data["cell_count"] / num_clusters + rng.integers(-2, 3))),
+            day_data["cell_count"] - len(cell_cluster)
+        )
+        cell_cluster += [cluster] * cells_in_cluster
+
+    # Every cell scattered around its cluster and sampled from the day's
+    # morphology, from its cluster's streams, so the cells of one cluster do
+    # not change with the size of the others. The k-th cell of a cluster sits
+    # in the same direction on every day, farther out as the cluster grows.
+    cell_cluster = np.array(cell_cluster)
+    morphology = compile_day(day_num)
+    for cluster, center in enumerate(clusters):
+        cell = np.flatnonzero(cell_cluster == cluster)
+        place = scene_rng(seed, SHARED_DAY, STREAM_CELLS, cluster).random((len(cell), 2))
+        angle, distance = place[:, 0] * 2 * np.pi, place[:, 1] * (30 + day_num * 5)
+        xy = np.array(center) + distance[:, None] * np.column_stack([np.cos(angle), np.sin(angle)])
+        sample_morphology(b, scene_rng(seed, day_num, STREAM_CELLS, cluster), morphology, xy, cell)
+
+    # Additional debris and cellular fragments, more in later days
+    rng = scene_rng(seed, day_num, STREAM_DEBRIS)
+    count = int(day_data["debris_level"] * 100)
+    b.add_debris(rng.random((count, 2)) * [width, height], 2 + rng.random(count) * 4,
+                 morphology.debris_color)
+
+    # Connecting fibers between neighbouring clusters (days 4-6)
+    fibers = ()
+    if day_num in FIBER_DAYS:
+        fibers = cluster_fibers(clusters, width, height, scene_rng(seed, day_num, STREAM_FIBERS))
+
+    return b.build(day_num, seed, width, clusters, fibers)
+
+
+# Frames are composited bottom to top from separate RGBA layers. Layers that
+# do not depend on the pulse are rasterized once per scene and reused for
+# every frame; only the beating layers are redrawn.
+LAYERS = ("fibers", "bodies", "sarcomeres", "nuclei", "debris")
+STATIC_LAYERS = ("fibers", "debris")
+BACKGROUND_COLOR = (255, 255, 255, 255)
+
+
+# Drawing operations of one layer for a width x height image, in order:
+#   ("ellipse", boxes, colors) or ("line", polylines, colors, widths)
+# Boxes and polylines are in pixels, a polyline's points as x0, y0, x1, y1, ...
+# in one row; strokes are at least one pixel wide.
+def layer_ops(scene, layer, pulse=0.0, width=SCENE_WIDTH, height=SCENE_HEIGHT):
+    scale, ox, oy = scene.viewport(width, height)
+
+    def px(coords):
+        return coords * scale + np.tile([ox, oy], coords.shape[-1] // 2)
+
+    def stroke(widths):
+        return np.maximum(1, np.rint(widths * scale)).astype(int)
+
+    if layer == "fibers":
+        # Every fiber is one polyline
+        fibers = scene.fibers.reshape(len(scene.fibers), 2 * (FIBER_STEPS + 1))
+        colors = scene.fiber_color
+        if colors is None:
+            colors = np.tile(np.array(FIBER_COLOR, dtype=np.uint8), (len(fibers), 1))
+        return [("line", px(fibers), colors, stroke(np.full(len(fibers), FIBER_WIDTH)))]
+    if layer == "debris":
+        return [("ellipse", px(scene.debris_box), scene.debris_color)]
+
+    boxes = scene.body_boxes(pulse)
+    if layer == "bodies":
+        return [("ellipse", px(boxes), scene.body_color)]
+    if layer == "sarcomeres":
+        # Sarcomeres and intercellular connections, then membrane breaks and structure dots
+        return [("line", px(scene.line_segments(boxes)), scene.line_color, stroke(scene.line_width)),
+                ("ellipse", px(scene.mark_boxes(boxes)), scene.mark_color)]
+    if layer == "nuclei":
+        return [("ellipse", px(scene.nucleus_boxes(boxes)), scene.nucleus_color)]
+    raise ValueError(f"Unknown layer: {layer}")
+
+
+# Rasterize the ops of one layer with the given backend, timed as that layer's stage
+def rasterize_layer(layer, ops, backend, width, height):
+    with instrumentation.stage(layer):
+        image = RENDER_BACKENDS[backend](ops, width, height)
+    instrumentation.count_primitives(layer, sum(len(op[2]) for op in ops))
+    return image
+
+
+# Rasterize drawing operations onto a transparent RGBA layer with ImageDraw
+def rasterize_layer_pil(ops, width, height):
+    layer = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    for op in ops:
+        if op[0] == "ellipse":
+            for box, color in zip(op[1].tolist(), op[2].tolist()):
+                draw.ellipse(box, fill=tuple(color))
+        else:
+            for points, color, line_width in zip(op[1].tolist(), op[2].tolist(), op[3].tolist()):
+                draw.line(points, fill=tuple(color), width=int(line_width))
+    return layer
+
+
+# --- Vectorized NumPy rasterizer -------------------------------------------
+#
+# Draws a layer with array operations instead of one PIL call per primitive.
+# Every ellipse and line is decomposed into pixel spans (one per row of an
+# ellipse, one per step along a line's major axis). Ellipses whose rows are
+# long are filled one row slice at a time in drawing order; the spans of
+# other ops are expanded to pixel indices at once, primitives get increasing
+# ids in drawing order and each pixel keeps the largest id that covers it;
+# only the pixels covered by more than one primitive are sorted for that.
+# Both reproduce ImageDraw's "last draw wins" behaviour within a layer.
+# Coverage rules follow PIL: ellipse boxes and line endpoints are truncated
+# to whole pixels.
+#
+# The array path pays off for populations of thousands of small cells. A
+# culture has a few dozen cells, which ImageDraw fills in a couple of
+# milliseconds per layer at any size; there both backends spend most of a
+# frame compositing its layers, and large cultures are about as fast with
+# either.
+
+# Mean row length, in pixels, from which an ellipse op is filled row by row
+# instead of pixel by pixel
+SLICE_MIN_SPAN = 16
+# Placeholder _paint() writes over pixels covered by several primitives of an op
+CLASH = np.iinfo(np.uint32).max
+
+
+def _expand_groups(counts):
+    # Group index and position inside the group for groups of the given sizes
+    counts = np.maximum(counts, 0)
+    group = np.repeat(np.arange(len(counts)), counts)
+    pos = np.arange(len(group)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return group, pos
+
+
+def _clip_spans(fixed, lo, hi, prim, vertical, width, height):
+    # The spans lo..hi (inclusive) on row `fixed`, or on column `fixed` when
+    # `vertical`, clipped to the layer; empty spans are dropped
+    span_max, fixed_max = (height, width) if vertical else (width, height)
+    lo = np.maximum(lo, 0)
+    hi = np.minimum(hi, span_max - 1)
+    keep = (fixed >= 0) & (fixed < fixed_max) & (hi >= lo)
+    return fixed[keep], lo[keep], hi[keep], prim[keep]
+
+
+def _run_pixels(first, counts, step):
+    # Flat pixel indices of runs of `counts` pixels `step` apart from `first`:
+    # a run's offset in the result is folded into its first pixel, so a
+    # single repeat expands them all
+    start = np.cumsum(counts) - counts
+    return np.repeat(first - start * step, counts) + np.arange(counts.sum()) * step
+
+
+def _span_pixels(fixed, lo, hi, prim, vertical, width, height):
+    # Flat pixel indices of the spans together with the primitive of each pixel
+    fixed, lo, hi, prim = _clip_spans(fixed, lo, hi, prim, vertical, width, height)
+    counts = hi - lo + 1
+    if vertical:
+        return _run_pixels(lo * width + fixed, counts, width), np.repeat(prim, counts)
+    return _run_pixels(fixed * width + lo, counts, 1), np.repeat(prim, counts)
+
+
+def _ellipse_spans(boxes, width, height):
+    # One span per row of each ellipse, clipped to the layer
+    box = np.floor(boxes).astype(np.int64)
+    x0, y0 = np.minimum(box[:, 0], box[:, 2]), np.minimum(box[:, 1], box[:, 3])
+    x1, y1 = np.maximum(box[:, 0], box[:, 2]), np.maximum(box[:, 1], box[:, 3])
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    ax, ay = (x1 - x0) / 2 + 0.5, (y1 - y0) / 2 + 0.5
+
+    prim, k = _expand_groups(y1 - y0 + 1)
+    rows = y0[prim] + k
+    dy = (rows - cy[prim]) / ay[prim]
+    half = ax[prim] * np.sqrt(np.clip(1.0 - dy * dy, 0.0, None))
+    lo = np.ceil(cx[prim] - half).astype(np.int64)
+    hi = np.floor(cx[prim] + half).astype(np.int64)
+    hi[dy * dy > 1.0] = -1
+    return _clip_spans(rows, lo, hi, prim, False, width, height)
+
+
+def _polyline_segments(polylines):
+    # The segments of polylines given as (L, 2k) points, and the polyline of each
+    points = polylines.reshape(len(polylines), polylines.shape[1] // 2, 2)
+    segments = np.concatenate([points[:, :-1], points[:, 1:]], axis=2).reshape(-1, 4)
+    return segments, np.repeat(np.arange(len(polylines)), points.shape[1] - 1)
+
+
+def _line_pixels(segments, widths, width, height):
+    # Lines are rasterized along their major axis, `w` pixels thick across it
+    seg = np.floor(segments).astype(np.int64)
+    w = np.asarray(widths, dtype=float)
+    x_major = np.abs(seg[:, 2] - seg[:, 0]) >= np.abs(seg[:, 3] - seg[:, 1])
+    # (u, v) = (major, minor) coordinates of both endpoints, ordered along u
+    uv = np.where(x_major[:, None], seg, seg[:, [1, 0, 3, 2]])
+    flip = uv[:, 2] < uv[:, 0]
+    uv[flip] = uv[flip][:, [2, 3, 0, 1]]
+    u0, v0, u1, v1 = uv.T
+    du = u1 - u0
+    slope = np.divide(v1 - v0, du, out=np.zeros(len(du)), where=du != 0)
+
+    # One span across the line per step along its major axis
+    prim, k = _expand_groups(du + 1)
+    u = u0[prim] + k
+    center = v0[prim] + (w[prim] - 1) / 2 + k * slope[prim]
+    lo = np.floor(center - w[prim] / 2).astype(np.int64) + 1
+    hi = np.ceil(center + w[prim] / 2).astype(np.int64) - 1
+
+    xm = x_major[prim]
+    pix_x, prim_x = _span_pixels(u[xm], lo[xm], hi[xm], prim[xm], True, width, height)
+    pix_y, prim_y = _span_pixels(u[~xm], lo[~xm], hi[~xm], prim[~xm], False, width, height)
+    return np.concatenate([pix_x, pix_y]), np.concatenate([prim_x, prim_y])
+
+
+def _last_drawn(pixels, prims, count):
+    # Keep the last of `count` primitives drawn on each pixel: sort packed
+    # (pixel, primitive) keys and take the tail of every pixel's run
+    shift = max(1, int(count).bit_length())
+    keys = np.sort(pixels << shift | prims)
+    pixels, prims = keys >> shift, keys & ((1 << shift) - 1)
+    last = np.append(pixels[1:] != pixels[:-1], True) if len(pixels) else np.zeros(0, dtype=bool)
+    return pixels[last], prims[last]
+
+
+# Draw the ops onto an RGBA canvas, op by op in drawing order, and onto the
+# map of primitive ids when `top` is given; ids number the primitives of all
+# ops in order. Pixels are written as one uint32 each.
+def _paint(ops, canvas, top=None):
+    height, width = canvas.shape[:2]
+    pixel = canvas.view(np.uint32).reshape(height, width)
+    flat = pixel.reshape(-1)
+    offset = 0
+    for op in ops:
+        colors = np.ascontiguousarray(op[2], dtype=np.uint8).view(np.uint32).reshape(-1)
+        if op[0] == "ellipse":
+            rows, lo, hi, prim = _ellipse_spans(op[1], width, height)
+            if len(rows) and (hi - lo + 1).mean() >= SLICE_MIN_SPAN:
+                # Long rows: one slice assignment per row, in drawing order
+                color_of = colors.tolist()
+                for row, a, b, k in zip(rows.tolist(), lo.tolist(), (hi + 1).tolist(),
+                                        prim.tolist()):
+                    pixel[row, a:b] = color_of[k]
+                    if top is not None:
+                        top[row, a:b] = offset + k
+                offset += len(colors)
+                continue
+            pix, prims = _span_pixels(rows, lo, hi, prim, False, width, height)
+        else:
+            segments, owner = _polyline_segments(op[1])
+            pix, prims = _line_pixels(segments, op[3][owner], width, height)
+            prims = owner[prims]
+        # Primitive ids go onto the canvas first. Where a pixel does not read
+        # back the id of every primitive that covers it, those primitives are
+        # sorted out with _last_drawn(); elsewhere one primitive covers it.
+        flat[pix] = prims
+        clash = flat[pix] != prims
+        if clash.any():
+            flat[pix[clash]] = CLASH
+            shared = flat[pix] == CLASH
+            last_pix, last_prims = _last_drawn(pix[shared], prims[shared], len(colors))
+            flat[last_pix] = last_prims
+        drawn = flat[pix]
+        flat[pix] = colors[drawn]
+        if top is not None:
+            top.reshape(-1)[pix] = drawn + offset
+        offset += len(colors)
+
+
+# Rasterize drawing operations onto a transparent RGBA layer with array operations
+def rasterize_layer_numpy(ops, width, height):
+    canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    _paint(ops, canvas)
+    return Image.fromarray(canvas)
+
+
+# rasterize_layer_numpy() that also returns the (height, width) map of the
+# primitive drawn last on every pixel, -1 where there is none
+def rasterize_layer_ids(ops, width, height):
+    canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    top = np.full((height, width), -1, dtype=np.int64)
+    _paint(ops, canvas, top)
+    return Image.fromarray(canvas), top
+
+
+# Available layer rasterizers; RENDER_BACKEND selects the default one. PIL is
+# the faster one for cultures, NumPy for populations of thousands of cells.
+RENDER_BACKENDS = {"pil": rasterize_layer_pil, "numpy": rasterize_layer_numpy}
+RENDER_BACKEND_LABELS = {"pil": "PIL ImageDraw", "numpy": "NumPy (large populations)"}
+RENDER_BACKEND = os.environ.get("RENDER_BACKEND", "pil")
+
+
+def _draw_static_layer(scene, layer, backend, width, height):
+    with instrumentation.stage(layer):
+        ops = layer_ops(scene, layer, 0.0, width, height)
+    return rasterize_layer(layer, ops, backend, width, height)
+
+
+# Pulse-independent layers, rasterized on first use and kept on the scene.
+# The background entry is the canvas color with the static layers below the
+# first beating layer merged into it; those are not kept on their own.
+def _static_layer(scene, layer, backend, width, height):
+    def make():
+        if layer != "background":
+            return _draw_static_layer(scene, layer, backend, width, height)
+        image = Image.new('RGBA', (width, height), BACKGROUND_COLOR)
+        for below in LAYERS[:LAYERS.index("bodies")]:
+            image = Image.alpha_composite(
+                image, _draw_static_layer(scene, below, backend, width, height))
+        return image
+
+    return _scene_cached(scene, (layer, backend, width, height), make)
+
+
+# Size-dependent data cached on a scene under (name, variant, width, height),
+# up to SCENE_CACHE_MB per scene. The entries of the output sizes added first
+# are dropped first, so a large export or a deep zoom does not pin its layers
+# in memory; the size being drawn keeps its entries whatever they take.
+SCENE_CACHE_MB = float(os.environ.get("SCENE_CACHE_MB", 24))
+
+
+def _cached_nbytes(value):
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_cached_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_cached_nbytes(v) for v in value)
+    return 0
+
+
+def _scene_cached(scene, key, make):
+    value = scene.layer_cache.get(key)
+    if value is None:
+        value = make()
+        entries = list(scene.layer_cache.items())
+        total = _cached_nbytes(value) + sum(_cached_nbytes(v) for _, v in entries)
+        for size in dict.fromkeys(k[2:] for k, _ in entries):
+            if total <= SCENE_CACHE_MB * 1024 * 1024:
+                break
+            if size == key[2:]:
+                continue
+            for stale, v in entries:
+                if stale[2:] == size and scene.layer_cache.pop(stale, None) is not None:
+                    total -= _cached_nbytes(v)
+        scene.layer_cache[key] = value
+    return value
+
+
+# Draw a scene at the given pulse value (0 = relaxed, 1 = fully contracted),
+# or one value per cell, as a width x height image. Large scenes are drawn
+# tile by tile.
+def render_scene(scene, pulse=0.0, backend=RENDER_BACKEND, width=SCENE_WIDTH, height=SCENE_HEIGHT):
+    if len(scene.body_xy) > TILED_MIN_BODIES:
+        return render_scene_tiled(scene, pulse, backend, width, height)
+    first_beating = LAYERS.index("bodies")
+    frame = _static_layer(scene, "background", backend, width, height)
+    for layer in LAYERS[first_beating:]:
+        if layer in STATIC_LAYERS:
+            image = _static_layer(scene, layer, backend, width, height)
+        else:
+            with instrumentation.stage(layer):
+                ops = layer_ops(scene, layer, pulse, width, height)
+            image = rasterize_layer(layer, ops, backend, width, height)
+        with instrumentation.stage("composite"):
+            frame = Image.alpha_composite(frame, image)
+    return frame.convert('RGB')
+
+
+# --- Instance masks -----------------------------------------------------------
+#
+# Frames used as training data for cell segmentation come with label maps of
+# the cells they show. The NumPy rasterizer works out the primitive on top of
+# every pixel anyway, so the masks are taken from the pass that draws the
+# frame rather than from a second rendering.
+
+# Cell label of every pixel of an id map of bodies (or of primitives attached
+# to bodies, through `body`): the cell index + 1, 0 where there is none
+def _cell_labels(top, cell):
+    return np.where(top >= 0, cell[top] + 1, 0).astype(np.uint32)
+
+
+# Draw a scene like render_scene() with the NumPy rasterizer, together with its
+# instance masks, as (image, cells, nuclei). `cells` labels each pixel with the
+# cell it shows: the cell whose nucleus or, outside nuclei, whose body was drawn
+# last there. Membrane breaks, marks in the background color, are holes in the
+# bodies below them. `nuclei` labels the pixels of nuclei the same way.
+def render_scene_masks(scene, pulse=0.0, width=SCENE_WIDTH, height=SCENE_HEIGHT):
+    frame = _static_layer(scene, "background", "numpy", width, height)
+    tops = {}
+    for layer in LAYERS[LAYERS.index("bodies"):]:
+        if layer in STATIC_LAYERS:
+            image = _static_layer(scene, layer, "numpy", width, height)
+        else:
+            with instrumentation.stage(layer):
+                ops = layer_ops(scene, layer, pulse, width, height)
+                image, tops[layer] = rasterize_layer_ids(ops, width, height)
+            instrumentation.count_primitives(layer, sum(len(op[2]) for op in ops))
+        with instrumentation.stage("composite"):
+            frame = Image.alpha_composite(frame, image)
+    with instrumentation.stage("masks"):
+        nuclei = _cell_labels(tops["nuclei"], scene.body_cell[scene.nucleus_body])
+        bodies = _cell_labels(tops["bodies"], scene.body_cell)
+        # Marks come after the lines in the sarcomeres layer
+        mark = tops["sarcomeres"] - len(scene.line_color)
+        holes = np.flatnonzero(np.all(scene.mark_color == BACKGROUND_COLOR, axis=1))
+        bodies[np.isin(mark, holes)] = 0
+        cells = np.where(nuclei > 0, nuclei, bodies)
+    return frame.convert('RGB'), cells, nuclei
+
+
+# --- Tiled rendering --------------------------------------------------------
+#
+# Every primitive is binned once per output size into the square tiles its
+# bounding box can overlap at any pulse, and each tile rasterizes only its own
+# primitives. The cost of a frame then grows with the number of primitives
+# instead of primitives x image area, and primitives outside the image are
+# never drawn. Tile origins are whole pixels, so a tiled frame is identical to
+# one drawn in a single pass.
+
+TILE_SIZE = 256
+# Scenes with more bodies than this are rendered tile by tile
+TILED_MIN_BODIES = 1000
+
+
+def _op_bounds(op):
+    # Pixel bounding box (x0, y0, x1, y1) of every primitive of a drawing op
+    x, y = op[1][:, 0::2], op[1][:, 1::2]
+    pad = 0 if op[0] == "ellipse" else op[3] / 2 + 1
+    return np.stack([x.min(axis=1) - pad, y.min(axis=1) - pad,
+                     x.max(axis=1) + pad, y.max(axis=1) + pad], axis=1)
+
+
+def _bin_primitives(bounds, tile_size, tiles_x, tiles_y):
+    # CSR index of the tiles: the primitives overlapping tile t are
+    # prims[offsets[t]:offsets[t + 1]], in drawing order
+    t = np.floor(bounds / tile_size).astype(np.int64)
+    visible = (t[:, 2] >= 0) & (t[:, 0] < tiles_x) & (t[:, 3] >= 0) & (t[:, 1] < tiles_y)
+    tx0, tx1 = np.clip(t[:, 0], 0, tiles_x - 1), np.clip(t[:, 2], 0, tiles_x - 1)
+    ty0, ty1 = np.clip(t[:, 1], 0, tiles_y - 1), np.clip(t[:, 3], 0, tiles_y - 1)
+    nx = tx1 - tx0 + 1
+    prim, k = _expand_groups(np.where(visible, nx * (ty1 - ty0 + 1), 0))
+    tile = (ty0[prim] + k // nx[prim]) * tiles_x + tx0[prim] + k % nx[prim]
+    order = np.argsort(tile, kind="stable")
+    offsets = np.zeros(tiles_x * tiles_y + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tile, minlength=tiles_x * tiles_y), out=offsets[1:])
+    return offsets, prim[order]
+
+
+# Layer ops for drawing tile by tile. Polylines are split into their segments,
+# so a tile only draws the segments that overlap it: PIL draws the parts of a
+# polyline outside the tile at negative coordinates, which can touch its edge.
+def _tiled_layer_ops(scene, layer, pulse, width, height):
+    ops = []
+    for op in layer_ops(scene, layer, pulse, width, height):
+        if op[0] == "line" and op[1].shape[1] > 4:
+            segments, owner = _polyline_segments(op[1])
+            op = ("line", segments, op[2][owner], op[3][owner])
+        ops.append(op)
+    return ops
+
+
+# Tile bins of every layer's ops for one output size. Coordinates are linear
+# in the pulse, so the bounds at pulse 0 and 1 cover every pulse in between.
+def _tile_index(scene, width, height, tile_size):
+    def make():
+        tiles_x, tiles_y = -(-width // tile_size), -(-height // tile_size)
+        index = {}
+        for layer in LAYERS:
+            relaxed = _tiled_layer_ops(scene, layer, 0.0, width, height)
+            contracted = _tiled_layer_ops(scene, layer, 1.0, width, height)
+            index[layer] = []
+            for op0, op1 in zip(relaxed, contracted):
+                b0, b1 = _op_bounds(op0), _op_bounds(op1)
+                bounds = np.hstack([np.minimum(b0[:, :2], b1[:, :2]), np.maximum(b0[:, 2:], b1[:, 2:])])
+                index[layer].append(_bin_primitives(bounds, tile_size, tiles_x, tiles_y))
+        return index
+
+    return _scene_cached(scene, ("tiles", tile_size, width, height),
+                         instrumentation.timed("tile_index")(make))
+
+
+def _tile_op(op, ids, x0, y0):
+    # The primitives `ids` of a drawing op, moved into a tile at (x0, y0).
+    # Both rasterizers only look at whole pixels, but PIL truncates negative
+    # coordinates toward zero, so they are floored before the move.
+    coords = np.floor(op[1][ids]) - np.tile([x0, y0], op[1].shape[1] // 2)
+    return (op[0], coords) + tuple(a[ids] for a in op[2:])
+
+
+# Rasterize the ops of a tile at (x0, y0). PIL draws wide lines as polygons
+# and rounds their negative corners differently from positive ones, so the
+# layer is drawn on a canvas extended left and up far enough that the
+# primitives reaching into the tile keep the non-negative coordinates they
+# have in the whole image, and cropped back to the tile.
+def _rasterize_tile_layer(layer, ops, backend, x0, y0, tile_w, tile_h):
+    bounds = np.concatenate([_op_bounds(op) for op in ops])
+    left = int(min(x0, max(0, np.ceil(-bounds[:, 0].min()))))
+    top = int(min(y0, max(0, np.ceil(-bounds[:, 1].min()))))
+    if left or top:
+        ops = [(op[0], op[1] + np.tile([left, top], op[1].shape[1] // 2)) + op[2:] for op in ops]
+    image = rasterize_layer(layer, ops, backend, tile_w + left, tile_h + top)
+    if left or top:
+        image = image.crop((left, top, left + tile_w, top + tile_h))
+    return image
+
+
+# RGB pixels of tile (tx, ty) of a width x height image, from the layer ops of
+# the whole image and its tile index
+def _render_tile(ops, index, backend, width, height, tile_size, tx, ty):
+    t = ty * -(-width // tile_size) + tx
+    x0, y0 = tx * tile_size, ty * tile_size
+    tile_w, tile_h = min(tile_size, width - x0), min(tile_size, height - y0)
+    tile = Image.new('RGBA', (tile_w, tile_h), BACKGROUND_COLOR)
+    for layer in LAYERS:
+        tile_ops = [_tile_op(op, prims[offsets[t]:offsets[t + 1]], x0, y0)
+                    for op, (offsets, prims) in zip(ops[layer], index[layer])
+                    if offsets[t + 1] > offsets[t]]
+        if tile_ops:
+            image = _rasterize_tile_layer(layer, tile_ops, backend, x0, y0, tile_w, tile_h)
+            with instrumentation.stage("composite"):
+                tile = Image.alpha_composite(tile, image)
+    # The background is opaque, so dropping alpha is the same as convert('RGB')
+    return np.asarray(tile)[:, :, :3]
+
+
+def render_scene_tiled(scene, pulse=0.0, backend=RENDER_BACKEND, width=SCENE_WIDTH,
+                       height=SCENE_HEIGHT, tile_size=TILE_SIZE):
+    index = _tile_index(scene, width, height, tile_size)
+    ops = {}
+    for layer in LAYERS:
+        with instrumentation.stage(layer):
+            ops[layer] = _tiled_layer_ops(scene, layer, pulse, width, height)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    for ty in range(-(-height // tile_size)):
+        for tx in range(-(-width // tile_size)):
+            tile = _render_tile(ops, index, backend, width, height, tile_size, tx, ty)
+            y0, x0 = ty * tile_size, tx * tile_size
+            frame[y0:y0 + tile.shape[0], x0:x0 + tile.shape[1]] = tile
+    return Image.fromarray(frame)
+
+
+# --- Zoomed views -----------------------------------------------------------
+#
+# A view shows a width x height window of the scene rendered `zoom` times
+# larger, centered on a point given as fractions of the scene's width and
+# height. Only the tiles of the zoomed image that intersect the window are
+# rendered. Tiles can be kept in a cache shared between frames, so panning
+# and replaying the pulse cycle only render tiles that were not seen before.
+
+ZOOM_LEVELS = (1, 2, 4, 8, 16, 32)
+
+
+# Size of the zoomed image and the window's top-left corner in it. The window
+# is kept inside the image.
+def view_window(width, height, zoom=1.0, center=(0.5, 0.5)):
+    level_w, level_h = int(round(width * zoom)), int(round(height * zoom))
+    x0 = int(round(min(max(center[0] * level_w - width / 2, 0), level_w - width)))
+    y0 = int(round(min(max(center[1] * level_h - height / 2, 0), level_h - height)))
+    return level_w, level_h, x0, y0
+
+
+# Draw the view of a scene at the given zoom and center. `tiles` is an
+# optional cache with get_or_render(key, render); its keys are `tile_key`
+# followed by the zoomed image size and the tile position, so `tile_key` must
+# identify the scene, pulse and backend.
+def render_view(scene, pulse=0.0, backend=RENDER_BACKEND, width=SCENE_WIDTH, height=SCENE_HEIGHT,
+                zoom=1.0, center=(0.5, 0.5), tiles=None, tile_key=(), tile_size=TILE_SIZE):
+    level_w, level_h, x0, y0 = view_window(width, height, zoom, center)
+    # Layer ops and the tile index are only needed if some tile is not cached
+    prepared = []
+
+    def render(tx, ty):
+        if not prepared:
+            ops = {}
+            for layer in LAYERS:
+                with instrumentation.stage(layer):
+                    ops[layer] = _tiled_layer_ops(scene, layer, pulse, level_w, level_h)
+            prepared.append(ops)
+            prepared.append(_tile_index(scene, level_w, level_h, tile_size))
+        ops, index = prepared
+        return _render_tile(ops, index, backend, level_w, level_h, tile_size, tx, ty)
+
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    for ty in range(y0 // tile_size, (y0 + height - 1) // tile_size + 1):
+        for tx in range(x0 // tile_size, (x0 + width - 1) // tile_size + 1):
+            if tiles is None:
+                tile = render(tx, ty)
+            else:
+                key = tile_key + (level_w, level_h, tile_size, tx, ty)
+                tile = tiles.get_or_render(key, lambda: render(tx, ty))
+            # Copy the part of the tile inside the window
+            tile_x, tile_y = tx * tile_size, ty * tile_size
+            left, top = max(x0, tile_x), max(y0, tile_y)
+            right = min(x0 + width, tile_x + tile.shape[1])
+            bottom = min(y0 + height, tile_y + tile.shape[0])
+            frame[top - y0:bottom - y0, left - x0:right - x0] = \
+                tile[top - tile_y:bottom - tile_y, left - tile_x:right - tile_x]
+    return Image.fromarray(frame)
+
+
+# Pulse frames played for every day; the static view shows the middle one
+PULSE_FRAMES = 10
+STATIC_PULSE_INDEX = PULSE_FRAMES // 2
+
+
+# Frame codecs: PIL format and MIME type. "Raw" keeps the RGB array and skips
+# our encoder; st.image still has to encode it before sending it to the browser.
+FRAME_CODECS = {
+    "PNG": ("PNG", "image/png"),
+    "JPEG": ("JPEG", "image/jpeg"),
+    "WebP": ("WEBP", "image/webp"),
+    "Raw": (None, None),
+}
+# Default setting per codec: PNG compress_level (0-9), JPEG/WebP quality (1-100)
+FRAME_CODEC_DEFAULTS = {"PNG": 6, "JPEG": 90, "WebP": 80, "Raw": None}
+FRAME_CODEC = os.environ.get("FRAME_CODEC", "PNG")
+
+
+@instrumentation.timed("encode")
+def encode_frame(image, codec=FRAME_CODEC, setting=None):
+    pil_format = FRAME_CODECS[codec][0]
+    if pil_format is None:
+        return np.asarray(image)
+    if setting is None:
+        setting = FRAME_CODEC_DEFAULTS[codec]
+    buf = io.BytesIO()
+    if codec == "PNG":
+        image.save(buf, format="PNG", compress_level=setting)
+    else:
+        image.save(buf, format=pil_format, quality=setting)
+    return buf.getvalue()
+
+
+# Animated export formats: PIL format name (None for video), file extension, MIME type
+EXPORT_FORMATS = {
+    "WebP": ("WEBP", "webp", "image/webp"),
+    "APNG": ("PNG", "png", "image/apng"),
+    "GIF": ("GIF", "gif", "image/gif"),
+    "MP4": (None, "mp4", "video/mp4"),
+}
+
+
+# Encode PIL frames as one animation; `durations` are per-frame display times in ms
+def encode_animation(frames, durations, export_format):
+    pil_format = EXPORT_FORMATS[export_format][0]
+    if pil_format is None:
+        return _encode_mp4(frames, durations)
+
+    options = {"lossless": True} if pil_format == "WEBP" else {}
+    buf = io.BytesIO()
+    frames[0].save(buf, format=pil_format, save_all=True, append_images=frames[1:],
+                   duration=[int(round(ms)) for ms in durations], loop=0, **options)
+    return buf.getvalue()
+
+
+def _encode_mp4(frames, durations):
+    # Only needed for video export
+    import cv2
+
+    # Constant frame rate at the shortest duration; longer frames are repeated
+    frame_ms = min(durations)
+    width, height = frames[0].size
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "animation.mp4")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 1000.0 / frame_ms,
+                                 (width, height))
+        try:
+            for frame, ms in zip(frames, durations):
+                bgr = np.asarray(frame)[:, :, ::-1]
+                for _ in range(max(1, int(round(ms / frame_ms)))):
+                    writer.write(bgr)
+        finally:
+            writer.release()
+        with open(path, "rb") as f:
+            return f.read()
@@ -0,0 +1,107 @@
+"""Uniform grid index over 2-D points for neighbour queries.
+
+Points are binned into square grid cells and sorted by cell, so the points of
+any cell are one contiguous slice. A query only looks at the 3 x 3 block of
+cells around it, which finds every point within one cell size of the query
+without comparing it against the whole set. For points spread evenly the
+cost grows linearly with their number.
+"""
+
+import numpy as np
+
+
+class GridIndex:
+    def __init__(self, points, cell_size):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+        self.origin = self.points.min(axis=0) if len(self.points) else np.zeros(2)
+        cells = self._cells(self.points)
+        self.shape = cells.max(axis=0) + 1 if len(cells) else np.ones(2, dtype=int)
+        keys = self._keys(cells)
+        # Point ids sorted by cell, and the sorted cell keys to search them by
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def _cells(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(int)
+
+    def _keys(self, cells):
+        return cells[:, 1] * self.shape[0] + cells[:, 0]
+
+    # For every query point, the nearest indexed point no farther than the cell
+    # size, as (index, distance); index -1 and distance inf where there is none
+    def nearest(self, queries):
+        queries = np.asarray(queries, dtype=float).reshape(-1, 2)
+        best = np.full(len(queries), -1)
+        best_d2 = np.full(len(queries), np.inf)
+        cells = self._cells(queries)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                neighbour = cells + [dx, dy]
+                inside = np.all((neighbour >= 0) & (neighbour < self.shape), axis=1)
+                keys = self._keys(neighbour[inside])
+                lo = np.searchsorted(self.keys, keys, "left")
+                hi = np.searchsorted(self.keys, keys, "right")
+                q = np.flatnonzero(inside)
+                # One point of each query's cell per pass, dropping the queries
+                # whose cell has no points left
+                while True:
+                    more = lo < hi
+                    q, lo, hi = q[more], lo[more], hi[more]
+                    if not len(q):
+                        break
+                    point = self.order[lo]
+                    d = self.points[point] - queries[q]
+                    d2 = d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]
+                    closer = d2 < best_d2[q]
+                    best[q[closer]] = point[closer]
+                    best_d2[q[closer]] = d2[closer]
+                    lo = lo + 1
+        too_far = best_d2 > self.cell_size ** 2
+        best[too_far] = -1
+        best_d2[too_far] = np.inf
+        return best, np.sqrt(best_d2)
+
+    # Every indexed point no farther than the cell size from each query point,
+    # as (query, index, distance) arrays ordered by distance
+    def neighbours(self, queries):
+        queries = np.asarray(queries, dtype=float).reshape(-1, 2)
+        found, points = [], []
+        cells = self._cells(queries)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                neighbour = cells + [dx, dy]
+                inside = np.all((neighbour >= 0) & (neighbour < self.shape), axis=1)
+                keys = self._keys(neighbour[inside])
+                lo = np.searchsorted(self.keys, keys, "left")
+                count = np.searchsorted(self.keys, keys, "right") - lo
+                pos = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+                found.append(np.repeat(np.flatnonzero(inside), count))
+                points.append(self.order[np.repeat(lo, count) + pos])
+        q, i = np.concatenate(found), np.concatenate(points)
+        d = np.linalg.norm(self.points[i] - queries[q], axis=1)
+        keep = np.flatnonzero(d <= self.cell_size)
+        order = keep[np.argsort(d[keep], kind="stable")]
+        return q[order], i[order], d[order]
+
+    # Every pair of indexed points no farther apart than the cell size, as
+    # (i, j, distance) arrays with i < j, ordered by i and then j
+    def pairs(self):
+        first, second = [], []
+        cells = self._cells(self.points)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                neighbour = cells + [dx, dy]
+                inside = np.all((neighbour >= 0) & (neighbour < self.shape), axis=1)
+                keys = self._keys(neighbour[inside])
+                lo = np.searchsorted(self.keys, keys, "left")
+                count = np.searchsorted(self.keys, keys, "right") - lo
+                # Every point of the neighbouring cell, for every point
+                pos = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+                first.append(np.repeat(np.flatnonzero(inside), count))
+                second.append(self.order[np.repeat(lo, count) + pos])
+        i, j = np.concatenate(first), np.concatenate(second)
+        d = np.linalg.norm(self.points[i] - self.points[j], axis=1)
+        keep = (i < j) & (d <= self.cell_size)
+        order = np.lexsort((j[keep], i[keep]))
+        return i[keep][order], j[keep][order], d[keep][order]
@@ -0,0 +1,227 @@
+"""Synthetic training data for cell segmentation: frames with instance masks.
+
+Every sample is one frame of the animation, a pulse frame of a day or of its
+morph into the next day, for one seed. It comes with two label maps drawn in
+the same pass as the frame (renderer.render_scene_masks): the cell every
+pixel shows and the nucleus it shows, as the cell's index + 1 and 0 for the
+background. Samples are rendered in a pool of worker processes, which write
+them out themselves, and only a few batches are in flight at a time, so a run
+of any length needs the memory of a few frames.
+
+The output is split into shards of SHARD_SIZE samples:
+
+    OUT/manifest.json                  settings of the run and its shards
+    OUT/shard-00000/manifest.json      labels of every sample of the shard
+    OUT/shard-00000/00000000.npz       image, cells and nuclei arrays (--format npz)
+    OUT/shard-00000/00000000.png       frame                           (--format png)
+    OUT/shard-00000/00000000_cells.png label maps as RGB, id = R + 256 G + 65536 B
+    OUT/shard-00000/00000000_nuclei.png
+
+A shard's manifest is written once all its samples are, so a run that was
+stopped is resumed by running the same command again: finished shards are
+kept and the others are rendered again.
+
+    python synthetic.py out --seeds 100 --morph
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+from batch_render import RENDER_WORKERS, get_executor, job_scene, sequence_jobs
+from beating import frame_pulse
+from cell_data import cell_data
+from frame_store import render_version
+from renderer import SCENE_HEIGHT, SCENE_WIDTH, render_scene_masks
+from timeline import morph_time, next_day
+
+# Samples per shard
+SHARD_SIZE = 256
+# Samples a worker renders in one go; consecutive samples share their scene
+BATCH_SAMPLES = 10
+# Batches handed to the pool ahead of the oldest one not written yet, per worker
+BATCHES_IN_FLIGHT = 2
+SAMPLE_FORMATS = ("npz", "png")
+MANIFEST = "manifest.json"
+
+
+# Frames of the run, seed by seed: every pulse frame of each day, followed by
+# its morph into the next day with `morph`
+def sample_jobs(days, seeds, size=(SCENE_WIDTH, SCENE_HEIGHT), cells=None, morph=False):
+    for seed in seeds:
+        yield from sequence_jobs(days, seed, "numpy", "Raw", None, size, cells, morph)
+
+
+def shard_name(shard):
+    return f"shard-{shard:05d}"
+
+
+# Label maps as RGB, for formats without 32-bit grayscale
+def _rgb_ids(labels):
+    return np.stack([labels & 0xFF, labels >> 8 & 0xFF, labels >> 16 & 0xFF],
+                    axis=-1).astype(np.uint8)
+
+
+def _write_files(path, sample_format, image, cells, nuclei):
+    if sample_format == "npz":
+        np.savez_compressed(path + ".npz", image=np.asarray(image), cells=cells, nuclei=nuclei)
+        return [path + ".npz"]
+    files = [path + ".png", path + "_cells.png", path + "_nuclei.png"]
+    image.save(files[0])
+    Image.fromarray(_rgb_ids(cells)).save(files[1])
+    Image.fromarray(_rgb_ids(nuclei)).save(files[2])
+    return files
+
+
+# Render one sample with its masks and write it into the shard directory;
+# returns its labels
+def write_sample(shard, sample_format, index, job):
+    scene = job_scene(job)
+    image, cells, nuclei = render_scene_masks(scene, frame_pulse(scene, job.pulse_index),
+                                              *job.size)
+    os.makedirs(shard, exist_ok=True)
+    files = _write_files(os.path.join(shard, f"{index:08d}"), sample_format, image, cells, nuclei)
+    labels = {"index": index, "files": [os.path.relpath(f, shard) for f in files],
+              "day": job.day, "pulse": job.pulse_index, "seed": job.seed,
+              "instances": int(np.count_nonzero(np.bincount(cells.ravel())[1:])),
+              "nuclei": int(np.count_nonzero(np.bincount(nuclei.ravel())[1:]))}
+    if job.morph is not None:
+        labels.update(next_day=next_day(job.day), morph=job.morph,
+                      progress=morph_time(job.morph))
+    return labels
+
+
+def write_samples(sample_format, batch):
+    return [write_sample(shard, sample_format, index, job) for shard, index, job in batch]
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Write the (shard directory, index, job) samples and yield their labels in
+# order, as they are written. With more than one worker they are rendered in
+# the pool, at most BATCHES_IN_FLIGHT batches per worker ahead of the oldest
+# one still running.
+def generate_samples(sample_format, samples, workers=RENDER_WORKERS):
+    batches = _batches(samples, BATCH_SAMPLES)
+    if workers <= 1:
+        for batch in batches:
+            yield from write_samples(sample_format, batch)
+        return
+    executor = get_executor(workers)
+    pending = deque()
+    for batch in batches:
+        pending.append(executor.submit(write_samples, sample_format, batch))
+        if len(pending) >= workers * BATCHES_IN_FLIGHT:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _finished_shards(out):
+    return {int(name.split("-")[1]) for name in os.listdir(out)
+            if name.startswith("shard-") and os.path.exists(os.path.join(out, name, MANIFEST))}
+
+
+# Write the samples of the given days and seeds below `out`, skipping the
+# shards an earlier run with the same settings finished. Returns the number
+# of samples written.
+def generate_dataset(out, days, seeds, size=(SCENE_WIDTH, SCENE_HEIGHT), cells=None,
+                     morph=False, sample_format="npz", shard_size=SHARD_SIZE,
+                     workers=RENDER_WORKERS, progress=None):
+    days, seeds = sorted(days), list(seeds)
+    per_seed = len(sequence_jobs(days, 0, "numpy", "Raw", None, size, cells, morph))
+    total = per_seed * len(seeds)
+    settings = {"days": days, "seeds": seeds, "size": list(size), "cells": cells, "morph": morph,
+                "format": sample_format, "shard_size": shard_size,
+                "render_version": render_version()}
+    os.makedirs(out, exist_ok=True)
+    manifest_path = os.path.join(out, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)["settings"]
+        if previous != settings:
+            raise ValueError(f"{out} holds samples written with other settings: {previous}")
+    finished = _finished_shards(out)
+    shards = -(-total // shard_size)
+
+    def manifest():
+        return {"settings": settings, "samples": total,
+                "shards": [shard_name(s) for s in sorted(finished)]}
+
+    _write_json(manifest_path, manifest())
+    samples = ((os.path.join(out, shard_name(index // shard_size)), index, job)
+               for index, job in enumerate(sample_jobs(days, seeds, size, cells, morph))
+               if index // shard_size not in finished)
+    written, shard_labels = 0, []
+    for labels in generate_samples(sample_format, samples, workers):
+        written += 1
+        shard_labels.append(labels)
+        shard = labels["index"] // shard_size
+        if len(shard_labels) == min(shard_size, total - shard * shard_size):
+            _write_json(os.path.join(out, shard_name(shard), MANIFEST),
+                        {"shard": shard, "samples": shard_labels})
+            finished.add(shard)
+            _write_json(manifest_path, manifest())
+            shard_labels = []
+            if progress:
+                progress(shard, len(finished), shards, written)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out", help="output directory; an existing run there is resumed")
+    parser.add_argument("--days", type=int, nargs="+", default=sorted(cell_data))
+    parser.add_argument("--seeds", type=int, default=10, help="number of seeds")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--size", default=f"{SCENE_WIDTH}x{SCENE_HEIGHT}", help="WIDTHxHEIGHT")
+    parser.add_argument("--cells", type=int, help="population size instead of the day's culture")
+    parser.add_argument("--morph", action="store_true", help="include the morphs between days")
+    parser.add_argument("--format", choices=SAMPLE_FORMATS, default="npz")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="samples per shard")
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS)
+    args = parser.parse_args(argv)
+
+    unknown = sorted(set(args.days) - set(cell_data))
+    if unknown:
+        parser.error(f"unknown days {unknown}")
+    size = tuple(int(v) for v in args.size.split("x"))
+    start = time.perf_counter()
+
+    def progress(shard, finished, shards, written):
+        elapsed = time.perf_counter() - start
+        print(f"{shard_name(shard)} done, {finished}/{shards} shards, "
+              f"{written / elapsed:.1f} samples/s", flush=True)
+
+    try:
+        written = generate_dataset(args.out, args.days,
+                                   range(args.first_seed, args.first_seed + args.seeds), size,
+                                   args.cells, args.morph, args.format, args.shard_size,
+                                   args.workers, progress)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{written} samples written in {time.perf_counter() - start:.1f} s to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import numpy as np
+
+from beating import (
+    BURN_IN_BEATS,
+    FREQUENCY_SPREAD,
+    coupling_strength,
+    order_parameter,
+    simulate_phases,
+)
+from cell_data import cell_data
+from renderer import STREAM_BEATING, scene_rng
+
+CELLS = 30
+SEEDS = 10
+
+
+# Order parameter R at a sync level, averaged over one beat and several seeds
+def mean_synchrony(sync_level):
+    values = []
+    for seed in range(SEEDS):
+        rng = scene_rng(seed, 0, STREAM_BEATING)
+        omega = 2 * np.pi * (1 + FREQUENCY_SPREAD * rng.standard_normal(CELLS))
+        theta = rng.random(CELLS) * 2 * np.pi
+        phases = simulate_phases(theta, omega, coupling_strength(sync_level),
+                                 BURN_IN_BEATS + np.arange(10) / 10)
+        values += [abs(order_parameter(p)) for p in phases]
+    return np.mean(values)
+
+
+def test_synchrony_increases_with_sync_level():
+    levels = sorted({day["sync_level"] for day in cell_data.values()})
+    synchrony = [mean_synchrony(level) for level in levels]
+    assert all(b - a > 0.05 for a, b in zip(synchrony, synchrony[1:])), synchrony
+    assert synchrony[0] < 0.5 < synchrony[-1]
@@ -0,0 +1,47 @@
+import asyncio
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+
+from frame_cache import FrameCache
+from frame_server import FrameService, make_app
+from frame_store import open_store
+from renderer import MAX_SEED
+
+
+async def _fetch_all(root, queries):
+    sock, port = bind_unused_port()
+    service = FrameService(open_store(root, overflow=FrameCache(1 << 24)), workers=1)
+    server = HTTPServer(make_app(service))
+    server.add_sockets([sock])
+    client = AsyncHTTPClient()
+    codes = []
+    try:
+        for query in queries:
+            try:
+                response = await client.fetch(f"http://127.0.0.1:{port}{query}")
+                codes.append(response.code)
+            except HTTPClientError as e:
+                codes.append(e.code)
+    finally:
+        server.stop()
+    return service, codes
+
+
+def test_seed_bounds(tmp_path):
+    _, codes = asyncio.run(_fetch_all(tmp_path, [
+        "/frame?day=1&size=400x300&seed=-1",
+        f"/frame?day=1&size=400x300&seed={MAX_SEED}",
+        f"/frame?day=1&size=400x300&seed={MAX_SEED - 1}",
+    ]))
+    assert codes == [400, 400, 200]
+
+
+def test_other_seeds_stay_out_of_the_store(tmp_path):
+    service, codes = asyncio.run(_fetch_all(tmp_path, [
+        f"/frame?day=1&size=400x300&seed={seed}" for seed in (0, 1, 2, 3)]))
+    assert codes == [200] * 4
+    stats = service.cache.stats()
+    assert stats["stored_frames"] == 1
+    assert len(service.cache.overflow) == 3
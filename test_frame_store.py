@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+
+import numpy as np
+
+from batch_render import frame_job
+from frame_cache import FrameCache
+from frame_store import INDEX_FILE, RECORD, is_default_frame, open_store
+
+WRITES = 40
+
+
+def _frame(pulse, size=100):
+    return bytes([pulse % 256]) * size
+
+
+def _write_frames(root, first):
+    store = open_store(root)
+    for pulse in range(first, first + WRITES):
+        store.put(frame_job(1, pulse), _frame(pulse))
+
+
+def test_frames_are_shared_between_stores(tmp_path):
+    job = frame_job(2, 3)
+    open_store(tmp_path).put(job, b"frame")
+    store = open_store(tmp_path)
+    assert bytes(store.get(job)) == b"frame"
+    assert store.get(frame_job(2, 4)) is None
+
+
+def test_torn_index_record_is_dropped(tmp_path):
+    store = open_store(tmp_path)
+    store.put(frame_job(1, 0), _frame(0))
+    # A writer that died halfway through its index record
+    with open(os.path.join(store.path, INDEX_FILE), "ab") as f:
+        f.write(RECORD.pack(b"x" * 16, 0, 1)[:RECORD.size // 2])
+
+    reader = open_store(tmp_path)
+    assert bytes(reader.get(frame_job(1, 0))) == _frame(0)
+    reader.put(frame_job(1, 1), _frame(1))
+    assert os.path.getsize(os.path.join(store.path, INDEX_FILE)) == 2 * RECORD.size
+    assert bytes(open_store(tmp_path).get(frame_job(1, 1))) == _frame(1)
+    assert bytes(store.get(frame_job(1, 1))) == _frame(1)
+
+
+def test_concurrent_writers(tmp_path):
+    ctx = multiprocessing.get_context("spawn")
+    writers = [ctx.Process(target=_write_frames, args=(str(tmp_path), first))
+               for first in (0, WRITES // 2)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+        assert writer.exitcode == 0
+
+    store = open_store(tmp_path)
+    assert store.stats()["stored_frames"] == WRITES * 3 // 2
+    for pulse in range(WRITES * 3 // 2):
+        assert bytes(store.get(frame_job(1, pulse))) == _frame(pulse)
+
+
+def test_full_store_overflows_to_memory(tmp_path):
+    overflow = FrameCache(1 << 20)
+    store = open_store(tmp_path, max_mb=250 / (1024 * 1024), overflow=overflow)
+    for pulse in range(4):
+        store.put(frame_job(1, pulse), _frame(pulse))
+    assert store.stats()["stored_frames"] == 2
+    assert len(overflow) == 2
+    for pulse in range(4):
+        assert bytes(store.get(frame_job(1, pulse))) == _frame(pulse)
+
+
+def test_only_default_frames_are_stored(tmp_path):
+    overflow = FrameCache(1 << 20)
+    store = open_store(tmp_path, overflow=overflow)
+    default, other_seed = frame_job(1, 0), frame_job(1, 0, seed=12345)
+    assert is_default_frame(default) and not is_default_frame(other_seed)
+    store.put(default, b"default")
+    store.put(other_seed, b"other")
+    assert store.stats()["stored_frames"] == 1
+    assert bytes(store.get(other_seed)) == b"other"
+    assert open_store(tmp_path).get(other_seed) is None
+
+
+def test_raw_frames_round_trip(tmp_path):
+    job = frame_job(1, 0, size=(40, 30), codec="Raw")
+    frame = np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8)
+    open_store(tmp_path, keep=None).put(job, frame)
+    data = open_store(tmp_path).get(job)
+    assert isinstance(data, np.ndarray) and not data.flags.writeable
+    np.testing.assert_array_equal(data, frame)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from population import build_scene_for
+from renderer import STREAM_TIMELINE, scene_rng
+from timeline import MAX_CHILDREN, Transition
+
+
+def _transition(day, seed, cells=None):
+    return Transition(build_scene_for(day, seed, cells), build_scene_for(day + 1, seed, cells),
+                      scene_rng(seed, day, STREAM_TIMELINE))
+
+
+# No cell splits into more cells than a division makes
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("day", range(1, 8))
+def test_children_per_parent(day, seed):
+    tr = _transition(day, seed)
+    children = np.bincount(tr.parent[tr.parent >= 0])
+    assert children.max(initial=0) <= MAX_CHILDREN
+
+
+# Cells keep their place between days, so most of a tissue is carried over
+# rather than dying and being born again
+@pytest.mark.parametrize("day", [3, 5])
+def test_cells_carry_over(day):
+    tr = _transition(day, 0, 5000)
+    assert (tr.successor >= 0).mean() > 0.9
+    assert (tr.parent >= 0).mean() > 0.9
@@ -0,0 +1,264 @@
+"""Morphing of the culture from one day into the next.
+
+Every day is still sampled on its own, so a day's frames depend only on its
+(seed, day) key. Cell and cluster positions come from streams shared by all
+days, so a cell sits in the same place on consecutive days and the days
+differ in what the cells look like and how many there are. The timeline
+works between two consecutive day scenes: each cell of the next day is
+matched to the nearest cell of the current one with room for it, at most
+MAX_CHILDREN per cell, and the difference becomes one event per cell, spread
+out over the transition:
+
+  carried over  a cell moves and reshapes into its successor, e.g. elongates
+  divided       a second cell matched to the same parent splits off from it
+  fragmented    a successor made of several bodies (day 7) breaks out of it
+  died          a cell without a successor shrinks and fades away
+  born          a cell with no parent nearby grows where it will be
+
+Background debris fades out and in particle by particle, so it accumulates or
+clears following the days' debris levels, and the fibers cross-fade.
+
+The diff is worked out once per pair of days. An intermediate frame starts
+from both days' arrays as they are and only interpolates the cells whose
+event is in progress; cells before or after their event are taken over as
+they are, and those that are gone are left out.
+"""
+
+import threading
+
+import numpy as np
+
+import instrumentation
+from beating import scene_phases
+from cell_data import cell_data
+from renderer import FIBER_COLOR, SCENE_WIDTH, STREAM_TIMELINE, CellScene, scene_rng
+from spatial import GridIndex
+
+# Intermediate frames played between the last pulse of a day and the next day
+MORPH_FRAMES = 10
+# Part of the transition that one cell's event takes
+EVENT_DURATION = 0.4
+# Farthest a cell travels to its successor: this many design-frame pixels, or
+# this many mean cell spacings in dense populations. Cells farther apart die
+# and are born in place instead.
+MAX_TRAVEL = 120 / SCENE_WIDTH
+TRAVEL_SPACINGS = 2
+# Most cells of the next day one cell turns into: itself and a daughter when
+# it divides. A fragmenting cell stays one cell whose successor has several
+# bodies, so division is the only event with more than one child.
+MAX_CHILDREN = 2
+
+
+# Day the given day morphs into, None for the last one
+def next_day(day_num):
+    return day_num + 1 if day_num + 1 in cell_data else None
+
+
+# Transition time of an intermediate frame, strictly between 0 (the day) and 1 (the next day)
+def morph_time(step):
+    return (step + 1) / (MORPH_FRAMES + 1)
+
+
+# Eased progress of events starting at `start` at transition time t, from 0 to 1
+def _progress(t, start):
+    u = np.clip((t - start) / EVENT_DURATION, 0.0, 1.0)
+    return u * u * (3 - 2 * u)
+
+
+def _cell_centers(scene):
+    center = scene.body_xy + scene.body_size / 2
+    count = np.bincount(scene.body_cell, minlength=scene.cell_count)
+    return np.column_stack([np.bincount(scene.body_cell, center[:, k], scene.cell_count)
+                            for k in (0, 1)]) / np.maximum(count, 1)[:, None]
+
+
+# First body of every cell, the one its children start from
+def _main_bodies(scene):
+    main = np.zeros(scene.cell_count, dtype=int)
+    cells, first = np.unique(scene.body_cell, return_index=True)
+    main[cells] = first
+    return main
+
+
+# Parent of every cell of the next day among the cells of this day no farther
+# than `travel`, as (parent, distance); parent -1 and distance inf where there
+# is none. Cells are first matched one to one and the rest then become second
+# children, up to MAX_CHILDREN per parent. In every round each unmatched cell
+# proposes to its nearest parent with room left, which takes its closest
+# proposals up to its room.
+def _match(centers0, centers1, travel):
+    candidates = GridIndex(centers0, travel).neighbours(centers1)
+    parent = np.full(len(centers1), -1)
+    distance = np.full(len(centers1), np.inf)
+    children = np.zeros(len(centers0), dtype=int)
+    for limit in range(1, MAX_CHILDREN + 1):
+        child, cand, dist = candidates
+        while True:
+            open_ = (parent[child] < 0) & (children[cand] < limit)
+            child, cand, dist = child[open_], cand[open_], dist[open_]
+            if not len(child):
+                break
+            # Candidates are ordered by distance, so a cell's first is its nearest
+            _, first = np.unique(child, return_index=True)
+            first.sort()
+            c, p, d = child[first], cand[first], dist[first]
+            by_parent = np.argsort(p, kind="stable")
+            c, p, d = c[by_parent], p[by_parent], d[by_parent]
+            group = np.flatnonzero(np.r_[True, p[1:] != p[:-1]])
+            rank = np.arange(len(p)) - np.repeat(group, np.diff(np.r_[group, len(p)]))
+            taken = rank < limit - children[p]
+            parent[c[taken]], distance[c[taken]] = p[taken], d[taken]
+            children += np.bincount(p[taken], minlength=len(children))
+    return parent, distance
+
+
+def _fade(colors, weight):
+    colors = colors.copy()
+    colors[:, 3] = colors[:, 3] * weight
+    return colors
+
+
+# Diff between the scenes of two consecutive days, and the scenes in between
+class Transition:
+    def __init__(self, source, target, rng):
+        n0, n1 = source.cell_count, target.cell_count
+        centers0, centers1 = _cell_centers(source), _cell_centers(target)
+        travel = min(MAX_TRAVEL, TRAVEL_SPACINGS * np.sqrt(target.aspect / max(n1, 1)))
+        parent, distance = _match(centers0, centers1, travel)
+        # Each cell's successor is the nearest cell matched to it
+        nearest_last = np.argsort(-distance, kind="stable")
+        nearest_last = nearest_last[parent[nearest_last] >= 0]
+        successor = np.full(n0, -1)
+        successor[parent[nearest_last]] = nearest_last
+        self.parent, self.successor = parent, successor
+
+        # Event start times; children start together with their parent
+        start0 = rng.random(n0) * (1 - EVENT_DURATION)
+        start1 = np.where(parent >= 0, start0[parent], rng.random(n1) * (1 - EVENT_DURATION))
+        self.cell_start = np.concatenate([start0, start1])
+
+        # Where every body is at the other end of the transition: bodies of
+        # this day end on their cell's successor or collapse onto their
+        # center; bodies of the next day start from their cell's parent or
+        # grow from their center
+        main0, main1 = _main_bodies(source), _main_bodies(target)
+        succ = successor[source.body_cell]
+        end = main1[succ]
+        par = parent[target.body_cell]
+        start = main0[par]
+        center0 = source.body_xy + source.body_size / 2
+        center1 = target.body_xy + target.body_size / 2
+        self.other_xy = np.concatenate([
+            np.where(succ[:, None] >= 0, target.body_xy[end], center0),
+            np.where(par[:, None] >= 0, source.body_xy[start], center1)])
+        self.other_size = np.concatenate([
+            np.where(succ[:, None] >= 0, target.body_size[end], 0.0),
+            np.where(par[:, None] >= 0, source.body_size[start], 0.0)])
+
+        # Which elements belong to the next day and fade in rather than out
+        nb0 = len(source.body_xy)
+        self.body_in = np.arange(nb0 + len(target.body_xy)) >= nb0
+        nd0 = len(source.debris_box)
+        self.debris_in = np.arange(nd0 + len(target.debris_box)) >= nd0
+        self.debris_start = rng.random(len(self.debris_in)) * (1 - EVENT_DURATION)
+        self.fiber_in = np.arange(len(source.fibers) + len(target.fibers)) >= len(source.fibers)
+
+        # Both days in one scene; the cells of the next day are numbered after
+        # those of this day and keep their own beating phases
+        def both(name, offset=0):
+            return np.concatenate([getattr(source, name), getattr(target, name) + offset])
+
+        self.scene = CellScene(
+            day=source.day, seed=source.seed, aspect=source.aspect,
+            clusters=both("clusters"), fibers=both("fibers"),
+            body_xy=both("body_xy"), body_size=both("body_size"), body_gain=both("body_gain"),
+            body_color=both("body_color"), body_cell=both("body_cell", n0),
+            line_body=both("line_body", nb0), line_geom=both("line_geom"),
+            line_color=both("line_color"), line_width=both("line_width"),
+            mark_body=both("mark_body", nb0), mark_geom=both("mark_geom"),
+            mark_color=both("mark_color"),
+            nucleus_body=both("nucleus_body", nb0), nucleus_geom=both("nucleus_geom"),
+            nucleus_color=both("nucleus_color"),
+            debris_box=both("debris_box"), debris_color=both("debris_color"),
+            fiber_color=np.tile(np.array(FIBER_COLOR, dtype=np.uint8), (len(self.fiber_in), 1)),
+            phases=np.hstack([scene_phases(source), scene_phases(target)]),
+        )
+
+    # Opacity of elements from the progress of their event: elements of this
+    # day fade out and those of the next day fade in
+    @staticmethod
+    def _weight(progress, fade_in):
+        return np.where(fade_in, progress, 1.0 - progress)
+
+    # Scene at transition time t in [0, 1]
+    @instrumentation.timed("morph")
+    def scene_at(self, t):
+        sc = self.scene
+        weight = self._weight(_progress(t, self.cell_start)[sc.body_cell], self.body_in)
+        keep = weight > 0
+        # Only bodies in the middle of their event move; the rest are as sampled
+        moving = np.flatnonzero(keep & (weight < 1))
+        w = weight[moving, None]
+        body_xy, body_size = sc.body_xy.copy(), sc.body_size.copy()
+        body_xy[moving] += (self.other_xy[moving] - body_xy[moving]) * (1 - w)
+        body_size[moving] += (self.other_size[moving] - body_size[moving]) * (1 - w)
+        body_color = sc.body_color.copy()
+        body_color[moving] = _fade(body_color[moving], weight[moving])
+
+        # Attached elements fade with their body and are renumbered to the kept bodies
+        renumber = np.cumsum(keep) - 1
+
+        def attached(body, geom, color):
+            kept = keep[body]
+            return (renumber[body[kept]], geom[kept], _fade(color[kept], weight[body[kept]]))
+
+        line_keep = keep[sc.line_body]
+        line_body, line_geom, line_color = attached(sc.line_body, sc.line_geom, sc.line_color)
+        mark_body, mark_geom, mark_color = attached(sc.mark_body, sc.mark_geom, sc.mark_color)
+        nucleus_body, nucleus_geom, nucleus_color = attached(sc.nucleus_body, sc.nucleus_geom,
+                                                             sc.nucleus_color)
+
+        debris_weight = self._weight(_progress(t, self.debris_start), self.debris_in)
+        debris_keep = debris_weight > 0
+        # Fibers cross-fade halfway through
+        fiber_weight = self._weight(_progress(t, (1 - EVENT_DURATION) / 2), self.fiber_in)
+
+        return CellScene(
+            day=sc.day, seed=sc.seed, aspect=sc.aspect, clusters=sc.clusters,
+            fibers=sc.fibers, fiber_color=_fade(sc.fiber_color, fiber_weight),
+            body_xy=body_xy[keep], body_size=body_size[keep], body_gain=sc.body_gain[keep],
+            body_color=body_color[keep], body_cell=sc.body_cell[keep],
+            line_body=line_body, line_geom=line_geom, line_color=line_color,
+            line_width=sc.line_width[line_keep],
+            mark_body=mark_body, mark_geom=mark_geom, mark_color=mark_color,
+            nucleus_body=nucleus_body, nucleus_geom=nucleus_geom, nucleus_color=nucleus_color,
+            debris_box=sc.debris_box[debris_keep],
+            debris_color=_fade(sc.debris_color[debris_keep], debris_weight[debris_keep]),
+            phases=sc.phases,
+        )
+
+
+# Transitions between the consecutive days of one culture or population,
+# worked out on first use from the scenes `scene_for(day)` returns
+class Timeline:
+    def __init__(self, scene_for, seed):
+        self.scene_for = scene_for
+        self.seed = seed
+        self._transitions = {}
+        self._lock = threading.Lock()
+
+    def transition(self, day_num):
+        with self._lock:
+            transition = self._transitions.get(day_num)
+        if transition is None:
+            source, target = self.scene_for(day_num), self.scene_for(next_day(day_num))
+            with instrumentation.stage("morph_diff"):
+                transition = Transition(source, target, scene_rng(self.seed, day_num,
+                                                                  STREAM_TIMELINE))
+            with self._lock:
+                transition = self._transitions.setdefault(day_num, transition)
+        return transition
+
+    # Scene of intermediate frame `step` of the morph from the given day into the next
+    def frame_scene(self, day_num, step):
+        return self.transition(day_num).scene_at(morph_time(step))